@@ -1,13 +1,20 @@
 import os
 import random
+import hashlib
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Iterator, List, Optional
 import streamlit as st # Import streamlit for caching
 from llama_index.core import Settings
 from llama_index.llms.gemini import Gemini
-from llama_index.embeddings.google_genai import GoogleGenAIEmbedding
-from llama_index.core.agent import AgentRunner, FunctionCallingAgentWorker
+from llama_index.core.agent import AgentRunner
 from llama_index.core.tools import FunctionTool
-from llama_index.core.llms import LLM
+from llama_index.core.llms import LLM, ChatMessage, MessageRole
 from tools import get_all_tools
+from parallel_tools import DEFAULT_TOOL_TIMEOUT_SECONDS, ParallelFunctionCallingAgentWorker, execute_tool_calls, parse_tool_timeouts
+from embedding_cache import CachedEmbedding, DEFAULT_MEMORY_CACHE_SIZE, DEFAULT_DISK_MAX_ENTRIES, DEFAULT_DISK_TTL_SECONDS
+from embedding_backends import DEFAULT_EMBED_MODEL, create_embed_model
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -19,6 +26,24 @@ PROJECT_ROOT = os.path.abspath(os.path.dirname(__file__))
 
 # --- Constants ---
 SUGGESTED_PROMPT_COUNT = 4
+# Suggested prompts depend only on the last few messages; results are cached per context
+SUGGESTED_PROMPT_CONTEXT_MESSAGES = 4
+SUGGESTED_PROMPT_CACHE_SIZE = int(os.getenv("SUGGESTED_PROMPT_CACHE_SIZE", "256"))
+# Pre-generated greetings kept ready for new discussions; refilled in the background below the low-water mark
+GREETING_POOL_SIZE = int(os.getenv("GREETING_POOL_SIZE", "8"))
+GREETING_POOL_LOW_WATER = int(os.getenv("GREETING_POOL_LOW_WATER", "3"))
+# Query embeddings are cached in memory and in an SQLite file shared by all workers
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(PROJECT_ROOT, ".rag_cache", "query_embeddings.sqlite3"))
+EMBEDDING_CACHE_MEMORY_SIZE = int(os.getenv("EMBEDDING_CACHE_MEMORY_SIZE", DEFAULT_MEMORY_CACHE_SIZE))
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", DEFAULT_DISK_MAX_ENTRIES))
+EMBEDDING_CACHE_TTL_SECONDS = float(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", DEFAULT_DISK_TTL_SECONDS))
+# Query embedding model (see embedding_backends.py), e.g. "local:BAAI/bge-small-en-v1.5" for a CPU model.
+# The RAG tool switches to the model the index records if the two differ.
+EMBED_MODEL = os.getenv("EMBED_MODEL", DEFAULT_EMBED_MODEL)
+# The function calls of one agent step run concurrently (see parallel_tools.py), each limited to
+# TOOL_TIMEOUT_SECONDS unless TOOL_TIMEOUTS overrides it per tool, e.g. "duckduckgo=20,code_interpreter=180"
+TOOL_TIMEOUT_SECONDS = float(os.getenv("TOOL_TIMEOUT_SECONDS", DEFAULT_TOOL_TIMEOUT_SECONDS))
+TOOL_TIMEOUTS = parse_tool_timeouts(os.getenv("TOOL_TIMEOUTS", ""))
 
 # --- Global Settings ---
 @st.cache_resource # Cache the LLM and embedding model initialization
@@ -28,8 +53,14 @@ def initialize_settings():
     if not google_api_key:
         raise ValueError("GOOGLE_API_KEY not found in environment variables.")
 
-    # Use Google Generative AI Embeddings
-    Settings.embed_model = GoogleGenAIEmbedding(model_name="models/text-embedding-004", api_key=google_api_key)
+    # Google Generative AI Embeddings by default, with repeated queries served from the embedding cache
+    Settings.embed_model = CachedEmbedding(
+        create_embed_model(EMBED_MODEL, api_key=google_api_key),
+        cache_path=EMBEDDING_CACHE_PATH,
+        memory_size=EMBEDDING_CACHE_MEMORY_SIZE,
+        disk_max_entries=EMBEDDING_CACHE_MAX_ENTRIES,
+        disk_ttl_seconds=EMBEDDING_CACHE_TTL_SECONDS,
+    )
     # Use a potentially more stable model name and set a default temperature
     # The temperature can be overridden later based on the slider
     Settings.llm = Gemini(model_name="models/gemini-2.5-flash-preview-05-20",
@@ -39,9 +70,12 @@ def initialize_settings():
     print("LLM settings initialized.")
 
 # --- Greeting Generation ---
+# Shown whenever no generated greeting is available (and while one is being generated)
+DEFAULT_GREETING = "Hello! I'm ESI, your AI assistant for dissertation support. How can I help you today?"
+
 def generate_llm_greeting() -> str:
     """Generates a dynamic greeting message using the configured LLM."""
-    static_fallback = "Hello! I'm ESI, your AI assistant for dissertation support. How can I help you today?"
+    static_fallback = DEFAULT_GREETING
     try:
         # Settings.llm is guaranteed to be initialized by app.py before this function is called
         llm = Settings.llm
@@ -71,6 +105,67 @@ def generate_llm_greeting() -> str:
         return static_fallback
 
 
+class GreetingPool:
+    """
+    Process-wide stock of pre-generated greetings, so handing one out costs no LLM call. Taking a
+    greeting that leaves fewer than low_water starts a background refill up to size; an empty pool
+    hands out DEFAULT_GREETING.
+    """
+
+    def __init__(self, generate=None, size: int = GREETING_POOL_SIZE, low_water: int = GREETING_POOL_LOW_WATER):
+        self._generate = generate or generate_llm_greeting
+        self.size = max(1, size)
+        self.low_water = min(low_water, self.size)
+        self._greetings = deque()
+        self._lock = threading.Lock()
+        self._refilling = False
+
+    def __len__(self) -> int:
+        return len(self._greetings)
+
+    def take(self) -> str:
+        with self._lock:
+            greeting = self._greetings.popleft() if self._greetings else None
+        self.refill_if_low()
+        if greeting is None:
+            print("Greeting pool is empty; using the default greeting.")
+            return DEFAULT_GREETING
+        return greeting
+
+    def refill_if_low(self):
+        """Starts a background refill when the pool is below its low-water mark (or empty)."""
+        with self._lock:
+            if self._refilling or (self._greetings and len(self._greetings) >= self.low_water):
+                return
+            self._refilling = True
+        threading.Thread(target=self._refill, name="greeting-pool-refill", daemon=True).start()
+
+    def _refill(self):
+        try:
+            # Bounded, so an LLM that keeps repeating itself cannot keep the thread busy
+            for _ in range(2 * self.size):
+                if len(self._greetings) >= self.size:
+                    break
+                greeting = self._generate()
+                if greeting == DEFAULT_GREETING:
+                    break # The LLM is failing; retry on the next take()
+                with self._lock:
+                    if greeting not in self._greetings:
+                        self._greetings.append(greeting)
+            print(f"Greeting pool refilled to {len(self._greetings)} greetings.")
+        finally:
+            with self._lock:
+                self._refilling = False
+
+
+@st.cache_resource # One pool per process, shared by all sessions
+def get_greeting_pool() -> GreetingPool:
+    """Creates the greeting pool and starts filling it."""
+    pool = GreetingPool()
+    pool.refill_if_low()
+    return pool
+
+
 # --- Unified Agent Definition ---
 @st.cache_resource # Cache the agent creation
 def create_unified_agent():
@@ -93,16 +188,104 @@ def create_unified_agent():
         print(f"CRITICAL: Error loading esi_agent_instruction.md: {e}. Unified agent will use a fallback prompt.")
         system_prompt = "You are a helpful AI assistant. Use the provided tools to answer the user's questions."
 
-    agent_worker = FunctionCallingAgentWorker.from_tools(
+    agent_worker = ParallelFunctionCallingAgentWorker.from_tools(
         tools=all_tools,
         llm=Settings.llm,
         system_prompt=system_prompt,
-        verbose=True  # Set to False for production
+        verbose=True,  # Set to False for production
+        tool_timeout=TOOL_TIMEOUT_SECONDS,
+        tool_timeouts=TOOL_TIMEOUTS,
     )
     unified_agent_runner = AgentRunner(agent_worker)
     print(f"Unified agent created with {len(all_tools)} tools.")
     return unified_agent_runner
 
+# --- Streaming Agent Turns ---
+@dataclass
+class AgentStreamEvent:
+    """
+    One event of a streamed agent turn:
+      token        text: the next piece of the answer
+      tool_call    tool_name: a tool is about to run
+      tool_result  tool_name, is_error: the tool finished
+      done         text: the complete answer
+    """
+    kind: str
+    text: str = ""
+    tool_name: Optional[str] = None
+    is_error: bool = False
+
+
+def stream_agent_response(agent_runner: AgentRunner, query: str, chat_history: List[ChatMessage]) -> Iterator[AgentStreamEvent]:
+    """
+    Runs one agent turn like agent_runner.chat(query, chat_history=...), but streams it: every LLM
+    call is made with stream_chat_with_tools, so answer tokens are yielded as they arrive, and tool
+    calls are reported before and after they run. FunctionCallingAgentWorker has no streaming mode
+    of its own, so this drives the same loop (system prompt, tools, max_function_calls, parallel
+    tool execution with the worker's timeouts) directly.
+    Falls back to a single non-streamed chat() if the LLM cannot stream before the first token.
+    """
+    worker = agent_runner.agent_worker
+    llm = worker._llm
+    tools = worker.get_tools(query)
+    tools_by_name = {tool.metadata.name: tool for tool in tools}
+    messages = list(worker.prefix_messages) + list(chat_history)
+    if not chat_history or chat_history[-1].role != MessageRole.USER or chat_history[-1].content != query:
+        messages.append(ChatMessage(role=MessageRole.USER, content=query))
+
+    answer = ""
+    function_calls = 0
+    while True:
+        last_response = None
+        try:
+            for response in llm.stream_chat_with_tools(
+                tools, chat_history=messages, allow_parallel_tool_calls=worker.allow_parallel_tool_calls
+            ):
+                if response.delta:
+                    answer += response.delta
+                    yield AgentStreamEvent("token", text=response.delta)
+                last_response = response
+        except Exception as e:
+            if answer or function_calls:
+                raise
+            print(f"Streaming chat failed ({e}); falling back to a non-streamed agent turn.")
+            response_obj = agent_runner.chat(query, chat_history=chat_history)
+            answer = response_obj.response if hasattr(response_obj, 'response') else str(response_obj)
+            yield AgentStreamEvent("token", text=answer)
+            break
+        if last_response is None:
+            break
+
+        messages.append(last_response.message)
+        tool_calls = llm.get_tool_calls_from_response(last_response, error_on_no_tool_call=False)
+        if not tool_calls or function_calls >= worker._max_function_calls:
+            break
+
+        # All calls of the step run at once; results come back in call order
+        for tool_call in tool_calls:
+            yield AgentStreamEvent("tool_call", tool_name=tool_call.tool_name)
+        tool_outputs = execute_tool_calls(
+            tools, tool_calls,
+            getattr(worker, "tool_timeout", TOOL_TIMEOUT_SECONDS), getattr(worker, "tool_timeouts", TOOL_TIMEOUTS),
+            callback_manager=worker.callback_manager, verbose=worker._verbose,
+        )
+        for tool_call, tool_output in zip(tool_calls, tool_outputs):
+            function_calls += 1
+            yield AgentStreamEvent("tool_result", tool_name=tool_call.tool_name, is_error=tool_output.is_error)
+            messages.append(ChatMessage(
+                content=str(tool_output),
+                role=MessageRole.TOOL,
+                additional_kwargs={"name": tool_call.tool_name, "tool_call_id": tool_call.tool_id},
+            ))
+        first_tool = tools_by_name.get(tool_calls[0].tool_name)
+        if first_tool is not None and first_tool.metadata.return_direct:
+            answer += str(tool_outputs[0])
+            yield AgentStreamEvent("token", text=str(tool_outputs[0]))
+            break
+
+    yield AgentStreamEvent("done", text=answer)
+
+
 # --- Suggested Prompts ---
 DEFAULT_PROMPTS = [
     "Find recent papers on qualitative data analysis methods.",
@@ -111,6 +294,44 @@ DEFAULT_PROMPTS = [
     "Search for university policies on dissertation submission deadlines (uses RAG).",
 ]
 
+def suggested_prompt_context(chat_history) -> str:
+    """The part of the conversation suggested prompts are generated from: the last few messages."""
+    context_messages = chat_history[-SUGGESTED_PROMPT_CONTEXT_MESSAGES:]
+    return "\n".join([f"{m['role'].capitalize()}: {m['content']}" for m in context_messages])
+
+
+def suggested_prompt_context_key(chat_history) -> str:
+    return hashlib.sha256(suggested_prompt_context(chat_history).encode("utf-8")).hexdigest()
+
+
+_suggested_prompt_cache: "OrderedDict[str, list]" = OrderedDict()
+_suggested_prompt_cache_lock = threading.Lock()
+
+
+def get_cached_suggested_prompts(context_key: str):
+    """Prompts generated earlier (by any session) for the same context, or None."""
+    with _suggested_prompt_cache_lock:
+        prompts = _suggested_prompt_cache.get(context_key)
+        if prompts is not None:
+            _suggested_prompt_cache.move_to_end(context_key)
+        return prompts
+
+
+def generate_suggested_prompts_cached(chat_history):
+    """generate_suggested_prompts, remembering the result per context (fallback defaults are not cached)."""
+    context_key = suggested_prompt_context_key(chat_history)
+    prompts = get_cached_suggested_prompts(context_key)
+    if prompts is not None:
+        return prompts
+    prompts = generate_suggested_prompts(chat_history)
+    if prompts is not DEFAULT_PROMPTS:
+        with _suggested_prompt_cache_lock:
+            _suggested_prompt_cache[context_key] = prompts
+            while len(_suggested_prompt_cache) > SUGGESTED_PROMPT_CACHE_SIZE:
+                _suggested_prompt_cache.popitem(last=False)
+    return prompts
+
+
 def generate_suggested_prompts(chat_history):
     """
     Generates concise suggested prompts.
@@ -121,8 +342,7 @@ def generate_suggested_prompts(chat_history):
         llm = Settings.llm
 
         # Create context from the last few messages (e.g., last 4)
-        context_messages = chat_history[-4:] # Get last 4 messages
-        context_str = "\n".join([f"{m['role'].capitalize()}: {m['content']}" for m in context_messages])
+        context_str = suggested_prompt_context(chat_history)
 
         # Construct the prompt for the LLM
         prompt = f"""Given the following recent conversation context between a User and an AI Assistant (ESI) helping with university dissertations:
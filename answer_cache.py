@@ -0,0 +1,102 @@
+import os
+import time
+import sqlite3
+import threading
+from typing import List, Optional
+
+import numpy as np
+
+DEFAULT_SIMILARITY_THRESHOLD = 0.95
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 500
+SQLITE_TIMEOUT_SECONDS = 5.0
+
+
+class SemanticAnswerCache:
+    """
+    Cross-session cache of RAG tool outputs keyed by query embedding.
+    A lookup returns the stored output of the most similar cached query if its cosine similarity
+    reaches the threshold. Lookups and inserts only see the cache's own namespace (index revision +
+    response mode), so processes serving different revisions can share the file. Entries of every
+    namespace expire after ttl_seconds, and the least recently used are evicted beyond max_entries.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        namespace: str,
+        similarity_threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ):
+        self.path = path
+        self.namespace = namespace
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, namespace TEXT NOT NULL, query_text TEXT NOT NULL, "
+                "embedding BLOB NOT NULL, answer TEXT NOT NULL, created_at REAL NOT NULL, last_hit_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS answers_namespace ON answers (namespace)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=SQLITE_TIMEOUT_SECONDS)
+
+    def lookup(self, query_embedding: List[float]) -> Optional[str]:
+        """Returns the cached output for the closest query above the similarity threshold, if any."""
+        now = time.time()
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, embedding, answer FROM answers WHERE namespace = ? AND created_at >= ?",
+                (self.namespace, now - self.ttl_seconds),
+            ).fetchall()
+            if rows:
+                matrix = np.stack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+                query = np.asarray(query_embedding, dtype=np.float32)
+                norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query) or 1.0)
+                norms[norms == 0] = 1.0
+                similarities = (matrix @ query) / norms
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    conn.execute("UPDATE answers SET last_hit_at = ? WHERE id = ?", (now, rows[best][0]))
+                    with self._lock:
+                        self.hits += 1
+                    print(f"Semantic answer cache hit (similarity {similarities[best]:.3f}).")
+                    return rows[best][2]
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def store(self, query_text: str, query_embedding: List[float], answer: str) -> None:
+        """
+        Adds an entry, then drops expired entries and evicts the least recently used beyond max_entries.
+        Both apply to all namespaces, so entries of an old index revision age out instead of being purged.
+        """
+        now = time.time()
+        embedding = np.asarray(query_embedding, dtype=np.float32).tobytes()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO answers (namespace, query_text, embedding, answer, created_at, last_hit_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (self.namespace, query_text, embedding, answer, now, now),
+            )
+            conn.execute("DELETE FROM answers WHERE created_at < ?", (now - self.ttl_seconds,))
+            conn.execute(
+                "DELETE FROM answers WHERE id IN ("
+                "SELECT id FROM answers ORDER BY last_hit_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0}
@@ -1,12 +1,16 @@
 import streamlit as st
 import os
+import re
 import json
+import time
 import uuid # For generating unique user IDs
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Optional, Dict, List
 from llama_index.core.llms import ChatMessage, MessageRole
 import stui
 
-from agent import create_unified_agent, generate_suggested_prompts, initialize_settings as initialize_agent_settings, generate_llm_greeting
+from agent import create_unified_agent, generate_suggested_prompts_cached, get_cached_suggested_prompts, suggested_prompt_context_key, initialize_settings as initialize_agent_settings, stream_agent_response
+from agent import DEFAULT_PROMPTS, get_greeting_pool
 from dotenv import load_dotenv
 
 import user_data_manager # New import for user data persistence
@@ -48,6 +52,14 @@ if not cookies.ready():
 AGENT_SESSION_KEY = "esi_unified_agent" # Key for storing unified agent
 DOWNLOAD_MARKER = "---DOWNLOAD_FILE---" # Used by stui.py for display
 RAG_SOURCE_MARKER_PREFIX = "---RAG_SOURCE---" # Used by stui.py for display
+# Stream answers token by token into the chat (set STREAM_AGENT_RESPONSES=0 for the blocking spinner)
+STREAM_AGENT_RESPONSES = os.getenv("STREAM_AGENT_RESPONSES", "1").lower() not in ("0", "false", "no")
+# Suggested prompts are regenerated in the background after every reply and for new discussions; the page
+# keeps showing the current prompts and polls for the new ones every BACKGROUND_POLL_SECONDS
+BACKGROUND_POLL_SECONDS = float(os.getenv("BACKGROUND_POLL_SECONDS", "0.5"))
+BACKGROUND_WORKERS = 4
+# Marker lines are turned into source links / downloads once the answer is complete; hide them while streaming
+MARKER_LINE_PATTERN = re.compile(rf"^(?:{re.escape(RAG_SOURCE_MARKER_PREFIX)}|{re.escape(DOWNLOAD_MARKER)}).*$\n?", re.MULTILINE)
 
 
 # --- Session State Initialization ---
@@ -80,6 +92,9 @@ def init_session_state_for_app():
     if "do_regenerate" not in st.session_state:
         st.session_state.do_regenerate = False
 
+    if "stream_regeneration" not in st.session_state: # Regenerated answer to stream once the chat history is drawn
+        st.session_state.stream_regeneration = False
+
     if "should_generate_prompts" not in st.session_state: # New flag for controlled prompt generation
         st.session_state.should_generate_prompts = False
 
@@ -92,6 +107,66 @@ def init_session_state_for_app():
     if "discussion_setup_done" not in st.session_state: # New flag for one-time discussion setup
         st.session_state.discussion_setup_done = False
 
+    if "suggested_prompts_task" not in st.session_state: # (future, discussion id, context key) of the pending prompt generation
+        st.session_state.suggested_prompts_task = None
+
+
+# --- Background Generation ---
+@st.cache_resource
+def get_background_executor() -> ThreadPoolExecutor:
+    """Thread pool shared by all sessions for LLM calls that must not block the page."""
+    return ThreadPoolExecutor(max_workers=BACKGROUND_WORKERS, thread_name_prefix="esi-background")
+
+
+def _collect_suggested_prompts() -> bool:
+    """
+    Applies the suggested prompts generated in the background once they are ready, unless the user has
+    since moved to another discussion or the conversation context has changed. Returns whether they were applied.
+    """
+    task = st.session_state.suggested_prompts_task
+    if task is None or not task[0].done():
+        return False
+    future, discussion_id, context_key = task
+    st.session_state.suggested_prompts_task = None
+    if discussion_id != st.session_state.current_discussion_id:
+        return False # The user has moved on to another discussion
+    if context_key != suggested_prompt_context_key(st.session_state.messages):
+        print("Discarding suggested prompts generated for an older conversation context.")
+        return False
+    try:
+        st.session_state.suggested_prompts = future.result()
+        return True
+    except Exception as e:
+        print(f"Background suggested prompt generation failed: {e}")
+        return False
+
+
+def _refresh_suggested_prompts():
+    """
+    Brings the suggested prompts up to date with the conversation: from the cache if this context
+    (the last few messages) has been seen before, else generated in the background. Called as soon
+    as a reply exists, so the prompts are usually ready by the time the page has redrawn.
+    """
+    context_key = suggested_prompt_context_key(st.session_state.messages)
+    cached_prompts = get_cached_suggested_prompts(context_key)
+    if cached_prompts is not None:
+        st.session_state.suggested_prompts = cached_prompts
+        st.session_state.suggested_prompts_task = None
+        return
+    pending = st.session_state.suggested_prompts_task
+    if pending is not None and pending[1] == st.session_state.current_discussion_id and pending[2] == context_key:
+        return # Already being generated for exactly this context
+    # Replaces any pending generation; its result would be discarded for the old context anyway
+    future = get_background_executor().submit(generate_suggested_prompts_cached, list(st.session_state.messages))
+    st.session_state.suggested_prompts_task = (future, st.session_state.current_discussion_id, context_key)
+
+
+@st.fragment(run_every=BACKGROUND_POLL_SECONDS)
+def _poll_suggested_prompts():
+    """Reruns the page once the suggested prompts have arrived; only rendered while they are pending."""
+    if _collect_suggested_prompts():
+        st.rerun()
+
 
 # --- Helper Function for History Formatting ---
 def format_chat_history(streamlit_messages: list[dict[str, Any]]) -> list[ChatMessage]:
@@ -107,6 +182,23 @@ def format_chat_history(streamlit_messages: list[dict[str, Any]]) -> list[ChatMe
 
 
 # --- Agent Interaction ---
+def _apply_llm_temperature(agent_runner):
+    """Sets the temperature slider value on the agent's LLM."""
+    current_temperature = st.session_state.get("llm_temperature", 0.7)
+
+    # Accessing the LLM instance within AgentRunner -> FunctionCallingAgentWorker -> LLM
+    agent_worker = getattr(agent_runner, 'agent_worker', None)
+    if agent_worker is not None and hasattr(agent_worker, '_llm'):
+        actual_llm_instance = agent_worker._llm
+        if hasattr(actual_llm_instance, 'temperature'):
+            actual_llm_instance.temperature = current_temperature
+            print(f"Set agent LLM temperature to: {current_temperature}")
+        else:
+            print(f"Warning: Agent LLM object of type {type(actual_llm_instance)} does not have a 'temperature' attribute.")
+    else:
+        print("Warning: Could not access LLM object within the agent to set temperature.")
+
+
 def get_agent_response(query: str, chat_history: list[ChatMessage]) -> str:
     """
     Get a response from the agent stored in the session state using the chat method,
@@ -119,18 +211,7 @@ def get_agent_response(query: str, chat_history: list[ChatMessage]) -> str:
     original_response_text: str
 
     try:
-        current_temperature = st.session_state.get("llm_temperature", 0.7)
-
-        # Accessing the LLM instance within AgentRunner -> FunctionCallingAgentWorker -> LLM
-        if hasattr(agent_runner, '_agent_worker') and hasattr(agent_runner._agent_worker, '_llm'):
-            actual_llm_instance = agent_runner._agent_worker._llm
-            if hasattr(actual_llm_instance, 'temperature'):
-                actual_llm_instance.temperature = current_temperature
-                print(f"Set agent LLM temperature to: {current_temperature}")
-            else:
-                print(f"Warning: Agent LLM object of type {type(actual_llm_instance)} does not have a 'temperature' attribute.")
-        else:
-            print("Warning: Could not access LLM object within the agent to set temperature.")
+        _apply_llm_temperature(agent_runner)
 
         with st.spinner("ESI is thinking..."): # Simplified spinner message
             response_obj = agent_runner.chat(query, chat_history=chat_history)
@@ -146,6 +227,48 @@ def get_agent_response(query: str, chat_history: list[ChatMessage]) -> str:
         return f"I apologize, but I encountered an error while processing your request with the main agent. Please try again. Technical details: {str(e)}"
 
 
+def stream_agent_response_to_chat(query: str, chat_history: list[ChatMessage]) -> str:
+    """
+    Like get_agent_response, but renders the answer into an assistant bubble token by token, with
+    tool calls shown in a status box above it as they happen. Returns the complete response text.
+    """
+    if AGENT_SESSION_KEY not in st.session_state or st.session_state[AGENT_SESSION_KEY] is None:
+        return "Error: Agent not initialized. Please refresh the page."
+
+    agent_runner = st.session_state[AGENT_SESSION_KEY]
+    response_text = ""
+    with st.chat_message("assistant"):
+        status = st.status("ESI is thinking...", expanded=False)
+        answer_placeholder = st.empty()
+        try:
+            _apply_llm_temperature(agent_runner)
+            turn_start = time.perf_counter()
+            first_token_at = None
+            for event in stream_agent_response(agent_runner, query, chat_history):
+                if event.kind == "token":
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter() - turn_start
+                        print(f"Time to first token: {first_token_at:.2f}s")
+                    response_text += event.text
+                    answer_placeholder.markdown(MARKER_LINE_PATTERN.sub("", response_text) + "▌")
+                elif event.kind == "tool_call":
+                    status.update(label=f"ESI is using {event.tool_name}...")
+                    status.write(f"Calling `{event.tool_name}`...")
+                elif event.kind == "tool_result":
+                    status.write(f"`{event.tool_name}` {'failed' if event.is_error else 'finished'}.")
+                elif event.kind == "done":
+                    response_text = event.text
+            answer_placeholder.markdown(MARKER_LINE_PATTERN.sub("", response_text))
+            status.update(label="ESI is done.", state="complete")
+            print(f"Unified agent streamed response in {time.perf_counter() - turn_start:.2f}s: \n{response_text[:500]}...")
+        except Exception as e:
+            print(f"Error streaming unified agent response: {e}")
+            status.update(label="Something went wrong.", state="error")
+            response_text = f"I apologize, but I encountered an error while processing your request with the main agent. Please try again. Technical details: {str(e)}"
+            answer_placeholder.markdown(response_text)
+    return response_text
+
+
 def handle_user_input(chat_input_value: str | None):
     """
     Process user input (either from chat box or suggested prompt)
@@ -179,12 +302,18 @@ def handle_user_input(chat_input_value: str | None):
             st.markdown(prompt_to_process)
 
         formatted_history = format_chat_history(st.session_state.messages)
-        response_text_string = get_agent_response(prompt_to_process, chat_history=formatted_history)
+        if STREAM_AGENT_RESPONSES:
+            response_text_string = stream_agent_response_to_chat(prompt_to_process, chat_history=formatted_history)
+        else:
+            response_text_string = get_agent_response(prompt_to_process, chat_history=formatted_history)
         st.session_state.messages.append({"role": "assistant", "content": response_text_string})
 
 
+        _refresh_suggested_prompts() # Speculatively, while the reply is saved and the page redraws
         _save_current_discussion()
-        st.session_state.should_generate_prompts = True # Set flag to generate new prompts
+        if STREAM_AGENT_RESPONSES:
+            # Redraw the streamed answer through display_chat, which adds its sources, downloads and regenerate button
+            st.rerun()
 
 # --- Discussion Management Functions ---
 def _create_new_discussion_session():
@@ -197,15 +326,10 @@ def _create_new_discussion_session():
     st.session_state.current_discussion_id = new_discussion_meta["id"]
     st.session_state.current_discussion_title = new_discussion_meta["title"] # Standardized name
     
-    # Initialize messages with a greeting
-    greeting_text = generate_llm_greeting() # Direct call to agent.py
-    st.session_state.messages = [{"role": "assistant", "content": greeting_text}]
-
-    # Directly generate prompts:
-    print("Generating initial suggested prompts directly within _create_new_discussion_session...")
-    # Ensure generate_suggested_prompts is available/imported if not already.
-    # It is imported from agent.py at the top of app.py
-    st.session_state.suggested_prompts = generate_suggested_prompts(st.session_state.messages)
+    # The greeting comes from the pre-generated pool; the default prompts show until generated ones are ready
+    st.session_state.messages = [{"role": "assistant", "content": get_greeting_pool().take()}]
+    st.session_state.suggested_prompts = list(DEFAULT_PROMPTS)
+    _refresh_suggested_prompts()
     st.session_state.should_generate_prompts = False # Reset flag immediately
 
     st.session_state.editing_list_discussion_id = None # Exit any inline editing mode
@@ -223,12 +347,13 @@ def _load_discussion_session(discussion_id: str):
         st.session_state.current_discussion_title = discussion_data.get("title", "Untitled Discussion") # Standardized name
         st.session_state.messages = discussion_data.get("messages", [])
         
-        if not st.session_state.messages: # If loaded discussion is empty, add greeting
-             greeting_text = generate_llm_greeting() # Direct call to agent.py
-             st.session_state.messages = [{"role": "assistant", "content": greeting_text}]
-
-        
-        st.session_state.should_generate_prompts = True # Set flag to generate new prompts
+        if not st.session_state.messages: # If loaded discussion is empty, add a greeting from the pool
+            st.session_state.messages = [{"role": "assistant", "content": get_greeting_pool().take()}]
+            st.session_state.suggested_prompts = list(DEFAULT_PROMPTS)
+            _refresh_suggested_prompts()
+            st.session_state.should_generate_prompts = False
+        else:
+            st.session_state.should_generate_prompts = True # Set flag to generate new prompts
         st.session_state.editing_list_discussion_id = None # Exit any inline editing mode
         print(f"Loaded discussion: {st.session_state.current_discussion_title} ({st.session_state.current_discussion_id})")
     else:
@@ -355,11 +480,11 @@ def handle_regeneration_request():
     # Case 1: Regenerating the initial greeting
     if len(st.session_state.messages) == 1:
         print("Regenerating initial greeting...")
-        new_greeting_text = generate_llm_greeting() # Direct call to agent.py
+        new_greeting_text = get_greeting_pool().take()
         st.session_state.messages[0]['content'] = new_greeting_text
 
+        _refresh_suggested_prompts()
         _save_current_discussion() # Save the regenerated greeting
-        st.session_state.should_generate_prompts = True # Set flag to generate new prompts
         st.rerun()
         return
 
@@ -372,13 +497,39 @@ def handle_regeneration_request():
         return
 
     print("Regenerating last assistant response to user query...")
+    if STREAM_AGENT_RESPONSES:
+        # Streamed below the chat history like any other answer, see stream_regenerated_response
+        st.session_state.stream_regeneration = True
+        return
+
     prompt_to_regenerate = st.session_state.messages[-1]['content']
     formatted_history_for_regen = format_chat_history(st.session_state.messages)
 
     response_text_string = get_agent_response(prompt_to_regenerate, chat_history=formatted_history_for_regen)
+    _append_regenerated_response(response_text_string)
+
+
+def stream_regenerated_response():
+    """Streams the regenerated answer to the last user query into the chat, after the history is displayed."""
+    if not st.session_state.get("stream_regeneration", False):
+        return
+
+    st.session_state.stream_regeneration = False # Consume the flag
+
+    if not st.session_state.messages or st.session_state.messages[-1]['role'] != 'user':
+        return
+
+    prompt_to_regenerate = st.session_state.messages[-1]['content']
+    formatted_history_for_regen = format_chat_history(st.session_state.messages)
+
+    response_text_string = stream_agent_response_to_chat(prompt_to_regenerate, chat_history=formatted_history_for_regen)
+    _append_regenerated_response(response_text_string)
+
+
+def _append_regenerated_response(response_text_string: str):
     st.session_state.messages.append({"role": "assistant", "content": response_text_string})
+    _refresh_suggested_prompts()
     _save_current_discussion() # Save the regenerated response
-    st.session_state.should_generate_prompts = True # Set flag to generate new prompts
     st.rerun()
 
 
@@ -397,6 +548,7 @@ st.session_state._get_discussion_markdown = _get_discussion_markdown # Expose ne
 def main():
     """Main function to run the Streamlit app."""
     init_session_state_for_app() # Initializes 'user_id_initialized = False', 'discussion_setup_done = False'
+    get_greeting_pool() # The first run in this process starts filling the shared greeting pool
 
     # This check for cookies.ready() is from the original code and should be kept.
     # It uses st.stop() correctly for streamlit_cookies_manager.
@@ -483,17 +635,16 @@ def main():
         _create_new_discussion_session()
         # Removed st.rerun() here. The natural rerun will update the UI.
     if st.session_state.get("do_regenerate", False):
-        handle_regeneration_request() # This function itself calls st.rerun()
+        handle_regeneration_request() # This function itself calls st.rerun(), unless the new answer is streamed below
 
 
-    # Generate suggested prompts only if the flag is set AND (they are missing or need refresh)
+    # A loaded discussion gets prompts for its own context (cached, or generated in the background)
     if st.session_state.should_generate_prompts:
-        if not st.session_state.get("suggested_prompts"): # Check if list is empty or None
-            print("Generating suggested prompts using LLM (triggered by should_generate_prompts flag and no existing prompts)...")
-            st.session_state.suggested_prompts = generate_suggested_prompts(st.session_state.messages)
-        else:
-            print("Suggested prompts already exist, flag was true but skipping regeneration unless context change logic is added.")
-        st.session_state.should_generate_prompts = False # Reset the flag in either case
+        _refresh_suggested_prompts()
+        st.session_state.should_generate_prompts = False # Reset the flag
+
+    # Pick up suggested prompts generated in the background (greetings come from the pool in agent.py)
+    _collect_suggested_prompts()
 
     # Create the rest of the interface using stui (displays chat history, sidebar, etc.)
     # This needs a valid discussion (messages, title) to be set up.
@@ -508,6 +659,13 @@ def main():
 
         # Handle user input (either from chat box or a clicked suggested prompt button)
         handle_user_input(chat_input_value) # This function calls st.rerun() after processing
+
+        # A regenerated answer is streamed here, below the chat history, like a new one
+        stream_regenerated_response()
+
+        # Keep polling while suggested prompts are pending (including generations started by this run's buttons)
+        if st.session_state.suggested_prompts_task is not None:
+            _poll_suggested_prompts()
     elif not st.session_state.user_id_initialized:
         st.warning("User session not yet initialized. Please wait or refresh.")
     elif not st.session_state.discussion_setup_done:
@@ -0,0 +1,100 @@
+"""
+Recall@k and latency of the IVF approximate index against exact search.
+
+Uses the embeddings of a memory-mapped store (--store-dir, e.g. .rag_cache/snapshots/<rev>/vector_store_data/mmap_store)
+or a synthetic clustered corpus. Queries are stored rows with Gaussian noise added.
+
+    python benchmarks/bench_ann_recall.py --synthetic 50000 --nprobe 1 4 8 16 32
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from rag_store import EMBEDDINGS_FILE, top_k_rows
+from rag_ann import IVFIndex, build_ivf_index
+from bench_common import add_output_argument, write_report
+
+
+def synthetic_embeddings(node_count, dim, clusters=200, seed=0):
+    """Normalised Gaussian-mixture vectors, closer to real text embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, dim)).astype(np.float32)
+    matrix = centres[rng.integers(0, clusters, node_count)] + 0.5 * rng.normal(size=(node_count, dim)).astype(np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def make_queries(embeddings, count, noise=0.3, seed=1):
+    rng = np.random.default_rng(seed)
+    queries = np.asarray(embeddings[rng.integers(0, embeddings.shape[0], count)]) + noise * rng.normal(size=(count, embeddings.shape[1])).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def run_benchmark(embeddings, index_dir, queries, top_k, nprobes):
+    exact_results, exact_latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        exact_results.append(set(top_k_rows(embeddings @ query, top_k).tolist()))
+        exact_latencies.append(time.perf_counter() - start)
+
+    report = {
+        "node_count": int(embeddings.shape[0]),
+        "dim": int(embeddings.shape[1]),
+        "queries": len(queries),
+        "k": top_k,
+        "exact_mean_ms": 1000 * float(np.mean(exact_latencies)),
+        "ann": [],
+    }
+    for nprobe in nprobes:
+        index = IVFIndex(index_dir, nprobe=nprobe)
+        recalls, latencies = [], []
+        for query, exact in zip(queries, exact_results):
+            start = time.perf_counter()
+            approximate = {row for row, _ in index.search(embeddings, query, top_k)}
+            latencies.append(time.perf_counter() - start)
+            recalls.append(len(approximate & exact) / len(exact))
+        result = {
+            "nprobe": index.nprobe,
+            "nlist": index.meta["nlist"],
+            f"recall@{top_k}": float(np.mean(recalls)),
+            "mean_ms": 1000 * float(np.mean(latencies)),
+        }
+        report["ann"].append(result)
+        print(f"nprobe={index.nprobe:>4}: recall@{top_k}={result[f'recall@{top_k}']:.3f} mean={result['mean_ms']:.2f}ms (exact {report['exact_mean_ms']:.2f}ms)")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--store-dir", help="Memory-mapped store directory to benchmark")
+    source.add_argument("--synthetic", type=int, metavar="N", help="Generate N synthetic embeddings instead")
+    parser.add_argument("--dim", type=int, default=768, help="Dimension of synthetic embeddings")
+    parser.add_argument("--nlist", type=int, help="IVF lists (default: about 4 * sqrt(n))")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    add_output_argument(parser)
+    args = parser.parse_args()
+
+    if args.store_dir:
+        embeddings = np.load(os.path.join(args.store_dir, EMBEDDINGS_FILE), mmap_mode="r")
+    else:
+        embeddings = synthetic_embeddings(args.synthetic, args.dim)
+
+    with tempfile.TemporaryDirectory() as index_dir:
+        build_ivf_index(embeddings, index_dir, nlist=args.nlist, min_nodes=1)
+        report = run_benchmark(embeddings, index_dir, make_queries(embeddings, args.queries), args.k, args.nprobe)
+
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
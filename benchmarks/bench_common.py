@@ -0,0 +1,34 @@
+"""
+Helpers shared by the benchmark scripts: latency percentiles, peak memory and the JSON report.
+"""
+import sys
+import json
+import math
+import resource
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    ordered = sorted(values)
+    index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def add_output_argument(parser):
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+
+
+def write_report(report, output=None):
+    """Writes the JSON report to output, or prints it when no file was given."""
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
+        print(f"Report written to {output}")
+    else:
+        print(json.dumps(report, indent=4))
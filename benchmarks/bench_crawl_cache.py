@@ -0,0 +1,183 @@
+"""
+Cost of re-crawling an unchanged site with and without the conditional-fetch crawl cache
+(rag_crawl.ConditionalFetcher), against a local HTTP server, without network access.
+
+The server publishes --pages linked pages. A quarter of them send an ETag, a quarter Last-Modified,
+a quarter no validators at all (so only the body hash can tell they are unchanged), and the rest
+no validators and a nonce in every body, so revalidating them never works. The site is crawled
+four times through CrawlScheduler: cold, again unchanged, after --change pages were edited, and
+unchanged once more. "Rendering" (the headless browser in make_rag.py) is simulated by
+--render-delay; plain_gets counts the revalidation requests on top of the renders.
+
+    python benchmarks/bench_crawl_cache.py --pages 60 --change 3
+"""
+import os
+import re
+import sys
+import time
+import asyncio
+import hashlib
+import argparse
+import tempfile
+import threading
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from rag_crawl import AsyncFileWriter, ConditionalFetcher, CrawlCache, CrawledPage, CrawlScheduler
+from bench_common import add_output_argument, write_report
+
+
+class FixtureSite:
+    """Pages /page/0 .. /page/{n-1}; /page/0 links to all others. Versions bump when a page changes."""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.versions = [0] * pages
+        self.modified_at = [time.time() - 86400] * pages
+        self.requests = {"200": 0, "304": 0}
+        self.responses = [] # (page, status) of every request, in order
+        self.server = None
+
+    def html(self, page):
+        links = "".join(f'<a href="/page/{i}">Page {i}</a>' for i in range(1, self.pages)) if page == 0 else '<a href="/page/0">Home</a>'
+        nonce = f"<!-- nonce {time.time_ns()} -->" if page % 4 == 3 else ""
+        return (f"<html><body>{nonce}<nav>{links}</nav><h1>Page {page}</h1>"
+                f"<p>Guidance text for page {page}, revision {self.versions[page]}.</p></body></html>").encode("utf-8")
+
+    def change(self, page):
+        self.versions[page] += 1
+        self.modified_at[page] = time.time()
+
+    def serve(self):
+        """Starts the site on a free local port in a daemon thread; returns its base URL."""
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.handler())
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def shutdown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def handler(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                match = re.fullmatch(r"/page/(\d+)", self.path)
+                if not match or int(match.group(1)) >= site.pages:
+                    self.send_error(404)
+                    return
+                page = int(match.group(1))
+                body = site.html(page)
+                etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+                last_modified = formatdate(site.modified_at[page], usegmt=True)
+                validator = page % 4 # 0: ETag, 1: Last-Modified, 2: none, 3: none and a nonce in the body
+                if (validator == 0 and self.headers.get("If-None-Match") == etag) or (
+                    validator == 1 and self.headers.get("If-Modified-Since") == last_modified
+                ):
+                    site.requests["304"] += 1
+                    site.responses.append((page, 304))
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                site.requests["200"] += 1
+                site.responses.append((page, 200))
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                if validator == 0:
+                    self.send_header("ETag", etag)
+                elif validator == 1:
+                    self.send_header("Last-Modified", last_modified)
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+def url_filename(url):
+    return re.sub(r"[^a-zA-Z0-9_.-]", "_", url.split("://", 1)[-1]) + ".md"
+
+
+async def crawl_once(site, base_url, output_dir, cache_path, render_delay, use_cache):
+    rendered = 0
+    async with httpx.AsyncClient() as client:
+
+        async def render(url):
+            nonlocal rendered
+            rendered += 1
+            response = await client.get(url)
+            await asyncio.sleep(render_delay) # Stand-in for the headless browser
+            text = re.sub(r"<[^>]+>", " ", response.text)
+            links = re.findall(r'href="([^"]+)"', response.text)
+            return CrawledPage(url=str(response.url), success=response.status_code == 200, markdown=text, links=links,
+                               etag=response.headers.get("etag"), last_modified=response.headers.get("last-modified"))
+
+        fetcher = ConditionalFetcher(
+            render, CrawlCache(cache_path),
+            is_saved=lambda final_url: os.path.exists(os.path.join(output_dir, url_filename(final_url))),
+        ) if use_cache else None
+        writer = AsyncFileWriter(output_dir)
+        scheduler = CrawlScheduler(fetcher or render, max_depth=1, max_pages_per_seed=10_000, max_concurrency=8,
+                                   per_host_concurrency=8, per_host_delay=0.0)
+
+        def on_page(page, seed, depth):
+            if page.success and page.markdown:
+                writer.submit(url_filename(page.url), page.markdown, page.url)
+
+        start = time.perf_counter()
+        requests_before = sum(site.requests.values())
+        await scheduler.run([f"{base_url}/page/0"], on_page)
+        await writer.close()
+        elapsed = time.perf_counter() - start
+        if fetcher is not None:
+            await fetcher.close()
+    return {"seconds": elapsed, "rendered": rendered, "plain_gets": sum(site.requests.values()) - requests_before - rendered,
+            "files_written": writer.written,
+            "cache": dict(fetcher.stats) if fetcher is not None else None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=60)
+    parser.add_argument("--change", type=int, default=3, help="Pages edited before the third crawl")
+    parser.add_argument("--render-delay", type=float, default=0.1, help="Simulated seconds to render one page")
+    add_output_argument(parser)
+    args = parser.parse_args()
+
+    site = FixtureSite(args.pages)
+    base_url = site.serve()
+
+    report = {"pages": args.pages, "changed_before_third_crawl": args.change, "render_delay_s": args.render_delay}
+    with tempfile.TemporaryDirectory() as work_dir:
+        for use_cache in (False, True):
+            label = "with_cache" if use_cache else "without_cache"
+            output_dir = os.path.join(work_dir, label)
+            os.makedirs(output_dir)
+            cache_path = os.path.join(work_dir, f"{label}.sqlite3")
+            runs = {}
+            site.versions = [0] * args.pages
+            for name in ("cold", "unchanged", "after_changes", "unchanged_again"):
+                if name == "after_changes":
+                    for page in range(1, args.change + 1):
+                        site.change(page)
+                site.requests = {"200": 0, "304": 0}
+                runs[name] = asyncio.run(crawl_once(site, base_url, output_dir, cache_path, args.render_delay, use_cache))
+                runs[name]["http_responses"] = dict(site.requests)
+            report[label] = runs
+    site.shutdown()
+
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
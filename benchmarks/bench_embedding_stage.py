@@ -0,0 +1,99 @@
+"""
+Throughput and crash recovery of the batched embedding stage (rag_embed.EmbeddingStage) against a
+simulated rate-limited provider, without network access.
+
+Chunks the fixture corpus (repeated --copies times with distinct text) and embeds it through
+RateLimitedEmbedding. The provider fails permanently after --crash-after requests; the stage is
+then rerun with a healthy provider on the same checkpoint, which should only embed the chunks the
+first run did not finish. --no-crash measures a single uninterrupted run instead.
+
+    python benchmarks/bench_embedding_stage.py --copies 20 --crash-after 10
+    python benchmarks/bench_embedding_stage.py --copies 20 --batch-size 16 --concurrency 4 --no-crash
+"""
+import os
+import sys
+import asyncio
+import argparse
+import tempfile
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from llama_index.core.schema import Document
+
+from rag_embed import EmbeddingCheckpoint, EmbeddingStage
+from rag_index import create_node_parser
+from fake_embedding import RateLimitedEmbedding
+from bench_common import add_output_argument, write_report
+
+DEFAULT_CORPUS_DIR = os.path.join(PROJECT_ROOT, "benchmarks", "fixtures", "rag_corpus")
+
+
+def load_nodes(corpus_dir, copies):
+    """Chunks every fixture file copies times, tagging each copy so no two chunks share a text."""
+    documents = []
+    for copy in range(copies):
+        for name in sorted(os.listdir(corpus_dir)):
+            with open(os.path.join(corpus_dir, name), "r", encoding="utf-8") as f:
+                text = f.read()
+            documents.append(Document(text=f"{text}\n\nCopy {copy}.", metadata={"file_path": f"{name}#{copy}"}))
+    return create_node_parser().get_nodes_from_documents(documents)
+
+
+def run_stage(embed_model, checkpoint, nodes, batch_size, concurrency):
+    stage = EmbeddingStage(embed_model, checkpoint=checkpoint, batch_size=batch_size, max_concurrency=concurrency)
+    error = None
+    try:
+        asyncio.run(stage.aembed_nodes(nodes))
+    except RuntimeError as e:
+        error = str(e)
+    stats = dict(stage.stats)
+    stats["chunks_per_s"] = stats["embedded"] / stats["elapsed_s"] if stats["elapsed_s"] > 0 else 0.0
+    stats["error"] = error
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus-dir", default=DEFAULT_CORPUS_DIR)
+    parser.add_argument("--copies", type=int, default=20, help="Times the fixture corpus is repeated")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rps", type=float, default=10.0, help="Simulated provider requests per second")
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated seconds per provider request")
+    parser.add_argument("--crash-after", type=int, default=10, help="Provider fails permanently after this many requests")
+    parser.add_argument("--no-crash", action="store_true", help="Embed in one run without a simulated outage")
+    add_output_argument(parser)
+    args = parser.parse_args()
+
+    nodes = load_nodes(args.corpus_dir, args.copies)
+    report = {"chunks": len(nodes), "batch_size": args.batch_size, "concurrency": args.concurrency, "provider_rps": args.rps}
+
+    with tempfile.TemporaryDirectory() as checkpoint_dir:
+        checkpoint = EmbeddingCheckpoint(os.path.join(checkpoint_dir, "embedding_checkpoint.sqlite3"))
+        provider = RateLimitedEmbedding(
+            requests_per_second=args.rps, burst=max(1, int(args.rps)), latency_s=args.latency,
+            fail_after_requests=None if args.no_crash else args.crash_after, embed_batch_size=args.batch_size,
+        )
+        report["first_run"] = run_stage(provider, checkpoint, nodes, args.batch_size, args.concurrency)
+
+        if not args.no_crash:
+            # Fresh nodes (no embeddings) and a healthy provider, as after a restart
+            healthy = RateLimitedEmbedding(
+                requests_per_second=args.rps, burst=max(1, int(args.rps)), latency_s=args.latency,
+                embed_batch_size=args.batch_size,
+            )
+            resumed_nodes = load_nodes(args.corpus_dir, args.copies)
+            report["resumed_run"] = run_stage(healthy, checkpoint, resumed_nodes, args.batch_size, args.concurrency)
+            report["all_embedded_after_resume"] = all(node.embedding is not None for node in resumed_nodes)
+            report["resume_embedded_only_the_rest"] = (
+                report["resumed_run"]["from_checkpoint"] == report["first_run"]["embedded"]
+                and report["resumed_run"]["embedded"] == len(nodes) - report["first_run"]["embedded"]
+            )
+
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Peak memory of the streaming ingestion pipeline (rag_pipeline.stream_ingest) as the corpus grows.
+
+Replicates the fixture corpus --copies times (each copy with distinct text), then streams it
+through parse -> embed (HashingEmbedding, no network) -> MmapStoreWriter -> build_query_indexes in
+a fresh subprocess per corpus size, and reports peak RSS. With bounded batches the peak should
+stay roughly flat while the number of chunks grows.
+
+    python benchmarks/bench_ingest_memory.py --copies 10 100 1000
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from bench_common import peak_rss_mb, add_output_argument, write_report
+
+DEFAULT_CORPUS_DIR = os.path.join(PROJECT_ROOT, "benchmarks", "fixtures", "rag_corpus")
+
+
+def replicate_corpus(corpus_dir, output_dir, copies):
+    paths = []
+    names = sorted(os.listdir(corpus_dir))
+    for copy in range(copies):
+        for name in names:
+            with open(os.path.join(corpus_dir, name), "r", encoding="utf-8") as f:
+                text = f.read()
+            path = os.path.join(output_dir, f"copy{copy:05d}_{name}")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(f"{text}\n\nCopy {copy}.\n")
+            paths.append(path)
+    return paths
+
+
+def run_child(args):
+    """Runs one ingestion in this process and prints its measurements as JSON."""
+    from rag_embed import EmbeddingStage
+    from rag_index import build_query_indexes
+    from rag_pipeline import stream_ingest
+    from rag_store import MmapStoreWriter
+    from fake_embedding import HashingEmbedding
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        source_dir = os.path.join(work_dir, "source")
+        store_dir = os.path.join(work_dir, "mmap_store")
+        os.makedirs(source_dir)
+        paths = replicate_corpus(args.corpus_dir, source_dir, args.child)
+        rss_before = peak_rss_mb()
+
+        start = time.perf_counter()
+        writer = MmapStoreWriter(store_dir, embed_model_name="hashing")
+        stage = EmbeddingStage(HashingEmbedding(), batch_size=64)
+        failed = asyncio.run(stream_ingest(paths, work_dir, stage, writer, workers=args.workers, batch_chunks=args.batch_chunks))
+        nodes = writer.close()
+        build_query_indexes(store_dir)
+        elapsed = time.perf_counter() - start
+
+    print(json.dumps({
+        "copies": args.child,
+        "files": len(paths),
+        "nodes": nodes,
+        "failed": len(failed),
+        "seconds": elapsed,
+        "peak_rss_mb_before_ingest": rss_before,
+        "peak_rss_mb": peak_rss_mb(),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus-dir", default=DEFAULT_CORPUS_DIR)
+    parser.add_argument("--copies", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--batch-chunks", type=int, default=256)
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    add_output_argument(parser)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        run_child(args)
+        return
+
+    report = {"batch_chunks": args.batch_chunks, "workers": args.workers, "runs": []}
+    for copies in args.copies:
+        # A fresh interpreter per size, so each peak RSS only reflects its own run
+        result = subprocess.run(
+            [sys.executable, __file__, "--child", str(copies), "--corpus-dir", args.corpus_dir,
+             "--workers", str(args.workers), "--batch-chunks", str(args.batch_chunks)],
+            capture_output=True, text=True, check=True,
+        )
+        report["runs"].append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Parsing and chunking throughput of rag_parse.parse_files for different worker process counts.
+
+Replicates the files of --source-dir (default ragdb/source_data) --copies times into a temporary
+directory, parses them with each worker count and reports files/s and the speedup over one worker.
+Every run must produce the same chunks with the same file_path metadata as the single-worker run.
+
+    python benchmarks/bench_parsing.py --copies 25 --workers 1 2 4 8
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from rag_parse import parse_files
+from bench_common import add_output_argument, write_report
+
+DEFAULT_SOURCE_DIR = os.path.join(PROJECT_ROOT, "ragdb", "source_data")
+SOURCE_EXTS = (".pdf", ".txt", ".md", ".csv")
+
+
+def replicate_sources(source_dir, output_dir, copies):
+    paths = []
+    sources = sorted(name for name in os.listdir(source_dir) if name.lower().endswith(SOURCE_EXTS))
+    for copy in range(copies):
+        for name in sources:
+            path = os.path.join(output_dir, f"copy{copy:03d}_{name}")
+            shutil.copyfile(os.path.join(source_dir, name), path)
+            paths.append(path)
+    return paths
+
+
+def fingerprint(nodes):
+    """Order-sensitive (file_path, chunk text) pairs, ignoring the random node IDs."""
+    return [(node.metadata.get("file_path"), node.get_content()) for node in nodes]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source-dir", default=DEFAULT_SOURCE_DIR)
+    parser.add_argument("--copies", type=int, default=10)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    add_output_argument(parser)
+    args = parser.parse_args()
+
+    report = {"cpu_count": os.cpu_count(), "runs": []}
+    with tempfile.TemporaryDirectory() as work_dir:
+        paths = replicate_sources(args.source_dir, work_dir, args.copies)
+        report["files"] = len(paths)
+        baseline, baseline_s = None, None
+        for workers in sorted(set([1] + args.workers)):
+            start = time.perf_counter()
+            nodes, failed = parse_files(paths, PROJECT_ROOT, workers=workers)
+            elapsed = time.perf_counter() - start
+            if baseline is None:
+                baseline, baseline_s = fingerprint(nodes), elapsed
+            report["runs"].append({
+                "workers": workers,
+                "seconds": elapsed,
+                "files_per_s": len(paths) / elapsed,
+                "speedup": baseline_s / elapsed,
+                "nodes": len(nodes),
+                "failed": len(failed),
+                "identical_to_serial": fingerprint(nodes) == baseline,
+            })
+
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
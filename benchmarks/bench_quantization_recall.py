@@ -0,0 +1,206 @@
+"""
+Recall@k, latency, index size and per-worker memory of int8-quantized search (with full-precision
+rescoring) against exact float32 search.
+
+Uses a memory-mapped store (--store-dir) or a synthetic clustered corpus; queries are stored rows
+with Gaussian noise added. Memory is measured in a fresh process per search mode, as a Streamlit
+worker would open the store: the pages of embeddings.npy and of the int8 codes that all queries
+read, and what the kernel mapped of each (Linux only, from /proc/self/smaps).
+
+    python benchmarks/bench_quantization_recall.py --synthetic 50000 --rescore-factor 1 4 8
+"""
+import os
+import sys
+import time
+import mmap
+import argparse
+import tempfile
+import multiprocessing
+
+import numpy as np
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from rag_store import (
+    EMBEDDINGS_FILE,
+    INT8_EMBEDDINGS_FILE,
+    INT8_SCALES_FILE,
+    Int8Embeddings,
+    quantize_int8,
+    top_k_rows,
+)
+from bench_ann_recall import make_queries, synthetic_embeddings
+from bench_common import add_output_argument, write_report
+
+
+def mapped_resident_bytes(path):
+    """Resident bytes of this process's memory mappings of path, from /proc/self/smaps (0 if unavailable)."""
+    path = os.path.realpath(path)
+    resident, in_mapping = 0, False
+    try:
+        with open("/proc/self/smaps", "r", encoding="utf-8") as f:
+            for line in f:
+                fields = line.split()
+                if fields and "-" in fields[0] and len(fields) >= 5:
+                    # Mapping header: address perms offset dev inode [pathname]
+                    in_mapping = len(fields) >= 6 and fields[5] == path
+                elif in_mapping and fields[0] == "Rss:":
+                    resident += int(fields[1]) * 1024
+    except OSError:
+        return 0
+    return resident
+
+
+def touched_page_bytes(matrix, rows):
+    """Bytes of the distinct pages of an .npy memmap that hold the given rows."""
+    row_bytes = matrix.shape[1] * matrix.itemsize
+    data_offset = matrix.offset
+    pages = set()
+    for row in rows:
+        start = data_offset + row * row_bytes
+        pages.update(range(start // mmap.PAGESIZE, (start + row_bytes - 1) // mmap.PAGESIZE + 1))
+    return len(pages) * mmap.PAGESIZE
+
+
+class RowRecorder:
+    """Stands in for the float32 matrix in Int8Embeddings.search and records which rows are read."""
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+        self.reads = []
+
+    def __getitem__(self, rows):
+        self.reads.append(np.asarray(rows).ravel().tolist())
+        return self.matrix[rows]
+
+
+def worker_memory(store_dir, queries, top_k, rescore_factor):
+    """
+    Runs the queries the way a worker searches a freshly opened store. rescore_factor None means the
+    exact float32 scan. "touched" counts the pages of each file read by one query (the working set a
+    worker keeps hot) and by all queries together; "resident" is what the kernel mapped into the
+    process, which also includes neighbouring pages it mapped around the touched ones.
+    """
+    embeddings_path = os.path.join(store_dir, EMBEDDINGS_FILE)
+    int8_path = os.path.join(store_dir, INT8_EMBEDDINGS_FILE)
+    embeddings = np.load(embeddings_path, mmap_mode="r")
+    if rescore_factor:
+        quantized = Int8Embeddings(store_dir, rescore_factor=rescore_factor)
+        recorder = RowRecorder(embeddings)
+        for query in queries:
+            quantized.search(recorder, query, top_k)
+        # The shortlist scan reads every code; rescoring reads one batch of float32 rows per query
+        int8_per_query = int8_touched = touched_page_bytes(quantized.codes, range(quantized.codes.shape[0]))
+        float_per_query = float(np.mean([touched_page_bytes(embeddings, rows) for rows in recorder.reads]))
+        float_touched = touched_page_bytes(embeddings, {row for rows in recorder.reads for row in rows})
+    else:
+        for query in queries:
+            top_k_rows(embeddings @ query, top_k)
+        int8_per_query = int8_touched = 0
+        float_per_query = float_touched = touched_page_bytes(embeddings, range(embeddings.shape[0]))
+    return {
+        "float32_touched_bytes_per_query": float_per_query,
+        "int8_touched_bytes_per_query": int8_per_query,
+        "touched_bytes_per_query": float_per_query + int8_per_query,
+        "float32_touched_bytes": float_touched,
+        "int8_touched_bytes": int8_touched,
+        "touched_bytes": float_touched + int8_touched,
+        "float32_resident_bytes": mapped_resident_bytes(embeddings_path),
+        "int8_resident_bytes": mapped_resident_bytes(int8_path),
+    }
+
+
+def measure_worker_memory(store_dir, queries, top_k, rescore_factor):
+    """worker_memory in a new process, so nothing mapped by this one is counted."""
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(worker_memory, (store_dir, queries, top_k, rescore_factor))
+
+
+def run_benchmark(embeddings, store_dir, queries, top_k, rescore_factors):
+    exact_results, exact_latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        exact_results.append(set(top_k_rows(embeddings @ query, top_k).tolist()))
+        exact_latencies.append(time.perf_counter() - start)
+
+    float_bytes = os.path.getsize(os.path.join(store_dir, EMBEDDINGS_FILE))
+    int8_bytes = os.path.getsize(os.path.join(store_dir, INT8_EMBEDDINGS_FILE)) + os.path.getsize(os.path.join(store_dir, INT8_SCALES_FILE))
+    report = {
+        "node_count": int(embeddings.shape[0]),
+        "dim": int(embeddings.shape[1]),
+        "queries": len(queries),
+        "k": top_k,
+        "float32_bytes": float_bytes,
+        "int8_bytes": int8_bytes,
+        "compression": float_bytes / int8_bytes,
+        "exact_mean_ms": 1000 * float(np.mean(exact_latencies)),
+        "exact_p95_ms": 1000 * float(np.percentile(exact_latencies, 95)),
+        "exact_worker_memory": measure_worker_memory(store_dir, queries, top_k, None),
+        "int8": [],
+    }
+    print(f"Index size: float32 {float_bytes / 1e6:.1f} MB, int8 {int8_bytes / 1e6:.1f} MB ({report['compression']:.2f}x smaller)")
+    print(f"Exact scan worker touched {report['exact_worker_memory']['touched_bytes_per_query'] / 1e6:.1f} MB per query, "
+          f"{report['exact_worker_memory']['touched_bytes'] / 1e6:.1f} MB over {len(queries)} queries")
+
+    for rescore_factor in rescore_factors:
+        quantized = Int8Embeddings(store_dir, rescore_factor=rescore_factor)
+        recalls, latencies = [], []
+        for query, exact in zip(queries, exact_results):
+            start = time.perf_counter()
+            approximate = {row for row, _ in quantized.search(embeddings, query, top_k)}
+            latencies.append(time.perf_counter() - start)
+            recalls.append(len(approximate & exact) / len(exact))
+        result = {
+            "rescore_factor": rescore_factor,
+            f"recall@{top_k}": float(np.mean(recalls)),
+            "mean_ms": 1000 * float(np.mean(latencies)),
+            "p95_ms": 1000 * float(np.percentile(latencies, 95)),
+        }
+        result["speedup_vs_exact"] = report["exact_mean_ms"] / result["mean_ms"]
+        result["worker_memory"] = measure_worker_memory(store_dir, queries, top_k, rescore_factor)
+        result["memory_reduction_vs_exact"] = report["exact_worker_memory"]["touched_bytes_per_query"] / max(1, result["worker_memory"]["touched_bytes_per_query"])
+        report["int8"].append(result)
+        print(f"rescore_factor={rescore_factor:>3}: recall@{top_k}={result[f'recall@{top_k}']:.3f} "
+              f"mean={result['mean_ms']:.2f}ms p95={result['p95_ms']:.2f}ms "
+              f"(exact mean={report['exact_mean_ms']:.2f}ms p95={report['exact_p95_ms']:.2f}ms, {result['speedup_vs_exact']:.2f}x), "
+              f"worker touched {result['worker_memory']['int8_touched_bytes_per_query'] / 1e6:.1f} MB int8 + "
+              f"{result['worker_memory']['float32_touched_bytes_per_query'] / 1e6:.2f} MB float32 per query ({result['memory_reduction_vs_exact']:.2f}x less), "
+              f"{result['worker_memory']['float32_touched_bytes'] / 1e6:.1f} MB float32 over all queries")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--store-dir", help="Memory-mapped store directory to benchmark")
+    source.add_argument("--synthetic", type=int, metavar="N", help="Generate N synthetic embeddings instead")
+    parser.add_argument("--dim", type=int, default=768, help="Dimension of synthetic embeddings")
+    parser.add_argument("--rescore-factor", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    add_output_argument(parser)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        if args.store_dir:
+            store_dir = args.store_dir
+            embeddings = np.load(os.path.join(store_dir, EMBEDDINGS_FILE), mmap_mode="r")
+        else:
+            store_dir = work_dir
+            embeddings = synthetic_embeddings(args.synthetic, args.dim)
+            np.save(os.path.join(store_dir, EMBEDDINGS_FILE), embeddings)
+
+        if not Int8Embeddings.exists(store_dir):
+            codes, scales = quantize_int8(np.asarray(embeddings))
+            np.save(os.path.join(store_dir, INT8_EMBEDDINGS_FILE), codes)
+            np.save(os.path.join(store_dir, INT8_SCALES_FILE), scales)
+
+        report = run_benchmark(embeddings, store_dir, make_queries(embeddings, args.queries), args.k, args.rescore_factor)
+
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Latency comparison of the rag_dissertation_retriever response modes.
+
+"answer" synthesizes inside the tool (retrieval + one Gemini call), "retrieve" returns ranked
+chunks only. Runs against the live index and models, so GOOGLE_API_KEY (and HF_TOKEN unless
+--persist-dir points to a local copy of vector_store_data) must be set.
+
+    python benchmarks/bench_rag_modes.py --repeats 3 --output bench_rag_modes.json
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from agent import initialize_settings
+from tools import (
+    RAG_RESPONSE_MODE_ANSWER,
+    RAG_RESPONSE_MODE_RETRIEVE,
+    _sync_rag_snapshot,
+    create_rag_query_function,
+    load_rag_retriever,
+)
+from bench_common import percentile, add_output_argument, write_report
+
+BENCHMARK_QUERIES = [
+    "What is the submission deadline for the dissertation?",
+    "How should the literature review chapter be structured?",
+    "What does the university policy say about using generative AI in research?",
+    "Which journals are rated 4* in the ABS list for organisational psychology?",
+    "What are the ethics approval requirements for collecting survey data?",
+]
+
+
+def summarise(latencies, output_chars):
+    return {
+        "runs": len(latencies),
+        "mean_s": statistics.mean(latencies),
+        "p50_s": percentile(latencies, 50),
+        "p95_s": percentile(latencies, 95),
+        "max_s": max(latencies),
+        "mean_output_chars": statistics.mean(output_chars),
+    }
+
+
+def run_benchmark(persist_dir, queries, repeats):
+    retriever = load_rag_retriever(persist_dir)
+    results = {}
+    for mode in (RAG_RESPONSE_MODE_RETRIEVE, RAG_RESPONSE_MODE_ANSWER):
+        execute_rag_query = create_rag_query_function(retriever, mode)
+        latencies, output_chars = [], []
+        for _ in range(repeats):
+            for query in queries:
+                start = time.perf_counter()
+                output = execute_rag_query(query)
+                latencies.append(time.perf_counter() - start)
+                output_chars.append(len(output))
+        results[mode] = summarise(latencies, output_chars)
+        print(f"{mode:>8}: p50={results[mode]['p50_s']:.3f}s p95={results[mode]['p95_s']:.3f}s over {len(latencies)} queries")
+
+    results["answer_minus_retrieve_p50_s"] = results[RAG_RESPONSE_MODE_ANSWER]["p50_s"] - results[RAG_RESPONSE_MODE_RETRIEVE]["p50_s"]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--persist-dir", help="Local vector_store_data directory (default: sync the Hugging Face snapshot)")
+    parser.add_argument("--repeats", type=int, default=1, help="Passes over the query set per mode")
+    add_output_argument(parser)
+    args = parser.parse_args()
+
+    initialize_settings()
+    persist_dir = args.persist_dir
+    if not persist_dir:
+        persist_dir, _ = _sync_rag_snapshot(os.getenv("HF_TOKEN"))
+
+    report = run_benchmark(persist_dir, BENCHMARK_QUERIES, args.repeats)
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+Offline retrieval benchmark: quality and latency of the RAG retrieval path without network access.
+
+Indexes the bundled fixture corpus (benchmarks/fixtures/rag_corpus) with the same chunking and
+query-time indexes as ragdb/make_rag.py, embedding with a deterministic hashing model instead of
+Gemini. The labelled queries (benchmarks/fixtures/rag_queries.json) are then run through
+tools.load_rag_retriever for each retriever configuration, reporting recall@k and MRR against the
+labelled chunks, p50/p95 query latency and peak RSS as JSON.
+
+A label is {"file": name, "contains": phrase}: the relevant chunk is the chunk of that file whose
+text contains the phrase, so other chunks of the same file do not count. The longer documents split
+into several chunks, and documents on neighbouring topics (taught module regulations, library
+services, ...) act as distractors. A plain file name as a label matches any chunk of the file.
+
+    python benchmarks/bench_retrieval_offline.py --output bench_retrieval.json
+    python benchmarks/bench_retrieval_offline.py --baseline bench_retrieval.json   # exit 1 on a quality regression
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from llama_index.core import Settings, SimpleDirectoryReader, StorageContext, VectorStoreIndex
+from llama_index.core.schema import QueryBundle
+from llama_index.core.vector_stores import SimpleVectorStore
+
+import tools
+from rag_index import CHUNK_SIZE, CHUNK_OVERLAP, create_node_parser, write_query_indexes
+from fake_embedding import DEFAULT_DIM, HashingEmbedding
+from bench_common import peak_rss_mb, percentile, add_output_argument, write_report
+
+FIXTURES_DIR = os.path.join(PROJECT_ROOT, "benchmarks", "fixtures")
+DEFAULT_CORPUS_DIR = os.path.join(FIXTURES_DIR, "rag_corpus")
+DEFAULT_QUERIES_FILE = os.path.join(FIXTURES_DIR, "rag_queries.json")
+
+# Retriever configurations, selected through the same module flags tools.py reads from the environment
+CONFIGURATIONS = {
+    "mmap_hybrid": {"mmap": True, "hybrid": True},
+    "mmap_dense": {"mmap": True, "hybrid": False},
+    "json": {"mmap": False, "hybrid": False},
+}
+
+
+def build_fixture_index(corpus_dir, output_dir, chunk_size, chunk_overlap):
+    """
+    Builds the fixture index the way make_rag.py does. Returns (full persist dir, JSON-only persist dir,
+    nodes); the JSON-only copy has no memory-mapped store, so it exercises the fallback retriever.
+    """
+    reader = SimpleDirectoryReader(
+        input_dir=corpus_dir,
+        required_exts=[".md"],
+        recursive=True,
+        file_metadata=lambda filename: {"file_path": os.path.relpath(filename, start=PROJECT_ROOT)},
+    )
+    documents = reader.load_data()
+    index = VectorStoreIndex.from_documents(
+        documents,
+        storage_context=StorageContext.from_defaults(vector_store=SimpleVectorStore()),
+        embed_model=Settings.embed_model,
+        transformations=[create_node_parser(chunk_size, chunk_overlap)], # node_parser= is silently ignored
+    )
+
+    persist_dir = os.path.join(output_dir, "vector_store_data")
+    json_only_dir = os.path.join(output_dir, "json_only")
+    index.storage_context.persist(persist_dir=persist_dir)
+    index.storage_context.persist(persist_dir=json_only_dir)
+    write_query_indexes(index, persist_dir, embed_model_name=Settings.embed_model.model_name)
+    return persist_dir, json_only_dir, list(index.docstore.docs.values())
+
+
+def _normalize_space(text):
+    return " ".join(text.split())
+
+
+def label_matches(label, file_name, text):
+    """Whether a retrieved chunk (its source file name and text) is the chunk a relevance label points to."""
+    if isinstance(label, str):
+        return file_name == label
+    return file_name == label["file"] and _normalize_space(label["contains"]) in _normalize_space(text)
+
+
+def check_labels(queries, nodes):
+    """Fails early on labels that match no chunk of the index, e.g. after the fixture text was edited."""
+    chunks = [(os.path.basename(node.metadata.get("file_path", "")), node.get_content()) for node in nodes]
+    for item in queries:
+        for label in item["relevant"]:
+            if not any(label_matches(label, file_name, text) for file_name, text in chunks):
+                raise ValueError(f"Relevance label {label} of query {item['query']!r} matches no chunk")
+
+
+def score_query(retrieved, relevant, ks):
+    """
+    recall@k for each k (share of the relevant chunks among the top-k results) and the reciprocal rank
+    of the first relevant chunk; retrieved is a list of (file name, chunk text), best first.
+    """
+    hits = [[label_matches(label, file_name, text) for label in relevant] for file_name, text in retrieved]
+    recalls = {k: sum(any(row[i] for row in hits[:k]) for i in range(len(relevant))) / len(relevant) for k in ks}
+    reciprocal_rank = next((1.0 / rank for rank, row in enumerate(hits, start=1) if any(row)), 0.0)
+    return recalls, reciprocal_rank
+
+
+def run_configuration(persist_dir, queries, ks, repeats):
+    retriever = tools.load_rag_retriever(persist_dir)
+
+    def retrieve(query):
+        # Mirrors execute_rag_query: embed once, then retrieve with the precomputed embedding
+        query_bundle = QueryBundle(query_str=query, embedding=Settings.embed_model.get_query_embedding(query))
+        return retriever.retrieve(query_bundle)
+
+    for item in queries: # Warm-up pass: page in the store and fill lazy caches
+        retrieve(item["query"])
+
+    recalls = {k: [] for k in ks}
+    reciprocal_ranks, latencies = [], []
+    for repeat in range(repeats):
+        for item in queries:
+            start = time.perf_counter()
+            nodes = retrieve(item["query"])
+            latencies.append(time.perf_counter() - start)
+            if repeat == 0:
+                retrieved = [(os.path.basename(node.node.metadata.get("file_path", "")), node.node.get_content()) for node in nodes]
+                query_recalls, reciprocal_rank = score_query(retrieved, item["relevant"], ks)
+                for k in ks:
+                    recalls[k].append(query_recalls[k])
+                reciprocal_ranks.append(reciprocal_rank)
+
+    result = {f"recall@{k}": sum(recalls[k]) / len(queries) for k in ks}
+    result.update({
+        "mrr": sum(reciprocal_ranks) / len(queries),
+        "p50_ms": 1000 * percentile(latencies, 50),
+        "p95_ms": 1000 * percentile(latencies, 95),
+        "timed_queries": len(latencies),
+    })
+    return result
+
+
+def run_benchmark(corpus_dir, queries, ks, repeats, chunk_size, chunk_overlap, dim, configurations):
+    Settings.embed_model = HashingEmbedding(dim=dim)
+    # Retrieve enough results for the largest k; the flags below are read by load_rag_retriever
+    tools.RAG_SIMILARITY_TOP_K = max(ks)
+
+    report = {
+        "corpus_dir": os.path.relpath(corpus_dir, PROJECT_ROOT),
+        "queries": len(queries),
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "embedding": Settings.embed_model.model_name,
+        "configurations": {},
+    }
+    with tempfile.TemporaryDirectory() as output_dir:
+        start = time.perf_counter()
+        persist_dir, json_only_dir, nodes = build_fixture_index(corpus_dir, output_dir, chunk_size, chunk_overlap)
+        report["build_s"] = time.perf_counter() - start
+        report["node_count"] = len(nodes)
+        check_labels(queries, nodes)
+        report["peak_rss_mb_after_build"] = peak_rss_mb()
+
+        for name in configurations:
+            config = CONFIGURATIONS[name]
+            tools.RAG_HYBRID_SEARCH = config["hybrid"]
+            result = run_configuration(persist_dir if config["mmap"] else json_only_dir, queries, ks, repeats)
+            report["configurations"][name] = result
+            print(f"{name:>12}: recall@{max(ks)}={result[f'recall@{max(ks)}']:.3f} mrr={result['mrr']:.3f} "
+                  f"p50={result['p50_ms']:.2f}ms p95={result['p95_ms']:.2f}ms")
+
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def find_regressions(report, baseline, tolerance):
+    """Quality metrics (recall@k, MRR) that dropped by more than tolerance compared to a baseline report."""
+    regressions = []
+    for name, result in report["configurations"].items():
+        previous = baseline.get("configurations", {}).get(name)
+        if previous is None:
+            continue
+        for metric, value in result.items():
+            if (metric == "mrr" or metric.startswith("recall@")) and metric in previous:
+                if value < previous[metric] - tolerance:
+                    regressions.append(f"{name} {metric}: {previous[metric]:.3f} -> {value:.3f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus-dir", default=DEFAULT_CORPUS_DIR, help="Directory of .md files to index")
+    parser.add_argument("--queries", default=DEFAULT_QUERIES_FILE, help='JSON list of {query, relevant: [{"file": name, "contains": phrase}]}')
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5])
+    parser.add_argument("--repeats", type=int, default=5, help="Timed passes over the query set per configuration")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--chunk-overlap", type=int, default=CHUNK_OVERLAP)
+    parser.add_argument("--dim", type=int, default=DEFAULT_DIM, help="Dimension of the hashing embedding")
+    parser.add_argument("--configurations", nargs="+", choices=list(CONFIGURATIONS), default=list(CONFIGURATIONS))
+    parser.add_argument("--baseline", help="Earlier JSON report; exit with status 1 if recall or MRR dropped")
+    parser.add_argument("--tolerance", type=float, default=0.0, help="Allowed drop in recall/MRR against --baseline")
+    add_output_argument(parser)
+    args = parser.parse_args()
+
+    with open(args.queries, "r", encoding="utf-8") as f:
+        queries = json.load(f)
+
+    report = run_benchmark(
+        args.corpus_dir, queries, sorted(set(args.k)), args.repeats,
+        args.chunk_size, args.chunk_overlap, args.dim, args.configurations,
+    )
+
+    write_report(report, args.output)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = find_regressions(report, json.load(f), args.tolerance)
+        if regressions:
+            print("Retrieval quality regressed against the baseline:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("No retrieval quality regressions against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Deterministic, dependency-free embedding model for offline benchmarks.
+
+Hashes unigrams and bigrams (signed feature hashing, sublinear term frequency) into a fixed
+number of dimensions. Related texts share tokens and therefore score higher, which is enough to
+exercise chunking, storage and retrieval without network access or model downloads.
+"""
+import os
+import sys
+import math
+import time
+import asyncio
+import hashlib
+from typing import List, Optional, Tuple
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from pydantic import PrivateAttr
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from rag_bm25 import tokenize
+
+DEFAULT_DIM = 256
+
+
+def _bucket(feature: str, dim: int):
+    """Stable (bucket, sign) for a feature; hash() is salted per process, so blake2b is used."""
+    digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+    value = int.from_bytes(digest, "little")
+    return value % dim, 1.0 if (value >> 63) & 1 else -1.0
+
+
+def hashing_embedding(text: str, dim: int = DEFAULT_DIM) -> List[float]:
+    tokens = tokenize(text)
+    features = tokens + [f"{first} {second}" for first, second in zip(tokens, tokens[1:])]
+    counts = {}
+    for feature in features:
+        counts[feature] = counts.get(feature, 0) + 1
+
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature, count in counts.items():
+        bucket, sign = _bucket(feature, dim)
+        vector[bucket] += sign * (1.0 + math.log(count))
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector.tolist()
+
+
+class HashingEmbedding(BaseEmbedding):
+    """LlamaIndex embedding model backed by hashing_embedding; queries and documents embed the same way."""
+
+    dim: int = DEFAULT_DIM
+
+    def __init__(self, dim: int = DEFAULT_DIM, **kwargs):
+        super().__init__(model_name=f"hashing-{dim}", dim=dim, **kwargs)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "HashingEmbedding"
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return hashing_embedding(query, self.dim)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return hashing_embedding(query, self.dim)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return hashing_embedding(text, self.dim)
+
+
+class RateLimitError(Exception):
+    """Shaped like a provider's HTTP 429 error, so rag_embed.is_rate_limit_error recognises it."""
+    status_code = 429
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimitedEmbedding(HashingEmbedding):
+    """
+    HashingEmbedding behind a simulated provider: each request takes latency_s, at most
+    requests_per_second requests are admitted (token bucket of size burst), and excess requests
+    fail with RateLimitError (carrying retry_after_s as Retry-After, if set). fail_after_requests
+    makes every later request fail, like a crash. request_log records (requests in flight including
+    this one, "ok" / "rate_limited" / "outage") for every request, in arrival order.
+    """
+
+    requests_per_second: float = 5.0
+    burst: int = 5
+    latency_s: float = 0.05
+    fail_after_requests: Optional[int] = None
+    retry_after_s: Optional[float] = None
+    _tokens: float = PrivateAttr()
+    _refilled_at: float = PrivateAttr()
+    _requests: int = PrivateAttr(default=0)
+    _in_flight: int = PrivateAttr(default=0)
+    _request_log: List[Tuple[int, str]] = PrivateAttr(default_factory=list)
+
+    def __init__(self, dim: int = DEFAULT_DIM, **kwargs):
+        super().__init__(dim=dim, **kwargs)
+        self._tokens = float(self.burst)
+        self._refilled_at = time.monotonic()
+        self._requests = 0
+        self._in_flight = 0
+        self._request_log = []
+
+    @property
+    def requests(self) -> int:
+        return self._requests
+
+    @property
+    def request_log(self) -> List[Tuple[int, str]]:
+        return self._request_log
+
+    def _admit(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(float(self.burst), self._tokens + (now - self._refilled_at) * self.requests_per_second)
+        self._refilled_at = now
+        self._requests += 1
+        self._in_flight += 1
+        if self.fail_after_requests is not None and self._requests > self.fail_after_requests:
+            self._request_log.append((self._in_flight, "outage"))
+            self._in_flight -= 1
+            raise RuntimeError("Simulated embedding outage")
+        if self._tokens < 1.0:
+            self._request_log.append((self._in_flight, "rate_limited"))
+            self._in_flight -= 1
+            raise RateLimitError("429 RESOURCE_EXHAUSTED: simulated rate limit", retry_after=self.retry_after_s)
+        self._request_log.append((self._in_flight, "ok"))
+        self._tokens -= 1.0
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        self._admit()
+        try:
+            time.sleep(self.latency_s)
+            return [hashing_embedding(text, self.dim) for text in texts]
+        finally:
+            self._in_flight -= 1
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        self._admit()
+        try:
+            await asyncio.sleep(self.latency_s)
+            return [hashing_embedding(text, self.dim) for text in texts]
+        finally:
+            self._in_flight -= 1
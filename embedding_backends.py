@@ -0,0 +1,141 @@
+import os
+import asyncio
+import threading
+from typing import Any, List, Optional, Tuple
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from pydantic import PrivateAttr
+
+# --- Embedding Model Specs ---
+# One string names the model that embeds the corpus and the queries: "<backend>:<model name>".
+# A spec without a backend prefix is a Google GenAI model, the format earlier indexes recorded.
+#   models/text-embedding-004               Google GenAI API
+#   local:BAAI/bge-small-en-v1.5            sentence-transformers model on the local CPU
+# make_rag.py records the spec in the index (store_meta.json, ingest manifest), and tools.py embeds
+# queries with whatever the index records, so the two can never silently disagree.
+EMBED_BACKEND_GOOGLE = "google"
+EMBED_BACKEND_LOCAL = "local"
+DEFAULT_EMBED_MODEL = "models/text-embedding-004"
+DEFAULT_LOCAL_BATCH_SIZE = 32
+LOCAL_RUNTIMES = ("torch", "onnx")
+
+
+def parse_embed_model_spec(spec: str) -> Tuple[str, str]:
+    """Splits a spec into (backend, model name)."""
+    backend, separator, model_name = spec.partition(":")
+    if separator and backend in (EMBED_BACKEND_GOOGLE, EMBED_BACKEND_LOCAL):
+        return backend, model_name
+    return EMBED_BACKEND_GOOGLE, spec
+
+
+def canonical_embed_model_spec(spec: str) -> str:
+    """The form recorded in an index: "google:" is dropped, so older indexes keep matching."""
+    backend, model_name = parse_embed_model_spec(spec)
+    return model_name if backend == EMBED_BACKEND_GOOGLE else f"{backend}:{model_name}"
+
+
+def embed_model_matches_spec(embed_model: BaseEmbedding, spec: str) -> bool:
+    """Whether embed_model (possibly wrapped in CachedEmbedding) is the model spec names."""
+    return embed_model.model_name == parse_embed_model_spec(spec)[1]
+
+
+class LocalCPUEmbedding(BaseEmbedding):
+    """
+    sentence-transformers model run on the CPU, with PyTorch or ONNX Runtime ("onnx", needs
+    optimum[onnxruntime]). Texts are encoded in batches of embed_batch_size on `threads` intra-op
+    threads; vectors are L2-normalised. One batch runs at a time: the runtime already spreads a
+    batch over all threads, so concurrent batches would only compete for the same cores.
+    """
+
+    runtime: str = "torch"
+    threads: Optional[int] = None
+    _model: Any = PrivateAttr()
+    _lock: threading.Lock = PrivateAttr()
+
+    def __init__(
+        self,
+        model_name: str,
+        runtime: str = "torch",
+        threads: Optional[int] = None,
+        embed_batch_size: int = DEFAULT_LOCAL_BATCH_SIZE,
+        **kwargs: Any,
+    ):
+        if runtime not in LOCAL_RUNTIMES:
+            raise ValueError(f"Unknown local embedding runtime {runtime!r}, expected one of {LOCAL_RUNTIMES}")
+        super().__init__(model_name=model_name, runtime=runtime, threads=threads, embed_batch_size=embed_batch_size, **kwargs)
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError("Local embeddings need the sentence-transformers package (pip install sentence-transformers).") from e
+
+        model_kwargs = {}
+        if runtime == "torch" and threads:
+            import torch
+            torch.set_num_threads(threads)
+        elif runtime == "onnx" and threads:
+            import onnxruntime
+            session_options = onnxruntime.SessionOptions()
+            session_options.intra_op_num_threads = threads
+            model_kwargs["session_options"] = session_options
+        self._model = SentenceTransformer(model_name, device="cpu", backend=runtime, model_kwargs=model_kwargs or None)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LocalCPUEmbedding"
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        with self._lock:
+            vectors = self._model.encode(
+                texts,
+                batch_size=self.embed_batch_size,
+                normalize_embeddings=True,
+                convert_to_numpy=True,
+                show_progress_bar=False,
+            )
+        return vectors.tolist()
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._encode([query])[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return (await asyncio.to_thread(self._encode, [query]))[0]
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._encode([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._encode(texts)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        # Off the event loop, so parsing and store writes carry on while the CPU embeds
+        return await asyncio.to_thread(self._encode, texts)
+
+
+def create_embed_model(
+    spec: str,
+    api_key: Optional[str] = None,
+    local_runtime: Optional[str] = None,
+    local_threads: Optional[int] = None,
+    local_batch_size: Optional[int] = None,
+) -> BaseEmbedding:
+    """
+    Builds the embedding model a spec names. Local models read EMBED_LOCAL_RUNTIME,
+    EMBED_LOCAL_THREADS and EMBED_LOCAL_BATCH_SIZE unless the arguments are given.
+    """
+    backend, model_name = parse_embed_model_spec(spec)
+    if backend == EMBED_BACKEND_LOCAL:
+        threads = local_threads or int(os.getenv("EMBED_LOCAL_THREADS", "0")) or None
+        embed_model = LocalCPUEmbedding(
+            model_name,
+            runtime=local_runtime or os.getenv("EMBED_LOCAL_RUNTIME", "torch"),
+            threads=threads,
+            embed_batch_size=local_batch_size or int(os.getenv("EMBED_LOCAL_BATCH_SIZE", DEFAULT_LOCAL_BATCH_SIZE)),
+        )
+        print(f"Using local CPU embedding model {model_name} (runtime: {embed_model.runtime}, threads: {threads or 'default'}).")
+        return embed_model
+
+    from llama_index.embeddings.google_genai import GoogleGenAIEmbedding
+    if api_key:
+        return GoogleGenAIEmbedding(model_name=model_name, api_key=api_key)
+    return GoogleGenAIEmbedding(model_name=model_name)
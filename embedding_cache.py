@@ -0,0 +1,205 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from pydantic import PrivateAttr
+
+DEFAULT_MEMORY_CACHE_SIZE = 1024
+# The disk tier keeps at most DEFAULT_DISK_MAX_ENTRIES vectors (about 60 MB at 768 dimensions),
+# dropping the least recently used first, and forgets entries unused for DEFAULT_DISK_TTL_SECONDS
+DEFAULT_DISK_MAX_ENTRIES = 20000
+DEFAULT_DISK_TTL_SECONDS = 30 * 24 * 60 * 60
+SQLITE_TIMEOUT_SECONDS = 5.0
+
+
+def normalize_query_text(text: str) -> str:
+    """Collapses whitespace and case so trivially different spellings of a query share a cache entry."""
+    return " ".join(text.split()).casefold()
+
+
+def embedding_cache_key(model_name: str, text: str) -> str:
+    """Cache key for a (model, normalized query text) pair."""
+    return hashlib.sha256(f"{model_name}\0{normalize_query_text(text)}".encode("utf-8")).hexdigest()
+
+
+class _SqliteEmbeddingStore:
+    """
+    Disk tier shared by all processes on the host. One short-lived connection per call keeps it thread-safe.
+    Entries unused for ttl_seconds expire, and the least recently used are evicted beyond max_entries.
+    """
+
+    def __init__(self, path: str, max_entries: int = DEFAULT_DISK_MAX_ENTRIES, ttl_seconds: float = DEFAULT_DISK_TTL_SECONDS):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                "key TEXT PRIMARY KEY, model_name TEXT NOT NULL, vector BLOB NOT NULL, created_at REAL NOT NULL, "
+                "last_used_at REAL NOT NULL DEFAULT 0)"
+            )
+            # Caches written before last_used_at existed: their entries count as used when created
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(query_embeddings)")}
+            if "last_used_at" not in columns:
+                conn.execute("ALTER TABLE query_embeddings ADD COLUMN last_used_at REAL NOT NULL DEFAULT 0")
+                conn.execute("UPDATE query_embeddings SET last_used_at = created_at")
+            conn.execute("CREATE INDEX IF NOT EXISTS query_embeddings_last_used ON query_embeddings (last_used_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=SQLITE_TIMEOUT_SECONDS)
+
+    def get(self, key: str) -> Optional[List[float]]:
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT vector FROM query_embeddings WHERE key = ? AND last_used_at >= ?", (key, now - self.ttl_seconds)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE query_embeddings SET last_used_at = ? WHERE key = ?", (now, key))
+        return np.frombuffer(row[0], dtype=np.float32).tolist()
+
+    def put(self, key: str, model_name: str, embedding: List[float]) -> None:
+        """Adds an entry, then drops expired entries and evicts the least recently used beyond max_entries."""
+        now = time.time()
+        vector = np.asarray(embedding, dtype=np.float32).tobytes()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO query_embeddings (key, model_name, vector, created_at, last_used_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, model_name, vector, now, now),
+            )
+            conn.execute("DELETE FROM query_embeddings WHERE last_used_at < ?", (now - self.ttl_seconds,))
+            conn.execute(
+                "DELETE FROM query_embeddings WHERE key IN ("
+                "SELECT key FROM query_embeddings ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    Wraps an embedding model and caches query embeddings in two tiers:
+    a bounded in-process LRU, then an SQLite file shared between workers (bounded by disk_max_entries
+    and disk_ttl_seconds).
+    Text (document) embeddings are passed straight through.
+    """
+
+    _inner: BaseEmbedding = PrivateAttr()
+    _memory: "OrderedDict[str, List[float]]" = PrivateAttr()
+    _memory_size: int = PrivateAttr()
+    _disk: Optional[_SqliteEmbeddingStore] = PrivateAttr()
+    _lock: threading.Lock = PrivateAttr()
+    _counters: Dict[str, int] = PrivateAttr()
+
+    def __init__(
+        self,
+        inner: BaseEmbedding,
+        cache_path: Optional[str] = None,
+        memory_size: int = DEFAULT_MEMORY_CACHE_SIZE,
+        disk_max_entries: int = DEFAULT_DISK_MAX_ENTRIES,
+        disk_ttl_seconds: float = DEFAULT_DISK_TTL_SECONDS,
+        **kwargs: Any,
+    ):
+        super().__init__(
+            model_name=inner.model_name,
+            embed_batch_size=inner.embed_batch_size,
+            callback_manager=inner.callback_manager,
+            **kwargs,
+        )
+        self._inner = inner
+        self._memory = OrderedDict()
+        self._memory_size = memory_size
+        self._disk = None
+        if cache_path:
+            try:
+                self._disk = _SqliteEmbeddingStore(cache_path, max_entries=disk_max_entries, ttl_seconds=disk_ttl_seconds)
+            except sqlite3.Error as e:
+                print(f"Warning: Could not open embedding cache at {cache_path}: {e}. Using memory tier only.")
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for both tiers and the overall hit rate."""
+        with self._lock:
+            counters = dict(self._counters)
+            counters["memory_entries"] = len(self._memory)
+        lookups = counters["memory_hits"] + counters["disk_hits"] + counters["misses"]
+        counters["hit_rate"] = (counters["memory_hits"] + counters["disk_hits"]) / lookups if lookups else 0.0
+        return counters
+
+    def _remember(self, key: str, embedding: List[float]) -> None:
+        with self._lock:
+            self._memory[key] = embedding
+            self._memory.move_to_end(key)
+            while len(self._memory) > self._memory_size:
+                self._memory.popitem(last=False)
+
+    def _lookup(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            embedding = self._memory.get(key)
+            if embedding is not None:
+                self._memory.move_to_end(key)
+                self._counters["memory_hits"] += 1
+                return embedding
+
+        if self._disk is not None:
+            try:
+                embedding = self._disk.get(key)
+            except sqlite3.Error as e:
+                print(f"Warning: Embedding cache read failed: {e}")
+                embedding = None
+            if embedding is not None:
+                self._remember(key, embedding)
+                with self._lock:
+                    self._counters["disk_hits"] += 1
+                return embedding
+
+        with self._lock:
+            self._counters["misses"] += 1
+        return None
+
+    def _store(self, key: str, embedding: List[float]) -> None:
+        self._remember(key, embedding)
+        if self._disk is not None:
+            try:
+                self._disk.put(key, self.model_name, embedding)
+            except sqlite3.Error as e:
+                print(f"Warning: Embedding cache write failed: {e}")
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        key = embedding_cache_key(self.model_name, query)
+        embedding = self._lookup(key)
+        if embedding is None:
+            embedding = self._inner.get_query_embedding(query)
+            self._store(key, embedding)
+        return embedding
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        key = embedding_cache_key(self.model_name, query)
+        embedding = self._lookup(key)
+        if embedding is None:
+            embedding = await self._inner.aget_query_embedding(query)
+            self._store(key, embedding)
+        return embedding
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._inner.get_text_embedding(text)
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return await self._inner.aget_text_embedding(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._inner.get_text_embedding_batch(texts)
@@ -0,0 +1,207 @@
+import json
+import time
+import uuid
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Dict, List, Optional, Sequence
+
+import llama_index.core.instrumentation as instrument
+from llama_index.core.agent import FunctionCallingAgentWorker
+from llama_index.core.agent.types import Task, TaskStep, TaskStepOutput
+from llama_index.core.agent.utils import add_user_step_to_memory
+from llama_index.core.callbacks import CallbackManager, CBEventType, EventPayload, trace_method
+from llama_index.core.chat_engine.types import AgentChatResponse
+from llama_index.core.instrumentation.events.agent import AgentToolCallEvent
+from llama_index.core.llms import ChatMessage, MessageRole
+from llama_index.core.llms.llm import ToolSelection
+from llama_index.core.tools import BaseTool, ToolOutput
+from llama_index.core.tools.calling import call_tool
+
+dispatcher = instrument.get_dispatcher(__name__)
+
+# --- Parallel Tool Execution ---
+# The function calls of one agent step (e.g. duckduckgo + semantic_scholar_search + rag_dissertation_retriever)
+# run concurrently on a thread pool of their own, one thread per call, so a step takes as long as its slowest
+# tool rather than the sum and one session's slow tools never hold up another's.
+# Each call has its own timeout; a call that runs over it is reported to the LLM as a failed tool call.
+DEFAULT_TOOL_TIMEOUT_SECONDS = 60.0
+
+
+def parse_tool_timeouts(spec: str) -> Dict[str, float]:
+    """Parses per-tool timeouts written as "duckduckgo=20,code_interpreter=180"."""
+    timeouts = {}
+    for item in spec.split(","):
+        name, separator, seconds = item.partition("=")
+        if separator and name.strip():
+            timeouts[name.strip()] = float(seconds)
+    return timeouts
+
+
+def _error_output(tool_call: ToolSelection, message: str) -> ToolOutput:
+    return ToolOutput(
+        content=message,
+        tool_name=tool_call.tool_name,
+        raw_input=tool_call.tool_kwargs,
+        raw_output=message,
+        is_error=True,
+    )
+
+
+class _ToolCallRun:
+    """One tool call on its worker thread; started_at is set once the call actually begins executing."""
+
+    def __init__(self, tool: BaseTool, tool_call: ToolSelection, callback_manager: CallbackManager, verbose: bool):
+        self.tool = tool
+        self.tool_call = tool_call
+        self.callback_manager = callback_manager
+        self.verbose = verbose
+        self.started = threading.Event()
+        self.started_at = 0.0
+
+    def __call__(self) -> ToolOutput:
+        self.started_at = time.monotonic()
+        self.started.set()
+        arguments = json.dumps(self.tool_call.tool_kwargs)
+        if self.verbose:
+            print(f"=== Calling Function ===\nCalling function: {self.tool_call.tool_name} with args: {arguments}")
+        # The same events the base worker emits around a call, opened and closed by the call itself
+        dispatcher.event(AgentToolCallEvent(arguments=arguments, tool=self.tool.metadata))
+        with self.callback_manager.event(
+            CBEventType.FUNCTION_CALL,
+            payload={EventPayload.FUNCTION_CALL: arguments, EventPayload.TOOL: self.tool.metadata},
+        ) as event:
+            tool_output = call_tool(self.tool, self.tool_call.tool_kwargs)
+            event.on_end(payload={EventPayload.FUNCTION_OUTPUT: str(tool_output)})
+        return tool_output
+
+
+def execute_tool_calls(
+    tools: Sequence[BaseTool],
+    tool_calls: Sequence[ToolSelection],
+    default_timeout: float = DEFAULT_TOOL_TIMEOUT_SECONDS,
+    timeouts: Optional[Dict[str, float]] = None,
+    callback_manager: Optional[CallbackManager] = None,
+    verbose: bool = False,
+) -> List[ToolOutput]:
+    """
+    Runs tool calls concurrently and returns their outputs in call order. Unknown tools and calls
+    that exceed their timeout (timeouts[tool name], else default_timeout, counted from when the call
+    starts executing) get an error output; a timed-out call cannot be interrupted, so it finishes in
+    the background and its result is discarded.
+    """
+    timeouts = timeouts or {}
+    callback_manager = callback_manager or CallbackManager([])
+    tools_by_name = {tool.metadata.name: tool for tool in tools}
+    runs = [
+        _ToolCallRun(tools_by_name[tool_call.tool_name], tool_call, callback_manager, verbose)
+        if tool_call.tool_name in tools_by_name else None
+        for tool_call in tool_calls
+    ]
+    dispatched_at = time.monotonic()
+    # One thread per call, so no call waits for a free worker; the pool is not waited for on shutdown,
+    # which lets timed-out calls run to completion without holding up the step
+    executor = ThreadPoolExecutor(max_workers=max(1, len(tool_calls)), thread_name_prefix="agent-tool")
+    try:
+        # Each call runs in a copy of this context, so its events nest under the current agent step
+        futures = [executor.submit(contextvars.copy_context().run, run) if run is not None else None for run in runs]
+    finally:
+        executor.shutdown(wait=False)
+
+    outputs = []
+    for tool_call, run, future in zip(tool_calls, runs, futures):
+        if future is None:
+            outputs.append(_error_output(tool_call, f"Tool with name {tool_call.tool_name} not found"))
+            continue
+        timeout = timeouts.get(tool_call.tool_name, default_timeout)
+        try:
+            run.started.wait()
+            outputs.append(future.result(timeout=max(0.0, run.started_at + timeout - time.monotonic())))
+        except FutureTimeoutError:
+            if verbose:
+                print(f"=== Function {tool_call.tool_name} timed out after {timeout:g}s ===")
+            outputs.append(_error_output(tool_call, f"Tool {tool_call.tool_name} timed out after {timeout:g} seconds."))
+    if verbose and len(tool_calls) > 1:
+        print(f"=== Ran {len(tool_calls)} function calls in parallel in {time.monotonic() - dispatched_at:.1f}s ===")
+    return outputs
+
+
+class ParallelFunctionCallingAgentWorker(FunctionCallingAgentWorker):
+    """
+    FunctionCallingAgentWorker whose steps run all function calls of one LLM response at once
+    (see execute_tool_calls), instead of one after another. tool_timeout and tool_timeouts can be
+    passed to from_tools(); everything else behaves like the base worker.
+    """
+
+    def __init__(
+        self,
+        *args: Any,
+        tool_timeout: float = DEFAULT_TOOL_TIMEOUT_SECONDS,
+        tool_timeouts: Optional[Dict[str, float]] = None,
+        **kwargs: Any,
+    ):
+        super().__init__(*args, **kwargs)
+        self.tool_timeout = tool_timeout
+        self.tool_timeouts = tool_timeouts or {}
+
+    @trace_method("run_step")
+    def run_step(self, step: TaskStep, task: Task, **kwargs: Any) -> TaskStepOutput:
+        """Run step."""
+        if step.input is not None:
+            add_user_step_to_memory(step, task.extra_state["new_memory"], verbose=self._verbose)
+        tools = self.get_tools(task.input)
+
+        response = self._llm.chat_with_tools(
+            tools=tools,
+            user_msg=None,
+            chat_history=self.get_all_messages(task),
+            verbose=self._verbose,
+            allow_parallel_tool_calls=self.allow_parallel_tool_calls,
+        )
+        tool_calls = self._llm.get_tool_calls_from_response(response, error_on_no_tool_call=False)
+        if self._verbose and response.message.content:
+            print("=== LLM Response ===")
+            print(str(response.message.content))
+
+        task.extra_state["new_memory"].put(response.message)
+        tool_outputs: List[ToolOutput] = []
+        if len(tool_calls) == 0 or task.extra_state["n_function_calls"] >= self._max_function_calls:
+            return TaskStepOutput(
+                output=AgentChatResponse(response=str(response.message.content), sources=tool_outputs),
+                task_step=step,
+                is_last=True,
+                next_steps=[],
+            )
+
+        tools_by_name = {tool.metadata.name: tool for tool in tools}
+        tool_outputs_in_order = execute_tool_calls(
+            tools, tool_calls, self.tool_timeout, self.tool_timeouts,
+            callback_manager=self.callback_manager, verbose=self._verbose,
+        )
+        for tool_call, tool_output in zip(tool_calls, tool_outputs_in_order):
+            if self._verbose:
+                print(f"=== Function {tool_call.tool_name} ===\n{tool_output.content}")
+            task.extra_state["new_memory"].put(ChatMessage(
+                content=str(tool_output),
+                role=MessageRole.TOOL,
+                additional_kwargs={"name": tool_call.tool_name, "tool_call_id": tool_call.tool_id},
+            ))
+            tool_outputs.append(tool_output)
+            task.extra_state["sources"].append(tool_output)
+            task.extra_state["n_function_calls"] += 1
+
+        # As in the base worker, a return_direct tool as the first call ends the turn with its output
+        first_tool = tools_by_name.get(tool_calls[0].tool_name)
+        if first_tool is not None and first_tool.metadata.return_direct:
+            return TaskStepOutput(
+                output=AgentChatResponse(response=str(tool_outputs[0].content), sources=tool_outputs),
+                task_step=step,
+                is_last=True,
+                next_steps=[],
+            )
+        return TaskStepOutput(
+            output=AgentChatResponse(response=str(response.message.content), sources=tool_outputs),
+            task_step=step,
+            is_last=False,
+            next_steps=[step.get_next_step(step_id=str(uuid.uuid4()), input=None)],
+        )
@@ -0,0 +1,126 @@
+import os
+import json
+import math
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from rag_store import top_k_rows
+
+# --- IVF Index Layout ---
+# An inverted-file (IVF) index: rows are clustered around nlist centroids with spherical k-means,
+# and a query only scores the rows of the nprobe closest clusters. Stored in the memory-mapped
+# store directory; row numbers are the rows of embeddings.npy.
+IVF_CENTROIDS_FILE = "ivf_centroids.npy"        # float32 (nlist, dim), L2-normalised
+IVF_LIST_OFFSETS_FILE = "ivf_list_offsets.npy"  # int64 (nlist + 1,) into ivf_list_rows.npy
+IVF_LIST_ROWS_FILE = "ivf_list_rows.npy"        # int32 (n_nodes,) rows grouped by cluster
+IVF_META_FILE = "ivf_meta.json"
+
+# Below this many nodes brute force is already fast, so no ANN index is built
+ANN_MIN_NODES = 5000
+DEFAULT_NPROBE = 8
+KMEANS_ITERATIONS = 20
+KMEANS_MAX_TRAINING_ROWS = 50000
+_ASSIGN_BATCH_ROWS = 8192
+
+
+def default_nlist(node_count: int) -> int:
+    """Roughly 4 * sqrt(n) clusters, the usual starting point for IVF."""
+    return max(1, min(node_count, int(4 * math.sqrt(node_count))))
+
+
+def _assign(embeddings: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Nearest centroid (by dot product) for every row, computed in batches."""
+    assignments = np.empty(embeddings.shape[0], dtype=np.int64)
+    for start in range(0, embeddings.shape[0], _ASSIGN_BATCH_ROWS):
+        batch = np.asarray(embeddings[start:start + _ASSIGN_BATCH_ROWS], dtype=np.float32)
+        assignments[start:start + batch.shape[0]] = np.argmax(batch @ centroids.T, axis=1)
+    return assignments
+
+
+def train_centroids(embeddings: np.ndarray, nlist: int, iterations: int = KMEANS_ITERATIONS, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on (a sample of) the L2-normalised embeddings."""
+    rng = np.random.default_rng(seed)
+    node_count = embeddings.shape[0]
+    if node_count > KMEANS_MAX_TRAINING_ROWS:
+        sample = np.asarray(embeddings[np.sort(rng.choice(node_count, KMEANS_MAX_TRAINING_ROWS, replace=False))], dtype=np.float32)
+    else:
+        sample = np.asarray(embeddings, dtype=np.float32)
+
+    centroids = sample[rng.choice(sample.shape[0], nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = _assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        counts = np.bincount(assignments, minlength=nlist)
+        empty = counts == 0
+        if empty.any():
+            # Re-seed empty clusters with random rows so every list stays useful
+            sums[empty] = sample[rng.choice(sample.shape[0], int(empty.sum()), replace=False)]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = (sums / norms).astype(np.float32)
+    return centroids
+
+
+def build_ivf_index(embeddings: np.ndarray, output_dir: str, nlist: Optional[int] = None, min_nodes: int = ANN_MIN_NODES) -> bool:
+    """
+    Clusters the store's embeddings and writes the IVF index to output_dir.
+    Returns False (and writes nothing) when the corpus is small enough for exact search.
+    """
+    node_count = embeddings.shape[0]
+    if node_count < min_nodes:
+        print(f"Skipping ANN index: {node_count} nodes is below the {min_nodes} node threshold, exact search will be used.")
+        return False
+
+    nlist = nlist or default_nlist(node_count)
+    centroids = train_centroids(embeddings, nlist)
+    assignments = _assign(embeddings, centroids)
+    order = np.argsort(assignments, kind="stable").astype(np.int32)
+    offsets = np.zeros(nlist + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(assignments, minlength=nlist))
+
+    os.makedirs(output_dir, exist_ok=True)
+    np.save(os.path.join(output_dir, IVF_CENTROIDS_FILE), centroids)
+    np.save(os.path.join(output_dir, IVF_LIST_OFFSETS_FILE), offsets)
+    np.save(os.path.join(output_dir, IVF_LIST_ROWS_FILE), order)
+    with open(os.path.join(output_dir, IVF_META_FILE), "w", encoding="utf-8") as f:
+        json.dump({"node_count": int(node_count), "nlist": int(nlist)}, f, indent=4)
+
+    print(f"Wrote IVF index with {nlist} lists over {node_count} nodes to {output_dir}")
+    return True
+
+
+class IVFIndex:
+    """Memory-mapped IVF index; nprobe trades recall for speed (nprobe == nlist is exact search)."""
+
+    def __init__(self, store_dir: str, nprobe: int = DEFAULT_NPROBE):
+        with open(os.path.join(store_dir, IVF_META_FILE), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.centroids = np.load(os.path.join(store_dir, IVF_CENTROIDS_FILE), mmap_mode="r")
+        self.list_offsets = np.load(os.path.join(store_dir, IVF_LIST_OFFSETS_FILE), mmap_mode="r")
+        self.list_rows = np.load(os.path.join(store_dir, IVF_LIST_ROWS_FILE), mmap_mode="r")
+        self.nprobe = max(1, min(nprobe, self.meta["nlist"]))
+
+    @classmethod
+    def exists(cls, store_dir: str) -> bool:
+        """Checks whether a complete IVF index is present in store_dir."""
+        required = [IVF_META_FILE, IVF_CENTROIDS_FILE, IVF_LIST_OFFSETS_FILE, IVF_LIST_ROWS_FILE]
+        return all(os.path.exists(os.path.join(store_dir, name)) for name in required)
+
+    def candidate_rows(self, query: np.ndarray) -> np.ndarray:
+        """Rows in the nprobe clusters closest to the (normalised) query."""
+        probes = top_k_rows(self.centroids @ query, self.nprobe)
+        return np.concatenate([
+            self.list_rows[int(self.list_offsets[probe]):int(self.list_offsets[probe + 1])]
+            for probe in probes
+        ])
+
+    def search(self, embeddings: np.ndarray, query: np.ndarray, top_k: int) -> List[Tuple[int, float]]:
+        """Scores only the candidate rows at full precision and returns the top-k (row, score) pairs."""
+        rows = np.sort(self.candidate_rows(query))
+        if rows.shape[0] == 0:
+            return []
+        scores = embeddings[rows] @ query
+        best = top_k_rows(scores, top_k)
+        return [(int(rows[i]), float(scores[i])) for i in best]
@@ -0,0 +1,143 @@
+import os
+import re
+import json
+import math
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from rag_store import top_k_rows
+
+# --- BM25 Index Layout ---
+# Stored inside the memory-mapped store directory so posting rows are the same row numbers
+# as embeddings.npy / nodes.bin.
+BM25_TERMS_FILE = "bm25_terms.npy"                      # sorted fixed-width unicode (n_terms,)
+BM25_POSTINGS_OFFSETS_FILE = "bm25_postings_offsets.npy"  # int64 (n_terms + 1,) into the postings arrays
+BM25_POSTINGS_ROWS_FILE = "bm25_postings_rows.npy"      # int32 node rows, grouped by term
+BM25_POSTINGS_TF_FILE = "bm25_postings_tf.npy"          # uint16 term frequencies, parallel to rows
+BM25_DOC_LENGTHS_FILE = "bm25_doc_lengths.npy"          # int32 (n_nodes,) token counts
+BM25_META_FILE = "bm25_meta.json"
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were will with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercases and splits on non-alphanumerics, so codes like NBS7091A stay one token."""
+    return [token for token in _TOKEN_PATTERN.findall(text.lower()) if token not in _STOPWORDS]
+
+
+def build_bm25_index(texts: Iterable[str], output_dir: str) -> int:
+    """Builds the BM25 inverted index over texts (one per store row) and writes it to output_dir."""
+    # Compact typed arrays rather than lists of tuples: the postings are the only part of the build
+    # that grows with the corpus, so they are kept at 6 bytes per (row, tf) pair
+    postings: Dict[str, Tuple[array, array]] = {}
+    doc_lengths = array("i")
+    for row, text in enumerate(texts):
+        tokens = tokenize(text)
+        doc_lengths.append(len(tokens))
+        for term, tf in Counter(tokens).items():
+            term_rows, term_tfs = postings.setdefault(term, (array("i"), array("H")))
+            term_rows.append(row)
+            term_tfs.append(min(tf, np.iinfo(np.uint16).max))
+
+    terms = sorted(postings)
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    for i, term in enumerate(terms):
+        offsets[i + 1] = offsets[i] + len(postings[term][0])
+    rows = np.empty(int(offsets[-1]), dtype=np.int32)
+    tfs = np.empty(int(offsets[-1]), dtype=np.uint16)
+    for i, term in enumerate(terms):
+        term_rows, term_tfs = postings.pop(term)
+        rows[offsets[i]:offsets[i + 1]] = np.frombuffer(term_rows, dtype=np.int32)
+        tfs[offsets[i]:offsets[i + 1]] = np.frombuffer(term_tfs, dtype=np.uint16)
+
+    os.makedirs(output_dir, exist_ok=True)
+    np.save(os.path.join(output_dir, BM25_TERMS_FILE), np.asarray(terms, dtype=str))
+    np.save(os.path.join(output_dir, BM25_POSTINGS_OFFSETS_FILE), offsets)
+    np.save(os.path.join(output_dir, BM25_POSTINGS_ROWS_FILE), rows)
+    np.save(os.path.join(output_dir, BM25_POSTINGS_TF_FILE), tfs)
+    np.save(os.path.join(output_dir, BM25_DOC_LENGTHS_FILE), np.frombuffer(doc_lengths, dtype=np.int32))
+    with open(os.path.join(output_dir, BM25_META_FILE), "w", encoding="utf-8") as f:
+        json.dump({
+            "doc_count": len(doc_lengths),
+            "term_count": len(terms),
+            "avg_doc_length": (sum(doc_lengths) / len(doc_lengths)) if doc_lengths else 0.0,
+        }, f, indent=4)
+
+    print(f"Wrote BM25 index with {len(terms)} terms over {len(doc_lengths)} nodes to {output_dir}")
+    return len(terms)
+
+
+class BM25Index:
+    """Memory-mapped BM25 index; scores only the rows that share a term with the query."""
+
+    def __init__(self, store_dir: str, k1: float = BM25_K1, b: float = BM25_B):
+        with open(os.path.join(store_dir, BM25_META_FILE), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.k1 = k1
+        self.b = b
+        self.terms = np.load(os.path.join(store_dir, BM25_TERMS_FILE), mmap_mode="r")
+        self.offsets = np.load(os.path.join(store_dir, BM25_POSTINGS_OFFSETS_FILE), mmap_mode="r")
+        self.rows = np.load(os.path.join(store_dir, BM25_POSTINGS_ROWS_FILE), mmap_mode="r")
+        self.tfs = np.load(os.path.join(store_dir, BM25_POSTINGS_TF_FILE), mmap_mode="r")
+        self.doc_lengths = np.load(os.path.join(store_dir, BM25_DOC_LENGTHS_FILE), mmap_mode="r")
+
+    @classmethod
+    def exists(cls, store_dir: str) -> bool:
+        """Checks whether a complete BM25 index is present in store_dir."""
+        required = [
+            BM25_META_FILE, BM25_TERMS_FILE, BM25_POSTINGS_OFFSETS_FILE,
+            BM25_POSTINGS_ROWS_FILE, BM25_POSTINGS_TF_FILE, BM25_DOC_LENGTHS_FILE,
+        ]
+        return all(os.path.exists(os.path.join(store_dir, name)) for name in required)
+
+    def _term_id(self, term: str) -> int:
+        position = int(np.searchsorted(self.terms, term))
+        if position < self.terms.shape[0] and self.terms[position] == term:
+            return position
+        return -1
+
+    def query(self, text: str, top_k: int, candidate_rows: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """Returns (row, BM25 score) pairs for the top-k rows, best first, optionally only among candidate_rows."""
+        doc_count = self.meta["doc_count"]
+        if doc_count == 0:
+            return []
+        avg_doc_length = self.meta["avg_doc_length"] or 1.0
+
+        # Only posting rows are touched: per-term contributions are concatenated, then summed per row,
+        # so a query costs O(postings of its terms) rather than O(corpus)
+        posting_rows: List[np.ndarray] = []
+        contributions: List[np.ndarray] = []
+        for term in set(tokenize(text)):
+            term_id = self._term_id(term)
+            if term_id < 0:
+                continue
+            start, end = int(self.offsets[term_id]), int(self.offsets[term_id + 1])
+            rows = np.asarray(self.rows[start:end])
+            tfs = np.asarray(self.tfs[start:end], dtype=np.float32)
+            length_norm = self.k1 * (1.0 - self.b + self.b * (self.doc_lengths[rows].astype(np.float32) / avg_doc_length))
+            doc_freq = end - start
+            idf = math.log(1.0 + (doc_count - doc_freq + 0.5) / (doc_freq + 0.5))
+            posting_rows.append(rows)
+            contributions.append(idf * tfs * (self.k1 + 1.0) / (tfs + length_norm))
+        if not posting_rows:
+            return []
+
+        matched_rows, inverse = np.unique(np.concatenate(posting_rows), return_inverse=True)
+        scores = np.zeros(matched_rows.shape[0], dtype=np.float32)
+        np.add.at(scores, inverse, np.concatenate(contributions))
+
+        if candidate_rows is not None:
+            allowed = np.isin(matched_rows, candidate_rows)
+            matched_rows, scores = matched_rows[allowed], scores[allowed]
+
+        best = top_k_rows(scores, top_k)
+        return [(int(matched_rows[i]), float(scores[i])) for i in best]
@@ -0,0 +1,353 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+import httpx
+from urllib.parse import urldefrag, urljoin, urlparse
+
+# --- Crawl Scheduler Defaults ---
+DEFAULT_MAX_CONCURRENCY = 8          # pages fetched at once across all hosts
+DEFAULT_PER_HOST_CONCURRENCY = 2     # pages fetched at once from one host
+DEFAULT_PER_HOST_DELAY_SECONDS = 1.0 # minimum gap between request starts to one host
+DEFAULT_WRITER_WORKERS = 2
+DEFAULT_REVALIDATE_TIMEOUT_SECONDS = 15.0
+SQLITE_TIMEOUT_SECONDS = 5.0
+
+
+@dataclass
+class CrawledPage:
+    """What a fetch function returns for one URL; links may be relative to url."""
+    url: str
+    success: bool
+    markdown: Optional[str] = None
+    links: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+    # Set by ConditionalFetcher when the page is known not to have changed since the last crawl;
+    # markdown is then None and the previously saved file is still current
+    unchanged: bool = False
+    # Validators of the fetch's own HTTP response, if the fetch function reports them; they let
+    # ConditionalFetcher revalidate a page next time without probing it before the first render
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+
+def normalize_url(url: str) -> str:
+    """Canonical form used for de-duplication: no fragment, lower-case scheme and host, no trailing slash on the path."""
+    url, _ = urldefrag(url.strip())
+    parsed = urlparse(url)
+    path = parsed.path.rstrip("/") or "/"
+    return parsed._replace(scheme=parsed.scheme.lower(), netloc=parsed.netloc.lower(), path=path).geturl()
+
+
+def url_host(url: str) -> str:
+    return urlparse(url).netloc.lower()
+
+
+class AsyncFileWriter:
+    """Writes files from a queue on worker threads, so slow disks never stall the crawl."""
+
+    def __init__(self, output_dir: str, workers: int = DEFAULT_WRITER_WORKERS):
+        self.output_dir = output_dir
+        self.written = 0
+        self.bytes_written = 0
+        self.failed: List[Dict[str, str]] = []
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._run()) for _ in range(max(1, workers))]
+
+    @staticmethod
+    def _write(path: str, content: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+
+    async def _run(self) -> None:
+        while True:
+            item = await self._queue.get()
+            try:
+                if item is None:
+                    return
+                filename, content, url = item
+                path = os.path.join(self.output_dir, filename)
+                try:
+                    await asyncio.to_thread(self._write, path, content)
+                    self.written += 1
+                    self.bytes_written += len(content.encode("utf-8"))
+                    print(f"      Saved {url} to {path}")
+                except OSError as e:
+                    print(f"      Error writing file {path} for URL {url}: {e}")
+                    self.failed.append({"url": url, "error": f"File write error: {e}"})
+            finally:
+                self._queue.task_done()
+
+    def submit(self, filename: str, content: str, url: str) -> None:
+        self._queue.put_nowait((filename, content, url))
+
+    async def close(self) -> None:
+        """Waits for every queued write to finish and stops the workers."""
+        for _ in self._workers:
+            self._queue.put_nowait(None)
+        await asyncio.gather(*self._workers)
+
+
+@dataclass
+class CrawlCacheEntry:
+    """What the last successful crawl of a URL left behind."""
+    url: str                      # normalized requested URL (the cache key)
+    final_url: str                # URL after redirects, as reported by the fetch function
+    etag: Optional[str]
+    last_modified: Optional[str]
+    content_sha256: Optional[str] # of the raw response body, for servers that send no validators
+    links: List[str]
+    fetched_at: float
+    markdown_sha256: Optional[str] = None # of the rendered page
+    revalidate: bool = True       # False once a probe said "changed" although the rendered page was the same
+
+
+class CrawlCache:
+    """
+    Persistent per-URL validators (ETag, Last-Modified, body hash) and outgoing links of crawled
+    pages, so the next crawl can revalidate a page instead of rendering it again. SQLite with one
+    connection per call, like the embedding checkpoint.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS crawl_pages ("
+                "url TEXT PRIMARY KEY, final_url TEXT NOT NULL, etag TEXT, last_modified TEXT, "
+                "content_sha256 TEXT, links TEXT NOT NULL, fetched_at REAL NOT NULL, "
+                "markdown_sha256 TEXT, revalidate INTEGER NOT NULL DEFAULT 1)"
+            )
+            # Caches written before markdown_sha256 / revalidate existed
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(crawl_pages)")}
+            if "markdown_sha256" not in columns:
+                conn.execute("ALTER TABLE crawl_pages ADD COLUMN markdown_sha256 TEXT")
+            if "revalidate" not in columns:
+                conn.execute("ALTER TABLE crawl_pages ADD COLUMN revalidate INTEGER NOT NULL DEFAULT 1")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=SQLITE_TIMEOUT_SECONDS)
+
+    def get(self, url: str) -> Optional[CrawlCacheEntry]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT url, final_url, etag, last_modified, content_sha256, links, fetched_at, markdown_sha256, revalidate "
+                "FROM crawl_pages WHERE url = ?",
+                (normalize_url(url),),
+            ).fetchone()
+        if row is None:
+            return None
+        return CrawlCacheEntry(row[0], row[1], row[2], row[3], row[4], json.loads(row[5]), row[6], row[7], bool(row[8]))
+
+    def put(self, entry: CrawlCacheEntry) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO crawl_pages (url, final_url, etag, last_modified, content_sha256, links, fetched_at, "
+                "markdown_sha256, revalidate) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (normalize_url(entry.url), entry.final_url, entry.etag, entry.last_modified,
+                 entry.content_sha256, json.dumps(entry.links), entry.fetched_at, entry.markdown_sha256, int(entry.revalidate)),
+            )
+
+
+class ConditionalFetcher:
+    """
+    Wraps a fetch function (e.g. a headless-browser crawl) with a cheap HTTP revalidation step.
+    A URL crawled before is first requested over plain HTTP, conditionally (If-None-Match /
+    If-Modified-Since). A 304, or a 200 whose body hashes the same as last time, returns an unchanged
+    page with the cached links, so the crawl still expands from it but nothing is rendered or
+    rewritten. Otherwise the page goes to fetch and the probe's validators are cached for next time.
+
+    The probe is skipped, and the page fetched straight away, when it cannot pay off: for URLs not
+    crawled before (their validators come from the fetch's response, see CrawledPage.etag), for pages
+    whose saved output is gone (is_saved returns False), and for pages where a probe once reported a
+    change although the rendered page came out the same (validators that change on every request, a
+    body with a timestamp or nonce). Delete the cache file to give those pages another chance.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[str], Awaitable[CrawledPage]],
+        cache: CrawlCache,
+        is_saved: Callable[[str], bool] = lambda final_url: True,
+        client: Optional[httpx.AsyncClient] = None,
+        timeout: float = DEFAULT_REVALIDATE_TIMEOUT_SECONDS,
+    ):
+        self.fetch = fetch
+        self.cache = cache
+        self.is_saved = is_saved
+        self._client = client
+        self._owns_client = client is None
+        self.timeout = timeout
+        self.stats = {"not_modified": 0, "same_content": 0, "fetched": 0, "probe_skipped": 0, "probe_failed": 0}
+
+    async def _probe(self, url: str, entry: Optional[CrawlCacheEntry]) -> Optional[httpx.Response]:
+        if self._client is None:
+            self._client = httpx.AsyncClient(follow_redirects=True, timeout=self.timeout)
+        headers = {}
+        if entry is not None and entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry is not None and entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        try:
+            return await self._client.get(url, headers=headers)
+        except httpx.HTTPError as e:
+            self.stats["probe_failed"] += 1
+            print(f"      Revalidation of {url} failed ({type(e).__name__}: {e}); fetching it in full.")
+            return None
+
+    async def __call__(self, url: str) -> CrawledPage:
+        entry = self.cache.get(url)
+        if entry is not None and not self.is_saved(entry.final_url):
+            entry = None # The saved page is gone; render it again
+        if entry is None or not entry.revalidate:
+            self.stats["probe_skipped"] += 1
+            return await self._fetch(url, entry)
+
+        response = await self._probe(url, entry)
+        body_sha256 = hashlib.sha256(response.content).hexdigest() if response is not None and response.status_code == 200 else None
+        if response is not None and (
+            response.status_code == 304 or (body_sha256 is not None and body_sha256 == entry.content_sha256)
+        ):
+            self.stats["not_modified" if response.status_code == 304 else "same_content"] += 1
+            entry.etag = response.headers.get("etag") or entry.etag
+            entry.last_modified = response.headers.get("last-modified") or entry.last_modified
+            self.cache.put(entry)
+            return CrawledPage(url=entry.final_url, success=True, links=entry.links, unchanged=True)
+        return await self._fetch(url, entry, response if body_sha256 is not None else None, body_sha256)
+
+    async def _fetch(
+        self,
+        url: str,
+        entry: Optional[CrawlCacheEntry],
+        response: Optional[httpx.Response] = None,
+        body_sha256: Optional[str] = None,
+    ) -> CrawledPage:
+        """Fetches the page and caches what the next crawl revalidates it with: the probe's 200 response if there was one, else the fetch's."""
+        page = await self.fetch(url)
+        self.stats["fetched"] += 1
+        if not page.success:
+            return page
+        markdown_sha256 = hashlib.sha256(page.markdown.encode("utf-8")).hexdigest() if page.markdown else None
+        revalidate = entry.revalidate if entry is not None else True
+        if response is not None and entry is not None and entry.content_sha256 is not None and (
+            markdown_sha256 is not None and markdown_sha256 == entry.markdown_sha256
+        ):
+            # The probe said "changed" but the page is the same, so it can never tell: skip it from now on
+            revalidate = False
+            print(f"      Revalidating {url} does not work (validators or body change on every request); it will be fetched directly.")
+        self.cache.put(CrawlCacheEntry(
+            url=url,
+            final_url=page.url,
+            etag=response.headers.get("etag") if response is not None else page.etag,
+            last_modified=response.headers.get("last-modified") if response is not None else page.last_modified,
+            content_sha256=body_sha256,
+            links=page.links,
+            fetched_at=time.time(),
+            markdown_sha256=markdown_sha256,
+            revalidate=revalidate,
+        ))
+        return page
+
+    async def close(self) -> None:
+        if self._client is not None and self._owns_client:
+            await self._client.aclose()
+            self._client = None
+
+    def summary(self) -> str:
+        return (f"Crawl cache: {self.stats['not_modified']} pages not modified (304), {self.stats['same_content']} with unchanged "
+                f"content, {self.stats['fetched']} fetched in full ({self.stats['probe_skipped']} without revalidation), "
+                f"{self.stats['probe_failed']} revalidations failed.")
+
+
+class CrawlScheduler:
+    """
+    Breadth-first crawl of many seed URLs at once.
+    Every URL is crawled at most once across all seeds. Requests are bounded globally and per host,
+    and request starts to the same host are spaced by per_host_delay. A page waiting for its host
+    does not hold a global slot, so busy hosts never block the others.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[str], Awaitable[CrawledPage]],
+        max_depth: int = 1,
+        max_pages_per_seed: int = 10,
+        include_external: bool = False,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        per_host_concurrency: int = DEFAULT_PER_HOST_CONCURRENCY,
+        per_host_delay: float = DEFAULT_PER_HOST_DELAY_SECONDS,
+    ):
+        self.fetch = fetch
+        self.max_depth = max_depth
+        self.max_pages_per_seed = max_pages_per_seed
+        self.include_external = include_external
+        self.per_host_concurrency = per_host_concurrency
+        self.per_host_delay = per_host_delay
+        self._global_slots = asyncio.Semaphore(max_concurrency)
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+        self._host_locks: Dict[str, asyncio.Lock] = {}
+        self._host_next_start: Dict[str, float] = {}
+        self._seen: Set[str] = set()
+        self._pages_per_seed: Dict[str, int] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self.pages_by_host: Dict[str, int] = {}
+        self.duplicates_skipped = 0
+
+    def _enqueue(self, url: str, depth: int, seed: str, on_page) -> None:
+        key = normalize_url(url)
+        if key in self._seen:
+            self.duplicates_skipped += 1
+            return
+        if self._pages_per_seed.get(seed, 0) >= self.max_pages_per_seed:
+            return
+        self._seen.add(key)
+        self._pages_per_seed[seed] = self._pages_per_seed.get(seed, 0) + 1
+        task = asyncio.create_task(self._crawl(url, depth, seed, on_page))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _wait_for_host_turn(self, host: str) -> None:
+        """Spaces request starts to one host by per_host_delay."""
+        async with self._host_locks.setdefault(host, asyncio.Lock()):
+            now = time.monotonic()
+            start_at = max(now, self._host_next_start.get(host, 0.0))
+            self._host_next_start[host] = start_at + self.per_host_delay
+        if start_at > now:
+            await asyncio.sleep(start_at - now)
+
+    async def _crawl(self, url: str, depth: int, seed: str, on_page) -> None:
+        host = url_host(url)
+        async with self._host_slots.setdefault(host, asyncio.Semaphore(self.per_host_concurrency)):
+            await self._wait_for_host_turn(host)
+            async with self._global_slots:
+                try:
+                    page = await self.fetch(url)
+                except Exception as e:
+                    page = CrawledPage(url=url, success=False, error=f"Fetch error: {e}")
+        self.pages_by_host[host] = self.pages_by_host.get(host, 0) + 1
+        print(f"    Crawled {page.url} (seed: {seed}, depth: {depth}, success: {page.success})")
+        on_page(page, seed, depth)
+
+        if page.success and depth < self.max_depth:
+            seed_host = url_host(seed)
+            for link in page.links:
+                absolute = urljoin(page.url, link)
+                if urlparse(absolute).scheme not in ("http", "https"):
+                    continue
+                if not self.include_external and url_host(absolute) != seed_host:
+                    continue
+                self._enqueue(absolute, depth + 1, seed, on_page)
+
+    async def run(self, seeds: List[str], on_page: Callable[[CrawledPage, str, int], None]) -> None:
+        """Crawls all seeds concurrently; on_page(page, seed, depth) is called for every fetched page."""
+        for seed in seeds:
+            self._enqueue(seed, 0, seed, on_page)
+        while self._tasks:
+            await asyncio.wait(set(self._tasks))
@@ -0,0 +1,106 @@
+import hashlib
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from rag_bm25 import tokenize
+
+# --- Near-Duplicate Detection ---
+# 64-bit SimHash over word shingles: texts that differ in only a few words (a changed date in the
+# footer, a different breadcrumb) get fingerprints a few bits apart. Fingerprints are split into
+# max_distance + 1 bands; two fingerprints within max_distance bits must agree exactly on at least
+# one band, so candidates are found by band lookup instead of comparing against every kept text.
+SIMHASH_BITS = 64
+SHINGLE_SIZE = 3
+# Each fingerprint bit differs with probability angle / pi between the two shingle vectors. Changing k
+# words of an n-shingle text replaces about 3k shingles, a cosine of (n - 3k) / n: two words in a
+# 200-shingle chunk (or one in 100) give 5 differing bits on average. Unrelated texts differ in 32 bits
+# on average, and are within 6 bits of each other with probability about 5e-12.
+DEFAULT_MAX_DISTANCE = 6
+# Dropped items printed individually per filter; the rest only appear in the summary
+DEFAULT_LOG_LIMIT = 20
+
+
+def _feature_hash(feature: str) -> int:
+    """Stable 64-bit hash; hash() is salted per process, so fingerprints would not be reproducible."""
+    return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def simhash(text: str, shingle_size: int = SHINGLE_SIZE) -> int:
+    """64-bit SimHash of the word shingles of text, each weighted by how often it occurs."""
+    tokens = tokenize(text)
+    if len(tokens) >= shingle_size:
+        shingles = [" ".join(tokens[i:i + shingle_size]) for i in range(len(tokens) - shingle_size + 1)]
+    else:
+        shingles = [" ".join(tokens)] if tokens else [text.strip()]
+    counts = Counter(shingles)
+    hashes = np.array([_feature_hash(shingle) for shingle in counts], dtype="<u8")
+    # (n_shingles, 64) bit matrix, least significant bit first
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+    weights = np.asarray(list(counts.values()), dtype=np.int64) @ (2 * bits.astype(np.int64) - 1)
+    return int(np.packbits(weights > 0, bitorder="little").view("<u8")[0])
+
+
+def hamming_distance(first: int, second: int) -> int:
+    return bin(first ^ second).count("1")
+
+
+class NearDuplicateFilter:
+    """
+    Remembers the fingerprints of kept texts and reports later texts that are near-duplicates of
+    one of them. kind ("page", "chunk") only labels the log lines.
+    """
+
+    def __init__(self, kind: str, max_distance: int = DEFAULT_MAX_DISTANCE, log_limit: int = DEFAULT_LOG_LIMIT):
+        self.kind = kind
+        self.max_distance = max_distance
+        self.log_limit = log_limit
+        self._band_count = max_distance + 1
+        self._band_bits = SIMHASH_BITS // self._band_count
+        self._buckets: Dict[Tuple[int, int], List[Tuple[int, str]]] = {}
+        self.kept = 0
+        self.dropped_count = 0
+        self.dropped: Dict[str, int] = {} # key of the kept text -> near-duplicates dropped in its favour
+
+    def _bands(self, fingerprint: int) -> List[Tuple[int, int]]:
+        mask = (1 << self._band_bits) - 1
+        return [(band, (fingerprint >> (band * self._band_bits)) & mask) for band in range(self._band_count)]
+
+    def find(self, fingerprint: int) -> Optional[str]:
+        """Key of a kept text within max_distance bits of fingerprint, if any."""
+        for band in self._bands(fingerprint):
+            for candidate, key in self._buckets.get(band, ()):
+                if hamming_distance(candidate, fingerprint) <= self.max_distance:
+                    return key
+        return None
+
+    def add(self, fingerprint: int, key: str) -> None:
+        for band in self._bands(fingerprint):
+            self._buckets.setdefault(band, []).append((fingerprint, key))
+        self.kept += 1
+
+    def check(self, key: str, text: str) -> Optional[str]:
+        """
+        Returns the key of the earlier near-duplicate if text should be dropped (and logs it);
+        otherwise remembers text under key and returns None.
+        """
+        fingerprint = simhash(text)
+        duplicate_of = self.find(fingerprint)
+        if duplicate_of is None:
+            self.add(fingerprint, key)
+            return None
+        self.dropped[duplicate_of] = self.dropped.get(duplicate_of, 0) + 1
+        self.dropped_count += 1
+        if self.dropped_count <= self.log_limit:
+            preview = " ".join(text.split())[:80]
+            print(f"  Dropped near-duplicate {self.kind} {key} (matches {duplicate_of}): \"{preview}\"")
+        elif self.dropped_count == self.log_limit + 1:
+            print(f"  ... further dropped {self.kind}s are only counted in the summary.")
+        return duplicate_of
+
+    def summary(self) -> str:
+        top = sorted(self.dropped.items(), key=lambda item: item[1], reverse=True)[:5]
+        most_repeated = ", ".join(f"{key} x{count}" for key, count in top)
+        return (f"Near-duplicate {self.kind}s: kept {self.kept}, dropped {self.dropped_count}"
+                + (f" (most repeated: {most_repeated})" if top else "") + ".")
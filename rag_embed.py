@@ -0,0 +1,221 @@
+import os
+import time
+import random
+import asyncio
+import sqlite3
+import hashlib
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from llama_index.core.schema import BaseNode, MetadataMode
+
+# --- Embedding Stage Defaults ---
+DEFAULT_EMBED_BATCH_SIZE = 64
+DEFAULT_EMBED_CONCURRENCY = 4
+DEFAULT_MAX_RETRIES = 8
+INITIAL_BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 60.0
+# Consecutive successful batches before one more concurrent request is allowed again
+SUCCESSES_PER_CONCURRENCY_STEP = 4
+SQLITE_TIMEOUT_SECONDS = 5.0
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Recognises HTTP 429 / quota errors from the embedding provider (google-genai, httpx, openai-style clients)."""
+    for attribute in ("code", "status_code"):
+        if getattr(error, attribute, None) == 429:
+            return True
+    response = getattr(error, "response", None)
+    if getattr(response, "status_code", None) == 429:
+        return True
+    message = f"{getattr(error, 'status', '')} {error}".lower()
+    return any(marker in message for marker in ("429", "resource_exhausted", "rate limit", "quota"))
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Server-suggested wait from a Retry-After header or attribute, if the error carries one."""
+    value = getattr(error, "retry_after", None)
+    if value is None:
+        headers = getattr(getattr(error, "response", None), "headers", None) or {}
+        value = headers.get("retry-after") or headers.get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def chunk_text_key(model_name: str, text: str) -> str:
+    return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCheckpoint:
+    """
+    Chunk vectors already computed, keyed by (model, exact text) so a rerun finds them again even
+    though re-parsed nodes get new IDs. Committed after every batch; one connection per call.
+    Only needed until the store holding the vectors is published, after which clear() empties it.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunk_embeddings ("
+                "key TEXT PRIMARY KEY, model_name TEXT NOT NULL, vector BLOB NOT NULL, created_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=SQLITE_TIMEOUT_SECONDS)
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, List[float]]:
+        found = {}
+        with self._connect() as conn:
+            for start in range(0, len(keys), 500): # Stay below SQLite's bound-parameter limit
+                batch = list(keys[start:start + 500])
+                placeholders = ",".join("?" * len(batch))
+                for key, vector in conn.execute(f"SELECT key, vector FROM chunk_embeddings WHERE key IN ({placeholders})", batch):
+                    found[key] = np.frombuffer(vector, dtype=np.float32).tolist()
+        return found
+
+    def put_many(self, model_name: str, items: Dict[str, List[float]]) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO chunk_embeddings (key, model_name, vector, created_at) VALUES (?, ?, ?, ?)",
+                [(key, model_name, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in items.items()],
+            )
+
+    def clear(self) -> int:
+        """Drops every checkpointed vector and returns how many there were; the file shrinks back as well."""
+        conn = self._connect()
+        try:
+            deleted = conn.execute("DELETE FROM chunk_embeddings").rowcount
+            conn.commit()
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+        return deleted
+
+
+class EmbeddingStage:
+    """
+    Embeds nodes in batches with bounded concurrency, before they are inserted into the index.
+    Rate-limit errors halve the number of concurrent requests and pause all workers with exponential
+    backoff (or the server's Retry-After); sustained success raises concurrency again. With a
+    checkpoint, finished batches survive a crash and are not embedded again on the next run.
+    """
+
+    def __init__(
+        self,
+        embed_model,
+        checkpoint: Optional[EmbeddingCheckpoint] = None,
+        batch_size: int = DEFAULT_EMBED_BATCH_SIZE,
+        max_concurrency: int = DEFAULT_EMBED_CONCURRENCY,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+    ):
+        self.embed_model = embed_model
+        self.checkpoint = checkpoint
+        self.batch_size = max(1, batch_size)
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+        self.stats = {"chunks": 0, "from_checkpoint": 0, "embedded": 0, "batches": 0, "rate_limited": 0, "elapsed_s": 0.0}
+
+    # --- Adaptive concurrency (AIMD) ---
+    async def _acquire(self) -> None:
+        while True:
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+                continue
+            async with self._condition:
+                if time.monotonic() < self._paused_until:
+                    continue
+                if self._active < self._limit:
+                    self._active += 1
+                    return
+                await self._condition.wait()
+
+    async def _release(self, rate_limited: bool, backoff: float = 0.0) -> None:
+        async with self._condition:
+            self._active -= 1
+            if rate_limited:
+                self._successes = 0
+                self._limit = max(1, self._limit // 2)
+                self._paused_until = max(self._paused_until, time.monotonic() + backoff)
+            else:
+                self._successes += 1
+                if self._successes >= SUCCESSES_PER_CONCURRENCY_STEP and self._limit < self.max_concurrency:
+                    self._limit += 1
+                    self._successes = 0
+            self._condition.notify_all()
+
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        backoff = INITIAL_BACKOFF_SECONDS
+        for attempt in range(self.max_retries + 1):
+            await self._acquire()
+            try:
+                embeddings = await self.embed_model.aget_text_embedding_batch(texts)
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt == self.max_retries:
+                    await self._release(rate_limited=False)
+                    raise
+                wait = retry_after_seconds(e) or backoff * (1 + random.random() * 0.25)
+                self.stats["rate_limited"] += 1
+                await self._release(rate_limited=True, backoff=wait)
+                print(f"Embedding rate limited ({e}); concurrency now {self._limit}, retrying in {wait:.1f}s.")
+                backoff = min(backoff * 2, MAX_BACKOFF_SECONDS)
+                continue
+            await self._release(rate_limited=False)
+            return embeddings
+
+    async def aembed_nodes(self, nodes: Sequence[BaseNode]) -> None:
+        """Sets node.embedding on every node, taking vectors from the checkpoint where possible."""
+        start = time.perf_counter()
+        self._condition = asyncio.Condition()
+        self._active, self._limit, self._successes, self._paused_until = 0, self.max_concurrency, 0, 0.0
+        model_name = self.embed_model.model_name
+
+        # Embed exactly what VectorStoreIndex would embed for the node
+        keys = [chunk_text_key(model_name, node.get_content(metadata_mode=MetadataMode.EMBED)) for node in nodes]
+        known = self.checkpoint.get_many(keys) if self.checkpoint is not None else {}
+        pending: Dict[str, List[BaseNode]] = {}
+        for node, key in zip(nodes, keys):
+            if key in known:
+                node.embedding = known[key]
+            else:
+                pending.setdefault(key, []).append(node) # Identical chunks are embedded once
+        reused = len(nodes) - sum(len(group) for group in pending.values())
+        self.stats["chunks"] += len(nodes)
+        self.stats["from_checkpoint"] += reused
+        print(f"Embedding stage: {len(nodes)} chunks, {reused} from checkpoint, {len(pending)} to embed "
+              f"(batch_size={self.batch_size}, max_concurrency={self.max_concurrency}).")
+
+        pending_keys = list(pending)
+        done = 0
+
+        async def run_batch(batch_keys: List[str]) -> None:
+            nonlocal done
+            texts = [pending[key][0].get_content(metadata_mode=MetadataMode.EMBED) for key in batch_keys]
+            embeddings = await self._embed_batch(texts)
+            for key, embedding in zip(batch_keys, embeddings):
+                for node in pending[key]:
+                    node.embedding = embedding
+            if self.checkpoint is not None:
+                self.checkpoint.put_many(model_name, dict(zip(batch_keys, embeddings)))
+            done += len(batch_keys)
+            self.stats["batches"] += 1
+            self.stats["embedded"] += len(batch_keys)
+            elapsed = time.perf_counter() - start
+            print(f"  Embedded {done}/{len(pending_keys)} chunks ({done / elapsed if elapsed > 0 else 0.0:.1f} chunks/s)")
+
+        batches = [pending_keys[i:i + self.batch_size] for i in range(0, len(pending_keys), self.batch_size)]
+        results = await asyncio.gather(*(run_batch(batch) for batch in batches), return_exceptions=True)
+        self.stats["elapsed_s"] += time.perf_counter() - start
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            # Completed batches are already checkpointed; the next run resumes from there
+            raise RuntimeError(f"{len(errors)} of {len(batches)} embedding batches failed, first error: {errors[0]}") from errors[0]
+        rate = self.stats["embedded"] / self.stats["elapsed_s"] if self.stats["elapsed_s"] > 0 else 0.0
+        print(f"Embedding stage finished: {self.stats['embedded']} chunks embedded in {self.stats['elapsed_s']:.1f}s "
+              f"({rate:.1f} chunks/s), {self.stats['rate_limited']} rate-limit retries.")
@@ -0,0 +1,104 @@
+import os
+import json
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+# --- Metadata Index Layout ---
+# Maps facet values derived from each node's file_path to packed bitsets over store rows,
+# so a filtered query only scores the rows it can return.
+METADATA_INDEX_FILE = "metadata_index.json"      # {facet: {value: bitset row}}, node_count
+METADATA_BITSETS_FILE = "metadata_bitsets.npy"   # uint8 (n_values, ceil(n_nodes / 8)), np.packbits rows
+
+# Facets, in the order they are exposed as tool arguments
+FACET_SOURCE_TYPE = "source_type"  # "web" for scraped pages, otherwise the file extension (pdf, csv, ...)
+FACET_DIRECTORY = "directory"      # directory of the file relative to the project root
+FACET_DOMAIN = "domain"            # website host for scraped pages
+FACET_FILE = "file"                # file name
+FACETS = [FACET_SOURCE_TYPE, FACET_DIRECTORY, FACET_DOMAIN, FACET_FILE]
+
+WEB_MARKDOWN_DIR = "ragdb/web_markdown"
+
+
+def describe_source(metadata: Dict[str, Any]) -> Dict[str, str]:
+    """Derives the facet values of a node from its metadata (file_path as written by make_rag.py)."""
+    file_path = metadata.get("file_path")
+    if not file_path:
+        return {}
+    file_path = file_path.replace(os.sep, "/")
+    directory, file_name = os.path.split(file_path)
+    facets = {FACET_DIRECTORY: directory, FACET_FILE: file_name}
+
+    if directory == WEB_MARKDOWN_DIR or directory.startswith(WEB_MARKDOWN_DIR + "/"):
+        facets[FACET_SOURCE_TYPE] = "web"
+        # make_rag.url_to_filename joins host and path with underscores
+        facets[FACET_DOMAIN] = os.path.splitext(file_name)[0].split("_")[0]
+    else:
+        facets[FACET_SOURCE_TYPE] = os.path.splitext(file_name)[1].lstrip(".").lower() or "unknown"
+    return facets
+
+
+def build_metadata_index(metadatas: Iterable[Dict[str, Any]], output_dir: str) -> int:
+    """Builds facet value -> row bitsets for the store rows (in order) and writes them to output_dir."""
+    rows_by_value: Dict[str, Dict[str, List[int]]] = {facet: {} for facet in FACETS}
+    node_count = 0
+    for row, metadata in enumerate(metadatas):
+        node_count = row + 1
+        for facet, value in describe_source(metadata).items():
+            rows_by_value[facet].setdefault(value, []).append(row)
+
+    index: Dict[str, Dict[str, int]] = {facet: {} for facet in FACETS}
+    bitsets = []
+    for facet in FACETS:
+        for value in sorted(rows_by_value[facet]):
+            mask = np.zeros(node_count, dtype=bool)
+            mask[rows_by_value[facet][value]] = True
+            index[facet][value] = len(bitsets)
+            bitsets.append(np.packbits(mask))
+
+    os.makedirs(output_dir, exist_ok=True)
+    packed = np.stack(bitsets) if bitsets else np.zeros((0, (node_count + 7) // 8), dtype=np.uint8)
+    np.save(os.path.join(output_dir, METADATA_BITSETS_FILE), packed)
+    with open(os.path.join(output_dir, METADATA_INDEX_FILE), "w", encoding="utf-8") as f:
+        json.dump({"node_count": node_count, "facets": index}, f, indent=4)
+
+    print(f"Wrote metadata index with {len(bitsets)} facet values over {node_count} nodes to {output_dir}")
+    return len(bitsets)
+
+
+class MetadataIndex:
+    """Resolves facet filters to the store rows they allow."""
+
+    def __init__(self, store_dir: str):
+        with open(os.path.join(store_dir, METADATA_INDEX_FILE), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self.node_count = data["node_count"]
+        self.facets: Dict[str, Dict[str, int]] = data["facets"]
+        self.bitsets = np.load(os.path.join(store_dir, METADATA_BITSETS_FILE), mmap_mode="r")
+
+    @classmethod
+    def exists(cls, store_dir: str) -> bool:
+        """Checks whether a metadata index is present in store_dir."""
+        return all(os.path.exists(os.path.join(store_dir, name)) for name in [METADATA_INDEX_FILE, METADATA_BITSETS_FILE])
+
+    def facet_values(self, facet: str) -> List[str]:
+        return sorted(self.facets.get(facet, {}))
+
+    def candidate_rows(self, filters: Dict[str, Optional[str]]) -> Optional[np.ndarray]:
+        """
+        Rows matching all given facets. Within a facet, a filter matches every value that contains it
+        (case-insensitive), e.g. file="policy" selects all policy documents.
+        Returns None when no filter is set, meaning every row is allowed.
+        """
+        active = {facet: value for facet, value in filters.items() if value}
+        if not active:
+            return None
+
+        allowed = np.ones((self.node_count + 7) // 8, dtype=np.uint8) * 0xFF
+        for facet, wanted in active.items():
+            wanted = str(wanted).casefold()
+            matching = [bit_row for value, bit_row in self.facets.get(facet, {}).items() if wanted in value.casefold()]
+            if not matching:
+                return np.empty(0, dtype=np.int64)
+            allowed &= np.bitwise_or.reduce(np.asarray(self.bitsets[matching]), axis=0)
+        return np.flatnonzero(np.unpackbits(allowed, count=self.node_count))
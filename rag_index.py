@@ -0,0 +1,54 @@
+import os
+import shutil
+from typing import Optional
+
+import numpy as np
+from llama_index.core.node_parser import SentenceSplitter
+
+from rag_store import EMBEDDINGS_FILE, MMAP_STORE_SUBDIR, iter_index_records, iter_store_records, write_mmap_store
+from rag_bm25 import build_bm25_index
+from rag_ann import ANN_MIN_NODES, build_ivf_index
+from rag_filters import build_metadata_index
+
+# --- Chunking ---
+# Shared by ragdb/make_rag.py and the offline benchmarks so both index the corpus the same way
+CHUNK_SIZE = 512
+CHUNK_OVERLAP = 20
+
+
+def create_node_parser(chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> SentenceSplitter:
+    return SentenceSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+
+def build_query_indexes(mmap_store_dir: str, ann_nlist: Optional[int] = None, ann_min_nodes: int = ANN_MIN_NODES) -> None:
+    """
+    Builds the indexes tools.py reads next to a finished memory-mapped store: BM25, the metadata
+    filter bitsets and (for large corpora) the IVF index. Reads the store back row by row.
+    """
+    build_bm25_index((record["text"] for record in iter_store_records(mmap_store_dir)), mmap_store_dir)
+    build_metadata_index((record["metadata"] for record in iter_store_records(mmap_store_dir)), mmap_store_dir)
+    build_ivf_index(
+        np.load(os.path.join(mmap_store_dir, EMBEDDINGS_FILE), mmap_mode="r"),
+        mmap_store_dir,
+        nlist=ann_nlist,
+        min_nodes=ann_min_nodes,
+    )
+
+
+def write_query_indexes(
+    index,
+    persist_dir: str,
+    embed_model_name: Optional[str] = None,
+    ann_nlist: Optional[int] = None,
+    ann_min_nodes: int = ANN_MIN_NODES,
+) -> str:
+    """
+    Writes everything tools.py reads at query time next to a persisted LlamaIndex index: the
+    memory-mapped store plus build_query_indexes. Returns the memory-mapped store directory.
+    """
+    mmap_store_dir = os.path.join(persist_dir, MMAP_STORE_SUBDIR)
+    # Start clean: files from an earlier build (e.g. an IVF index the corpus no longer needs) must not survive
+    shutil.rmtree(mmap_store_dir, ignore_errors=True)
+    write_mmap_store(iter_index_records(index), mmap_store_dir, embed_model_name=embed_model_name)
+    build_query_indexes(mmap_store_dir, ann_nlist=ann_nlist, ann_min_nodes=ann_min_nodes)
+    return mmap_store_dir
@@ -0,0 +1,95 @@
+import os
+import json
+import hashlib
+from typing import Dict, Iterable, List, Optional
+
+# --- Ingest Manifest ---
+# Persisted next to the index (and uploaded with it) so the next make_rag.py run knows which
+# source files are already embedded: {file_path: {"sha256": ..., "node_ids": [...], "duplicates_of": [...]}}.
+# duplicates_of lists the files whose chunks some of the file's chunks were dropped as near-duplicates of.
+INGEST_MANIFEST_FILE = "ingest_manifest.json"
+INGEST_MANIFEST_VERSION = 2 # 1 had no duplicates_of; such an index is rebuilt once
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Returns the hex sha256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class IngestManifest:
+    """
+    Content hashes of the ingested source files and the node IDs each one produced.
+    settings (embedding model, chunking) must match for an index to be updated incrementally;
+    otherwise every stored embedding is stale and the corpus has to be rebuilt.
+    """
+
+    def __init__(self, settings: Dict, documents: Optional[Dict[str, Dict]] = None):
+        self.settings = settings
+        self.documents: Dict[str, Dict] = documents or {}
+
+    @classmethod
+    def load(cls, persist_dir: str) -> Optional["IngestManifest"]:
+        path = os.path.join(persist_dir, INGEST_MANIFEST_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != INGEST_MANIFEST_VERSION:
+            print(f"Ignoring ingest manifest with unsupported version {data.get('version')}.")
+            return None
+        return cls(data["settings"], data["documents"])
+
+    def save(self, persist_dir: str) -> None:
+        os.makedirs(persist_dir, exist_ok=True)
+        with open(os.path.join(persist_dir, INGEST_MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump({"version": INGEST_MANIFEST_VERSION, "settings": self.settings, "documents": self.documents}, f, indent=4)
+
+    def matches(self, settings: Dict) -> bool:
+        return self.settings == settings
+
+    def plan(self, current_hashes: Dict[str, str]) -> Dict[str, List[str]]:
+        """
+        Splits the current source files (file_path -> sha256) into added/changed/unchanged, plus removed
+        files. Unchanged files that dropped chunks as near-duplicates of a changed or removed file (directly,
+        or through another such file) are moved to "dependent": they must be ingested again, or the chunks
+        they dropped would be lost along with the chunks they duplicated.
+        """
+        plan = {"added": [], "changed": [], "unchanged": [], "dependent": [], "removed": []}
+        for file_path, sha256 in sorted(current_hashes.items()):
+            entry = self.documents.get(file_path)
+            if entry is None:
+                plan["added"].append(file_path)
+            elif entry["sha256"] != sha256:
+                plan["changed"].append(file_path)
+            else:
+                plan["unchanged"].append(file_path)
+        plan["removed"] = sorted(set(self.documents) - set(current_hashes))
+
+        unchanged = set(plan["unchanged"])
+        reingested = set(plan["changed"]) | set(plan["removed"])
+        while True:
+            dependent = {
+                file_path for file_path in unchanged
+                if reingested.intersection(self.documents[file_path].get("duplicates_of", ()))
+            }
+            if not dependent:
+                break
+            unchanged -= dependent
+            reingested |= dependent
+            plan["dependent"].extend(sorted(dependent))
+        plan["unchanged"] = sorted(unchanged)
+        return plan
+
+    def node_ids(self, file_paths: Iterable[str]) -> List[str]:
+        """Node IDs recorded for the given files."""
+        return [node_id for file_path in file_paths for node_id in self.documents.get(file_path, {}).get("node_ids", [])]
+
+    def record(self, file_path: str, sha256: str, node_ids: List[str], duplicates_of: Iterable[str] = ()) -> None:
+        self.documents[file_path] = {"sha256": sha256, "node_ids": node_ids, "duplicates_of": sorted(set(duplicates_of) - {file_path})}
+
+    def forget(self, file_path: str) -> None:
+        self.documents.pop(file_path, None)
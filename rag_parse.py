@@ -0,0 +1,142 @@
+import os
+import time
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from llama_index.core import SimpleDirectoryReader
+from llama_index.core.schema import TextNode
+
+from rag_index import CHUNK_SIZE, CHUNK_OVERLAP, create_node_parser
+
+# Default worker count for parsing and chunking; one process per core
+DEFAULT_PARSE_WORKERS = os.cpu_count() or 1
+
+
+def relative_path_metadata(filename: str, project_root: str) -> dict:
+    """Generates metadata including the file path relative to project_root."""
+    try:
+        relative_path = os.path.relpath(filename, start=project_root)
+        return {"file_path": relative_path}
+    except ValueError:
+        print(f"Warning: File {filename} is outside project root. Storing absolute path.")
+        return {"file_path": filename}
+    except Exception as e:
+        print(f"Error generating relative path for {filename}: {e}. Storing absolute path.")
+        return {"file_path": filename}
+
+
+# --- Worker side ---
+# Set once per worker process by _init_worker, so each task only carries file paths
+_worker_settings: Dict = {}
+_worker_node_parser = None
+
+
+def _init_worker(project_root: str, chunk_size: int, chunk_overlap: int) -> None:
+    global _worker_node_parser
+    _worker_settings.update(project_root=project_root)
+    _worker_node_parser = create_node_parser(chunk_size, chunk_overlap)
+
+
+def _parse_file(path: str) -> Tuple[str, Optional[str], List[dict], Dict[str, float]]:
+    """
+    Loads and chunks one file. Returns (path, error, nodes as dicts, timings): only the chunks travel
+    back to the parent, never the full document text. timings holds the wall and CPU seconds this
+    worker spent loading (e.g. PDF text extraction) and chunking, and the file and text sizes.
+    """
+    project_root = _worker_settings["project_root"]
+    timings = {"load_s": 0.0, "load_cpu_s": 0.0, "chunk_s": 0.0, "chunk_cpu_s": 0.0, "file_bytes": 0, "text_bytes": 0}
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        timings["file_bytes"] = os.path.getsize(path)
+        reader = SimpleDirectoryReader(
+            input_files=[path],
+            file_metadata=lambda filename: relative_path_metadata(filename, project_root),
+        )
+        documents = reader.load_data()
+    except Exception as e:
+        return path, f"{type(e).__name__}: {e}", [], timings
+    finally:
+        timings["load_s"], timings["load_cpu_s"] = time.perf_counter() - wall_start, time.process_time() - cpu_start
+    timings["text_bytes"] = sum(len(document.text.encode("utf-8")) for document in documents)
+
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    nodes = _worker_node_parser.get_nodes_from_documents(documents)
+    node_dicts = [node.to_dict() for node in nodes]
+    timings["chunk_s"], timings["chunk_cpu_s"] = time.perf_counter() - wall_start, time.process_time() - cpu_start
+    return path, None, node_dicts, timings
+
+
+# --- Parent side ---
+def iter_parse_files(
+    paths: Sequence[str],
+    project_root: str,
+    workers: int = DEFAULT_PARSE_WORKERS,
+    chunk_size: int = CHUNK_SIZE,
+    chunk_overlap: int = CHUNK_OVERLAP,
+    max_pending: Optional[int] = None,
+) -> Iterator[Tuple[str, Optional[str], List[TextNode], Dict[str, float]]]:
+    """
+    Loads and chunks files across a process pool, yielding (path, error, nodes, timings) in input
+    order; timings are the worker-side measurements of _parse_file.
+    At most max_pending files (default 2 per worker) are parsed ahead of the consumer, so a slow
+    consumer holds back the workers instead of letting parsed chunks pile up in memory.
+    """
+    workers = max(1, min(workers, len(paths) or 1))
+    if workers == 1:
+        _init_worker(project_root, chunk_size, chunk_overlap)
+        for path in paths:
+            path, error, node_dicts, timings = _parse_file(path)
+            yield path, error, [TextNode.from_dict(node_dict) for node_dict in node_dicts], timings
+        return
+
+    max_pending = max(1, max_pending or 2 * workers)
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(project_root, chunk_size, chunk_overlap),
+    ) as executor:
+        pending = deque()
+        remaining = iter(paths)
+        for path in itertools.islice(remaining, max_pending):
+            pending.append(executor.submit(_parse_file, path))
+        while pending:
+            path, error, node_dicts, timings = pending.popleft().result()
+            next_path = next(remaining, None)
+            if next_path is not None:
+                pending.append(executor.submit(_parse_file, next_path))
+            yield path, error, [TextNode.from_dict(node_dict) for node_dict in node_dicts], timings
+
+
+def parse_files(
+    paths: Sequence[str],
+    project_root: str,
+    workers: int = DEFAULT_PARSE_WORKERS,
+    chunk_size: int = CHUNK_SIZE,
+    chunk_overlap: int = CHUNK_OVERLAP,
+) -> Tuple[List[TextNode], List[str]]:
+    """
+    Loads and chunks all files across a process pool (largest files first, so long PDFs do not end
+    up last). Returns (nodes in input file order, paths that failed to load).
+    """
+    start = time.perf_counter()
+    by_size = sorted(paths, key=lambda path: os.path.getsize(path), reverse=True)
+    results: Dict[str, Tuple[Optional[str], List[TextNode]]] = {}
+    for path, error, file_nodes, _ in iter_parse_files(by_size, project_root, workers, chunk_size, chunk_overlap, max_pending=len(paths)):
+        results[path] = (error, file_nodes)
+
+    nodes: List[TextNode] = []
+    failed: List[str] = []
+    for path in paths:
+        error, file_nodes = results[path]
+        if error is not None:
+            print(f"Error loading {path}: {error}")
+            failed.append(path)
+            continue
+        nodes.extend(file_nodes)
+
+    elapsed = time.perf_counter() - start
+    print(f"Parsed {len(paths) - len(failed)} files into {len(nodes)} nodes with {max(1, min(workers, len(paths)))} worker(s) "
+          f"in {elapsed:.1f}s ({len(paths) / elapsed if elapsed > 0 else 0.0:.1f} files/s).")
+    return nodes, failed
@@ -0,0 +1,129 @@
+import time
+from typing import Callable, Collection, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from llama_index.core.schema import TextNode
+
+from rag_dedupe import NearDuplicateFilter
+from rag_embed import EmbeddingStage
+from rag_index import CHUNK_SIZE, CHUNK_OVERLAP
+from rag_parse import DEFAULT_PARSE_WORKERS, iter_parse_files
+from rag_profile import StageProfiler
+from rag_store import MmapStoreWriter, iter_store_records
+
+# --- Streaming Ingestion Defaults ---
+# Chunks embedded and appended to the store per step; together with the parse window this bounds
+# how much text and how many vectors are held in memory at any time, whatever the corpus size
+DEFAULT_PIPELINE_BATCH_CHUNKS = 256
+
+
+def iter_carried_over_records(store_dir: str, keep_files: Collection[str]) -> Iterator[Dict]:
+    """Yields the rows of a previously written store whose file_path is in keep_files, one at a time."""
+    keep_files = set(keep_files)
+    for record in iter_store_records(store_dir):
+        if record["metadata"].get("file_path") in keep_files:
+            yield record
+
+
+def chunk_key(file_path: str, suffix) -> str:
+    """Key of a chunk in a NearDuplicateFilter; chunk_key_file() recovers the file it came from."""
+    return f"{file_path}#{suffix}"
+
+
+def chunk_key_file(key: str) -> str:
+    return key.rpartition("#")[0]
+
+
+def node_record(node: TextNode) -> Dict:
+    return {"id": node.node_id, "text": node.get_content(), "metadata": node.metadata, "embedding": node.embedding}
+
+
+async def stream_ingest(
+    paths: Sequence[str],
+    project_root: str,
+    embedding_stage: EmbeddingStage,
+    writer: MmapStoreWriter,
+    on_file_done: Optional[Callable[[str, List[str], List[str]], None]] = None,
+    workers: int = DEFAULT_PARSE_WORKERS,
+    chunk_size: int = CHUNK_SIZE,
+    chunk_overlap: int = CHUNK_OVERLAP,
+    batch_chunks: int = DEFAULT_PIPELINE_BATCH_CHUNKS,
+    chunk_filter: Optional[NearDuplicateFilter] = None,
+    profiler: Optional[StageProfiler] = None,
+) -> List[str]:
+    """
+    Load -> split -> embed -> append, in bounded batches. Parsed files are gathered until about
+    batch_chunks chunks are waiting, which are then embedded, appended to writer and dropped;
+    meanwhile the parse workers run at most a few files ahead (see iter_parse_files).
+    on_file_done(path, node_ids, duplicates_of) is called once all chunks of a file are in the store.
+    With chunk_filter, chunks that nearly duplicate an earlier chunk (shared navigation, footers,
+    repeated boilerplate) are dropped before they are embedded; duplicates_of then lists the other
+    files (file_path metadata, see chunk_key) whose chunks they duplicated.
+    With profiler, each step is recorded as an "ingest/..." stage: parse_wait (waiting for the
+    workers), load and chunk (worker-side, summed over workers), dedupe, embed and store_append.
+    Returns the paths that failed to load.
+    """
+    profiler = profiler or StageProfiler()
+    start = time.perf_counter()
+    failed: List[str] = []
+    batch: List[TextNode] = []
+    batch_files: List[Tuple[str, List[str], List[str]]] = []
+    files_done, chunks_done = 0, 0
+
+    async def flush():
+        nonlocal files_done, chunks_done
+        if batch:
+            with profiler.stage("ingest/embed") as stats:
+                await embedding_stage.aembed_nodes(batch)
+                stats.count(len(batch), sum(len(node.get_content().encode("utf-8")) for node in batch))
+            with profiler.stage("ingest/store_append") as stats:
+                stats.count(writer.append(node_record(node) for node in batch))
+        for path, node_ids, duplicates_of in batch_files:
+            if on_file_done is not None:
+                on_file_done(path, node_ids, duplicates_of)
+        files_done += len(batch_files)
+        chunks_done += len(batch)
+        batch.clear()
+        batch_files.clear()
+        elapsed = time.perf_counter() - start
+        print(f"  Ingested {files_done}/{len(paths)} files, {chunks_done} chunks "
+              f"({chunks_done / elapsed if elapsed > 0 else 0.0:.1f} chunks/s)")
+
+    parsed = iter_parse_files(paths, project_root, workers, chunk_size, chunk_overlap)
+    while True:
+        with profiler.stage("ingest/parse_wait") as stats:
+            result = next(parsed, None)
+            if result is not None:
+                stats.count(1)
+        if result is None:
+            break
+        path, error, nodes, timings = result
+        profiler.record("ingest/load", timings["load_s"], timings["load_cpu_s"], items=1, bytes=timings["file_bytes"])
+        if error is not None:
+            print(f"Error loading {path}: {error}")
+            failed.append(path)
+            continue
+        profiler.record("ingest/chunk", timings["chunk_s"], timings["chunk_cpu_s"], items=len(nodes), bytes=timings["text_bytes"])
+        duplicates_of = set()
+        if chunk_filter is not None:
+            with profiler.stage("ingest/dedupe") as stats:
+                stats.count(len(nodes))
+                kept = []
+                for position, node in enumerate(nodes):
+                    duplicate_of = chunk_filter.check(chunk_key(node.metadata.get("file_path", path), position), node.get_content())
+                    if duplicate_of is None:
+                        kept.append(node)
+                    else:
+                        duplicates_of.add(chunk_key_file(duplicate_of))
+                nodes = kept
+        batch.extend(nodes)
+        batch_files.append((path, [node.node_id for node in nodes], sorted(duplicates_of)))
+        if len(batch) >= batch_chunks:
+            await flush()
+    if batch_files:
+        await flush()
+
+    print(f"Streamed {files_done} files ({chunks_done} chunks) into the store in {time.perf_counter() - start:.1f}s, "
+          f"{len(failed)} failed to load.")
+    if chunk_filter is not None:
+        print(chunk_filter.summary())
+    return failed
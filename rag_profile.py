@@ -0,0 +1,123 @@
+import os
+import sys
+import json
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterator, List
+
+try:
+    import resource
+except ImportError: # Windows: no rusage, memory columns stay 0
+    resource = None
+
+
+def _peak_rss_mb(who=None) -> float:
+    """High-water mark of resident memory (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF if who is None else who).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _children_cpu_s() -> float:
+    """CPU time of finished child processes (e.g. a parse pool once it has shut down)."""
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+@dataclass
+class StageStats:
+    """Accumulated measurements of one named stage; a stage may run many times (e.g. once per batch)."""
+    name: str
+    calls: int = 0
+    wall_s: float = 0.0
+    cpu_s: float = 0.0          # this process, all threads
+    child_cpu_s: float = 0.0    # worker processes that finished during the stage
+    items: int = 0
+    bytes: int = 0
+    peak_rss_mb: float = 0.0    # process high-water mark when the stage last ended
+    rss_growth_mb: float = 0.0  # how far the stage pushed that high-water mark up
+
+    def count(self, items: int = 0, bytes: int = 0) -> None:
+        self.items += items
+        self.bytes += bytes
+
+
+class StageProfiler:
+    """
+    Wall time, CPU time, items, bytes and peak memory per ingestion stage. Stages are named with
+    "/" for nesting ("ingest/embed"); the summary indents them accordingly. Stages measured
+    elsewhere (e.g. inside worker processes) are added with record().
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self._stages: Dict[str, StageStats] = {}
+
+    def _get(self, name: str) -> StageStats:
+        if name not in self._stages:
+            self._stages[name] = StageStats(name)
+        return self._stages[name]
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[StageStats]:
+        stats = self._get(name)
+        wall_start, cpu_start, children_start = time.perf_counter(), time.process_time(), _children_cpu_s()
+        peak_start = _peak_rss_mb()
+        try:
+            yield stats
+        finally:
+            stats.calls += 1
+            stats.wall_s += time.perf_counter() - wall_start
+            stats.cpu_s += time.process_time() - cpu_start
+            stats.child_cpu_s += _children_cpu_s() - children_start
+            stats.peak_rss_mb = _peak_rss_mb()
+            stats.rss_growth_mb += stats.peak_rss_mb - peak_start
+
+    def record(self, name: str, wall_s: float = 0.0, cpu_s: float = 0.0, items: int = 0, bytes: int = 0) -> None:
+        stats = self._get(name)
+        stats.calls += 1
+        stats.wall_s += wall_s
+        stats.cpu_s += cpu_s
+        stats.count(items, bytes)
+
+    def report(self) -> Dict:
+        return {
+            "started_at": self.started_at,
+            "total_wall_s": time.perf_counter() - self._start,
+            "cpu_count": os.cpu_count(),
+            "peak_rss_mb": _peak_rss_mb(),
+            "peak_child_rss_mb": _peak_rss_mb(resource.RUSAGE_CHILDREN) if resource is not None else 0.0,
+            "stages": [asdict(stats) for stats in self._stages.values()],
+        }
+
+    def write_json(self, path: str) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=4)
+        print(f"Profiling report written to {path}")
+
+    def summary_table(self) -> str:
+        report = self.report()
+        total = report["total_wall_s"] or 1.0
+        header = f"{'Stage':<28} {'Calls':>6} {'Wall s':>9} {'% wall':>7} {'CPU s':>9} {'Child CPU s':>11} {'Items':>9} {'MiB':>9} {'Items/s':>9} {'Peak RSS MiB':>12}"
+        lines: List[str] = [header, "-" * len(header)]
+        for stats in report["stages"]:
+            depth = stats["name"].count("/")
+            label = ("  " * depth + stats["name"].rsplit("/", 1)[-1])[:28]
+            rate = stats["items"] / stats["wall_s"] if stats["wall_s"] > 0 and stats["items"] else 0.0
+            # Stages added with record() were measured elsewhere and have no memory figures
+            peak = f"{stats['peak_rss_mb']:>12.1f}" if stats["peak_rss_mb"] else f"{'-':>12}"
+            lines.append(
+                f"{label:<28} {stats['calls']:>6} {stats['wall_s']:>9.2f} {100 * stats['wall_s'] / total:>6.1f}% "
+                f"{stats['cpu_s']:>9.2f} {stats['child_cpu_s']:>11.2f} {stats['items']:>9} {stats['bytes'] / (1024 * 1024):>9.2f} "
+                f"{rate:>9.1f} {peak}"
+            )
+        lines.append("-" * len(header))
+        lines.append(f"Total wall time {report['total_wall_s']:.2f}s, peak RSS {report['peak_rss_mb']:.1f} MiB "
+                     f"(largest worker process {report['peak_child_rss_mb']:.1f} MiB).")
+        return "\n".join(lines)
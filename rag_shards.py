@@ -0,0 +1,232 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+from rag_snapshot import SNAPSHOT_MANIFEST_FILE, SnapshotCache, _write_json_atomic
+
+# --- Sharded Store Layout ---
+# How a built index directory is published to the dataset repository:
+# <path_prefix>/store_manifest.json   {"version", "shard_size", "files": {relative_path: {"size", "shards": [sha256, ...], "shard_sizes": [...]}}}
+# <path_prefix>/shards/<sha256>       content-addressed pieces of the files
+# A file is the concatenation of its shards. Shard boundaries are content-defined (a rolling hash over
+# the last SHARD_WINDOW bytes picks them, averaging about shard_size), so inserting or deleting rows only
+# changes the shards around the edit; the shards before and after it are uploaded and downloaded once.
+# Files rewritten as a whole still change entirely: e.g. the int8 codes are all requantized whenever
+# the per-dimension scales move, and the ANN/BM25 indexes are rebuilt from scratch.
+STORE_MANIFEST_FILE = "store_manifest.json"
+STORE_MANIFEST_VERSION = 2 # 1: fixed-size shards of shard_size bytes, still readable
+SHARDS_SUBDIR = "shards"
+DEFAULT_SHARD_SIZE = 16 * 1024 * 1024
+SHARD_WINDOW = 16
+HASH_BLOCK_SIZE = 8 * 1024 * 1024
+
+# Random 32-bit value per byte for the gear hash; fixed, since boundaries must be the same in every build
+_GEAR = np.random.RandomState(0x5EED).randint(0, 2 ** 32, size=256, dtype=np.uint64).astype(np.uint32)
+
+
+def _boundary_candidates(data: np.ndarray, offset: int, mask: np.uint32) -> np.ndarray:
+    """
+    Absolute end offsets of data[i] where the gear hash of the SHARD_WINDOW bytes ending at data[i]
+    has its masked (top) bits all zero. Skips the first SHARD_WINDOW - 1 positions, whose window is incomplete.
+    """
+    gear = _GEAR[data]
+    rolling = gear.copy()
+    shifted = np.empty_like(gear)
+    for j in range(1, SHARD_WINDOW):
+        np.left_shift(gear[:len(data) - j], np.uint32(j), out=shifted[:len(data) - j])
+        np.add(rolling[j:], shifted[:len(data) - j], out=rolling[j:])
+    hits = np.flatnonzero((rolling[SHARD_WINDOW - 1:] & mask) == 0) + SHARD_WINDOW - 1
+    return hits + offset + 1
+
+
+def file_shard_sizes(path: str, shard_size: int) -> List[int]:
+    """
+    Content-defined shard lengths of a file: between shard_size // 4 and 4 * shard_size bytes,
+    about shard_size on average. An empty file has no shards.
+    """
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    min_size, max_size = max(1, shard_size // 4), 4 * shard_size
+    bits = min(31, max(1, int(np.log2(max(2, shard_size - min_size)))))
+    mask = np.uint32(((1 << bits) - 1) << (32 - bits))
+
+    data = np.memmap(path, dtype=np.uint8, mode="r")
+    candidates = []
+    for start in range(0, size, HASH_BLOCK_SIZE):
+        # Each block re-reads the window before it, so the hash is the same as over the whole file
+        lookback = min(start, SHARD_WINDOW - 1)
+        block = np.asarray(data[start - lookback:start + HASH_BLOCK_SIZE])
+        found = _boundary_candidates(block, start - lookback, mask)
+        candidates.append(found[found > start] if lookback else found)
+    del data
+
+    sizes, shard_start = [], 0
+    for cut in np.concatenate(candidates).tolist() + [size]:
+        while cut - shard_start > max_size:
+            sizes.append(max_size)
+            shard_start += max_size
+        if cut - shard_start >= min_size or cut == size:
+            if cut > shard_start:
+                sizes.append(cut - shard_start)
+            shard_start = cut
+    return sizes
+
+
+def iter_file_shards(path: str, shard_size: int) -> Iterator[Tuple[str, bytes]]:
+    """Yields (sha256, bytes) for the consecutive content-defined shards of a file."""
+    with open(path, "rb") as f:
+        for length in file_shard_sizes(path, shard_size):
+            data = f.read(length)
+            yield hashlib.sha256(data).hexdigest(), data
+
+
+def publish_sharded_store(
+    local_dir: str,
+    transport,
+    path_prefix: str,
+    shard_size: int = DEFAULT_SHARD_SIZE,
+    message: str = "Update RAG index",
+) -> Dict[str, int]:
+    """
+    Publishes every file under local_dir as shards plus a store manifest under path_prefix, in a
+    single commit: shards the remote already has are not uploaded again, and files under
+    path_prefix the new manifest no longer references (old shards, an unsharded layout) are deleted.
+    Returns upload statistics.
+    """
+    path_prefix = path_prefix.strip("/")
+    shard_prefix = f"{path_prefix}/{SHARDS_SUBDIR}/"
+    revision = transport.get_revision()
+    remote_files = transport.list_files(revision, path_prefix)
+    remote_shards = {path[len(shard_prefix):] for path in remote_files if path.startswith(shard_prefix)}
+
+    manifest = {"version": STORE_MANIFEST_VERSION, "shard_size": shard_size, "files": {}}
+    stats = {"files": 0, "shards": 0, "uploaded_shards": 0, "uploaded_bytes": 0, "deleted_files": 0}
+    with tempfile.TemporaryDirectory() as staging_dir:
+        additions: Dict[str, str] = {}
+        referenced = set()
+        for dirpath, dirnames, filenames in os.walk(local_dir):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                path = os.path.join(dirpath, filename)
+                relative_path = os.path.relpath(path, local_dir).replace(os.sep, "/")
+                shards, shard_sizes = [], []
+                for sha256, data in iter_file_shards(path, shard_size):
+                    shards.append(sha256)
+                    shard_sizes.append(len(data))
+                    path_in_repo = shard_prefix + sha256
+                    if sha256 not in remote_shards and path_in_repo not in additions:
+                        staged_path = os.path.join(staging_dir, sha256)
+                        with open(staged_path, "wb") as f:
+                            f.write(data)
+                        additions[path_in_repo] = staged_path
+                        stats["uploaded_bytes"] += len(data)
+                    referenced.add(path_in_repo)
+                manifest["files"][relative_path] = {"size": os.path.getsize(path), "shards": shards, "shard_sizes": shard_sizes}
+                stats["files"] += 1
+
+        manifest_path = os.path.join(staging_dir, STORE_MANIFEST_FILE)
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=4)
+        additions[f"{path_prefix}/{STORE_MANIFEST_FILE}"] = manifest_path
+        referenced.add(f"{path_prefix}/{STORE_MANIFEST_FILE}")
+
+        deletions = sorted(path for path in remote_files if path not in referenced)
+        stats["shards"] = len(referenced) - 1
+        stats["uploaded_shards"] = len(additions) - 1
+        stats["deleted_files"] = len(deletions)
+        transport.commit(additions, deletions, message, parent_revision=revision)
+
+    print(f"Published {stats['files']} files as {stats['shards']} shards: uploaded {stats['uploaded_shards']} new shards "
+          f"({stats['uploaded_bytes'] / (1024 * 1024):.1f} MiB), deleted {stats['deleted_files']} unreferenced files.")
+    return stats
+
+
+def _shard_sizes(manifest: Dict, info: Dict) -> List[int]:
+    """Shard lengths of one manifest file entry; version 1 manifests used fixed-size shards."""
+    if "shard_sizes" in info:
+        return info["shard_sizes"]
+    shard_size = manifest["shard_size"]
+    return [min(shard_size, info["size"] - position * shard_size) for position in range(len(info["shards"]))]
+
+
+class ShardedSnapshotCache(SnapshotCache):
+    """
+    SnapshotCache for a store published with publish_sharded_store: files are reassembled from
+    their shards, taking every shard the previous snapshot already has from its files and only
+    downloading the rest. Revisions without a store manifest are mirrored file by file as before.
+    """
+
+    def _previous_shards(self) -> Dict[str, Tuple[str, int, int]]:
+        """Maps each shard of the last good snapshot to (local file, offset, length)."""
+        revision = self.current_revision()
+        manifest = self._read_manifest(revision) if revision else None
+        if not manifest or manifest.get("version") not in (1, STORE_MANIFEST_VERSION) or "files" not in manifest:
+            return {}
+        located = {}
+        for relative_path, info in manifest["files"].items():
+            path = os.path.join(self.local_path(revision), relative_path)
+            offset = 0
+            for sha256, length in zip(info["shards"], _shard_sizes(manifest, info)):
+                located.setdefault(sha256, (path, offset, length))
+                offset += length
+        return located
+
+    def _build_snapshot(self, revision: str) -> None:
+        remote_files = self.transport.list_files(revision, self.path_prefix)
+        if f"{self.path_prefix}/{STORE_MANIFEST_FILE}" not in remote_files:
+            super()._build_snapshot(revision)
+            return
+
+        snapshot_dir = self._snapshot_dir(revision)
+        staging_dir = os.path.join(snapshot_dir, ".shards")
+        os.makedirs(staging_dir, exist_ok=True)
+        manifest_path = os.path.join(staging_dir, STORE_MANIFEST_FILE)
+        self.transport.download(revision, f"{self.path_prefix}/{STORE_MANIFEST_FILE}", manifest_path)
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version") not in (1, STORE_MANIFEST_VERSION):
+            raise RuntimeError(f"Unsupported store manifest version {manifest.get('version')}")
+
+        previous = self._previous_shards()
+        reused, downloaded, downloaded_bytes = 0, 0, 0
+        for relative_path, info in manifest["files"].items():
+            dest_path = os.path.join(self.local_path(revision), relative_path)
+            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+            with open(dest_path, "wb") as out:
+                for sha256 in info["shards"]:
+                    data = None
+                    if sha256 in previous:
+                        path, offset, length = previous[sha256]
+                        with open(path, "rb") as f:
+                            f.seek(offset)
+                            data = f.read(length)
+                        if hashlib.sha256(data).hexdigest() == sha256:
+                            reused += 1
+                        else:
+                            # The previous snapshot was modified or truncated locally; fetch the shard instead
+                            print(f"Shard {sha256} in the previous snapshot is corrupt, downloading it.")
+                            data = None
+                    if data is None:
+                        staged_path = os.path.join(staging_dir, sha256)
+                        if not os.path.exists(staged_path):
+                            self.transport.download(revision, f"{self.path_prefix}/{SHARDS_SUBDIR}/{sha256}", staged_path)
+                            downloaded += 1
+                            downloaded_bytes += os.path.getsize(staged_path)
+                        with open(staged_path, "rb") as f:
+                            data = f.read()
+                        if hashlib.sha256(data).hexdigest() != sha256:
+                            raise RuntimeError(f"Shard {sha256} of {relative_path} is corrupt")
+                    out.write(data)
+
+        shutil.rmtree(staging_dir)
+        # The manifest is written last, so a snapshot without one is treated as incomplete
+        _write_json_atomic(os.path.join(snapshot_dir, SNAPSHOT_MANIFEST_FILE), manifest)
+        print(f"Snapshot for revision {revision}: downloaded {downloaded} shards ({downloaded_bytes / (1024 * 1024):.1f} MiB), "
+              f"reused {reused} shards from the previous snapshot.")
+
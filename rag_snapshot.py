@@ -0,0 +1,275 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+from typing import Dict, List, Optional
+
+from huggingface_hub import CommitOperationAdd, CommitOperationDelete, HfApi, hf_hub_download
+from huggingface_hub.hf_api import RepoFile
+from huggingface_hub.utils import EntryNotFoundError
+
+# --- Snapshot Cache Layout ---
+# <cache_dir>/snapshots/<revision>/<path_in_repo...>   files of one dataset revision
+# <cache_dir>/snapshots/<revision>/.snapshot_manifest.json   {path_in_repo: file_id} for that revision
+# <cache_dir>/current.json   {"revision": ..., "previous": ...}: the last snapshot that was fully downloaded
+#                            and the one served before it, which is kept until the next revision arrives
+SNAPSHOTS_SUBDIR = "snapshots"
+SNAPSHOT_MANIFEST_FILE = ".snapshot_manifest.json"
+CURRENT_POINTER_FILE = "current.json"
+
+
+def _sha256_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Returns the hex sha256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _write_json_atomic(path: str, data) -> None:
+    """Writes JSON to a temporary file and renames it into place."""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=4)
+    os.replace(tmp_path, path)
+
+
+# --- Transports ---
+class HubTransport:
+    """Reads revisions, file listings and files from a Hugging Face Hub repository."""
+
+    def __init__(self, repo_id: str, repo_type: str = "dataset", token: Optional[str] = None):
+        self.repo_id = repo_id
+        self.repo_type = repo_type
+        self.token = token
+        self.api = HfApi(token=token)
+
+    def get_revision(self) -> str:
+        """Returns the commit hash the repository's default branch currently points to."""
+        return self.api.repo_info(self.repo_id, repo_type=self.repo_type).sha
+
+    def list_files(self, revision: str, path_prefix: str) -> Dict[str, str]:
+        """Maps each file under path_prefix to a content id (LFS sha256 or git blob id)."""
+        files = {}
+        entries = self.api.list_repo_tree(
+            self.repo_id,
+            path_in_repo=path_prefix,
+            recursive=True,
+            revision=revision,
+            repo_type=self.repo_type,
+        )
+        try:
+            for entry in entries:
+                if isinstance(entry, RepoFile):
+                    files[entry.path] = entry.lfs.sha256 if entry.lfs else entry.blob_id
+        except EntryNotFoundError:
+            return {} # Nothing published under path_prefix yet
+        return files
+
+    def download(self, revision: str, path_in_repo: str, dest_path: str) -> None:
+        """Downloads a single file of the given revision to dest_path."""
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(dest_path)) as staging_dir:
+            downloaded = hf_hub_download(
+                repo_id=self.repo_id,
+                filename=path_in_repo,
+                repo_type=self.repo_type,
+                revision=revision,
+                token=self.token,
+                local_dir=staging_dir,
+            )
+            os.replace(downloaded, dest_path)
+
+    def commit(self, additions: Dict[str, str], deletions: List[str], message: str, parent_revision: Optional[str] = None) -> None:
+        """
+        Uploads additions ({path_in_repo: local_path}) and deletes deletions as one commit.
+        With parent_revision, the commit fails if someone else pushed in the meantime.
+        """
+        operations = [CommitOperationAdd(path_in_repo=path_in_repo, path_or_fileobj=local_path) for path_in_repo, local_path in additions.items()]
+        operations += [CommitOperationDelete(path_in_repo=path_in_repo) for path_in_repo in deletions]
+        if not operations:
+            return
+        self.api.create_commit(
+            self.repo_id,
+            operations=operations,
+            commit_message=message,
+            repo_type=self.repo_type,
+            parent_commit=parent_revision,
+        )
+
+
+class LocalDirTransport:
+    """File-based stand-in for the Hub: serves a plain directory, with its revision derived from file contents."""
+
+    def __init__(self, root_dir: str):
+        self.root_dir = root_dir
+
+    def _list_all(self, path_prefix: str) -> Dict[str, str]:
+        files = {}
+        base = os.path.join(self.root_dir, path_prefix)
+        for dirpath, _, filenames in os.walk(base):
+            for filename in filenames:
+                full_path = os.path.join(dirpath, filename)
+                rel_path = os.path.relpath(full_path, self.root_dir).replace(os.sep, "/")
+                files[rel_path] = _sha256_file(full_path)
+        return files
+
+    def get_revision(self) -> str:
+        listing = json.dumps(sorted(self._list_all("").items()))
+        return hashlib.sha256(listing.encode("utf-8")).hexdigest()
+
+    def list_files(self, revision: str, path_prefix: str) -> Dict[str, str]:
+        return self._list_all(path_prefix)
+
+    def download(self, revision: str, path_in_repo: str, dest_path: str) -> None:
+        shutil.copyfile(os.path.join(self.root_dir, path_in_repo), dest_path)
+
+    def commit(self, additions: Dict[str, str], deletions: List[str], message: str, parent_revision: Optional[str] = None) -> None:
+        if parent_revision is not None and parent_revision != self.get_revision():
+            raise RuntimeError(f"{self.root_dir} changed since revision {parent_revision}")
+        for path_in_repo, local_path in additions.items():
+            dest_path = os.path.join(self.root_dir, path_in_repo)
+            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dest_path), suffix=".tmp")
+            os.close(fd)
+            shutil.copyfile(local_path, tmp_path)
+            os.replace(tmp_path, dest_path)
+        for path_in_repo in deletions:
+            path = os.path.join(self.root_dir, path_in_repo)
+            if os.path.exists(path):
+                os.remove(path)
+            # Drop directories the deletion left empty, like a git tree would
+            directory = os.path.dirname(path)
+            while os.path.abspath(directory) != os.path.abspath(self.root_dir) and os.path.isdir(directory) and not os.listdir(directory):
+                os.rmdir(directory)
+                directory = os.path.dirname(directory)
+
+
+# --- Snapshot Cache ---
+class SnapshotCache:
+    """
+    Local, revision-pinned copy of a directory of a remote repository.
+    sync() checks the remote revision once, reuses an up-to-date snapshot, and otherwise
+    downloads only the files whose content id changed since the last good snapshot.
+    In offline mode (or when the remote is unreachable) the last good snapshot is served.
+    """
+
+    def __init__(self, cache_dir: str, transport, path_prefix: str, offline: bool = False):
+        self.cache_dir = cache_dir
+        self.transport = transport
+        self.path_prefix = path_prefix.strip("/")
+        self.offline = offline
+        self.revision: Optional[str] = None
+
+    def _snapshot_dir(self, revision: str) -> str:
+        return os.path.join(self.cache_dir, SNAPSHOTS_SUBDIR, revision)
+
+    def _read_manifest(self, revision: str) -> Optional[Dict[str, str]]:
+        manifest_path = os.path.join(self._snapshot_dir(revision), SNAPSHOT_MANIFEST_FILE)
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def current_revision(self) -> Optional[str]:
+        """Returns the revision of the last good snapshot, if any."""
+        try:
+            with open(os.path.join(self.cache_dir, CURRENT_POINTER_FILE), "r", encoding="utf-8") as f:
+                revision = json.load(f).get("revision")
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if revision and self._read_manifest(revision) is not None:
+            return revision
+        return None
+
+    def local_path(self, revision: str) -> str:
+        """Local directory corresponding to path_prefix inside a snapshot."""
+        return os.path.join(self._snapshot_dir(revision), self.path_prefix)
+
+    def _serve_last_good(self, reason: str) -> str:
+        revision = self.current_revision()
+        if revision is None:
+            raise RuntimeError(f"{reason} and no local snapshot is available in {self.cache_dir}.")
+        print(f"{reason}. Serving last good snapshot at revision {revision}.")
+        self.revision = revision
+        return self.local_path(revision)
+
+    def sync(self) -> str:
+        """Ensures a complete local snapshot of the latest revision and returns its path_prefix directory."""
+        if self.offline:
+            return self._serve_last_good("Offline mode enabled")
+
+        try:
+            revision = self.transport.get_revision()
+        except Exception as e:
+            return self._serve_last_good(f"Could not check remote revision ({e})")
+
+        if self._read_manifest(revision) is not None:
+            print(f"Local snapshot is up to date at revision {revision}.")
+            self._set_current(revision)
+            return self.local_path(revision)
+
+        try:
+            self._build_snapshot(revision)
+        except Exception as e:
+            shutil.rmtree(self._snapshot_dir(revision), ignore_errors=True)
+            return self._serve_last_good(f"Could not download revision {revision} ({e})")
+
+        self._set_current(revision)
+        return self.local_path(revision)
+
+    def _build_snapshot(self, revision: str) -> None:
+        remote_files = self.transport.list_files(revision, self.path_prefix)
+        previous_revision = self.current_revision()
+        previous_manifest = self._read_manifest(previous_revision) if previous_revision else None
+        previous_manifest = previous_manifest or {}
+
+        snapshot_dir = self._snapshot_dir(revision)
+        reused, downloaded = 0, 0
+        for path_in_repo, file_id in remote_files.items():
+            dest_path = os.path.join(snapshot_dir, path_in_repo)
+            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+            previous_path = os.path.join(self._snapshot_dir(previous_revision), path_in_repo) if previous_revision else None
+            if previous_manifest.get(path_in_repo) == file_id and os.path.exists(previous_path):
+                # Unchanged since the last snapshot: hard-link (or copy) instead of downloading
+                try:
+                    os.link(previous_path, dest_path)
+                except OSError:
+                    shutil.copyfile(previous_path, dest_path)
+                reused += 1
+            else:
+                self.transport.download(revision, path_in_repo, dest_path)
+                downloaded += 1
+
+        # The manifest is written last, so a snapshot without one is treated as incomplete
+        _write_json_atomic(os.path.join(snapshot_dir, SNAPSHOT_MANIFEST_FILE), remote_files)
+        print(f"Snapshot for revision {revision}: downloaded {downloaded} changed files, reused {reused} unchanged files.")
+
+    def _set_current(self, revision: str) -> None:
+        current_revision = self.current_revision()
+        if current_revision == revision:
+            # Already current: keep the snapshot served before it, which may still be memory-mapped
+            try:
+                with open(os.path.join(self.cache_dir, CURRENT_POINTER_FILE), "r", encoding="utf-8") as f:
+                    previous_revision = json.load(f).get("previous")
+            except (FileNotFoundError, json.JSONDecodeError):
+                previous_revision = None
+        else:
+            previous_revision = current_revision
+        _write_json_atomic(os.path.join(self.cache_dir, CURRENT_POINTER_FILE), {"revision": revision, "previous": previous_revision})
+        self.revision = revision
+        self._prune(keep={revision, previous_revision})
+
+    def _prune(self, keep) -> None:
+        """Removes snapshots other than the ones in keep (the previous one may still be memory-mapped)."""
+        snapshots_root = os.path.join(self.cache_dir, SNAPSHOTS_SUBDIR)
+        if not os.path.isdir(snapshots_root):
+            return
+        for name in os.listdir(snapshots_root):
+            if name not in keep:
+                shutil.rmtree(os.path.join(snapshots_root, name), ignore_errors=True)
+
@@ -0,0 +1,375 @@
+import os
+import json
+import mmap
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.constants import DEFAULT_SIMILARITY_TOP_K
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+
+# --- Binary Store Layout ---
+# Written by ragdb/make_rag.py (streamed through MmapStoreWriter) and read by tools.py.
+# Every file can be memory-mapped, so several Streamlit workers share the same pages
+# and opening the store costs the same regardless of corpus size.
+MMAP_STORE_SUBDIR = "mmap_store"
+EMBEDDINGS_FILE = "embeddings.npy"      # float32 (n_nodes, dim), rows L2-normalised
+NODE_IDS_FILE = "node_ids.npy"          # fixed-width unicode (n_nodes,)
+NODES_BLOB_FILE = "nodes.bin"           # concatenated UTF-8 JSON records {"text", "metadata"}
+NODES_OFFSETS_FILE = "nodes_offsets.npy"  # int64 (n_nodes + 1,) byte offsets into nodes.bin
+STORE_META_FILE = "store_meta.json"
+STORE_FORMAT_VERSION = 1
+# Optional int8 scalar-quantized copy of embeddings.npy: code = round(value / scale * 127) per dimension.
+# Search scores the codes and rescores the best candidates from the float32 rows, so only the
+# int8 matrix (a quarter of the size) needs to stay resident.
+INT8_EMBEDDINGS_FILE = "embeddings_int8.npy"  # int8 (n_nodes, dim)
+INT8_SCALES_FILE = "embeddings_int8_scales.npy"  # float32 (dim,) max |value| per dimension
+# Candidates rescored at full precision = similarity_top_k * RESCORE_FACTOR
+RESCORE_FACTOR = 8
+# Rows converted to float32 at a time while scoring the codes: the batch (768 KiB at 768 dimensions)
+# stays in cache, where 16384-row batches made ~48 MiB of temporaries per query and ran 3x slower
+_INT8_SCORE_BATCH_ROWS = 256
+
+# Reciprocal rank fusion constant from Cormack et al. (2009)
+RRF_K = 60
+# Candidates taken from each ranked list before fusing in hybrid retrieval
+HYBRID_CANDIDATE_POOL = 20
+
+
+def _normalise_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalises each row so that a dot product equals cosine similarity."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def top_k_rows(scores: np.ndarray, k: int) -> np.ndarray:
+    """Returns the row indices of the k highest scores, best first."""
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < scores.shape[0]:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(scores.shape[0])
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def reciprocal_rank_fusion(ranked_lists: Sequence[Sequence[Tuple[int, float]]], top_k: int, k: int = RRF_K) -> List[Tuple[int, float]]:
+    """Fuses several best-first (row, score) lists by summing 1 / (k + rank) per row."""
+    fused: Dict[int, float] = {}
+    for ranked in ranked_lists:
+        for rank, (row, _) in enumerate(ranked, start=1):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+
+def quantize_int8(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-dimension int8 scalar quantization. Returns (codes, scales)."""
+    scales = np.abs(matrix).max(axis=0) if matrix.shape[0] else np.ones(matrix.shape[1], dtype=np.float32)
+    scales = np.where(scales == 0, 1.0, scales).astype(np.float32)
+    codes = np.clip(np.rint(matrix / scales * 127.0), -127, 127).astype(np.int8)
+    return codes, scales
+
+
+# --- Writing ---
+def iter_index_records(index) -> Iterable[Dict[str, Any]]:
+    """Yields {id, text, metadata, embedding} records from a VectorStoreIndex backed by SimpleVectorStore."""
+    embedding_dict = index.storage_context.vector_store.data.embedding_dict
+    for node_id, embedding in embedding_dict.items():
+        node = index.docstore.get_node(node_id, raise_error=False)
+        if node is None:
+            print(f"Warning: Node {node_id} has an embedding but is missing from the docstore. Skipping.")
+            continue
+        yield {
+            "id": node_id,
+            "text": node.get_content(),
+            "metadata": node.metadata,
+            "embedding": embedding,
+        }
+
+
+_FINALIZE_BATCH_ROWS = 16384
+
+
+class MmapStoreWriter:
+    """
+    Appends records ({id, text, metadata, embedding}) to the memory-mappable binary layout batch by
+    batch, so a store can be written without holding the corpus in memory. Text goes straight to
+    nodes.bin and embeddings to a raw float32 spill file; close() normalises the spill file into
+    embeddings.npy and writes the int8 copy, both in row batches.
+    """
+
+    def __init__(self, output_dir: str, embed_model_name: Optional[str] = None):
+        self.output_dir = output_dir
+        self.embed_model_name = embed_model_name
+        os.makedirs(output_dir, exist_ok=True)
+        self.node_ids: List[str] = []
+        self.offsets: List[int] = [0]
+        self.dim: Optional[int] = None
+        self._blob = open(os.path.join(output_dir, NODES_BLOB_FILE), "wb")
+        self._spill_path = os.path.join(output_dir, EMBEDDINGS_FILE + ".f32.tmp")
+        self._spill = open(self._spill_path, "wb")
+
+    def __len__(self) -> int:
+        return len(self.node_ids)
+
+    def append(self, records: Iterable[Dict[str, Any]]) -> int:
+        """Writes a batch of records; returns how many were written."""
+        count = 0
+        for record in records:
+            embedding = np.asarray(record["embedding"], dtype=np.float32)
+            if self.dim is None:
+                self.dim = int(embedding.shape[0])
+            elif embedding.shape[0] != self.dim:
+                raise ValueError(f"Embedding of node {record['id']} has dimension {embedding.shape[0]}, expected {self.dim}")
+            payload = json.dumps(
+                {"text": record["text"], "metadata": record.get("metadata", {})},
+                ensure_ascii=False,
+            ).encode("utf-8")
+            self._blob.write(payload)
+            self._spill.write(embedding.tobytes())
+            self.offsets.append(self.offsets[-1] + len(payload))
+            self.node_ids.append(record["id"])
+            count += 1
+        return count
+
+    def close(self) -> int:
+        """Finishes every file of the layout. Returns the number of nodes written."""
+        self._blob.close()
+        self._spill.close()
+        node_count, dim = len(self.node_ids), self.dim or 0
+
+        if node_count:
+            raw = np.memmap(self._spill_path, dtype=np.float32, mode="r", shape=(node_count, dim))
+            matrix = np.lib.format.open_memmap(os.path.join(self.output_dir, EMBEDDINGS_FILE), mode="w+", dtype=np.float32, shape=(node_count, dim))
+            scales = np.zeros(dim, dtype=np.float32)
+            for start in range(0, node_count, _FINALIZE_BATCH_ROWS):
+                batch = _normalise_rows(np.asarray(raw[start:start + _FINALIZE_BATCH_ROWS]))
+                matrix[start:start + batch.shape[0]] = batch
+                scales = np.maximum(scales, np.abs(batch).max(axis=0))
+            matrix.flush()
+            del raw
+
+            # Same symmetric per-dimension quantization as quantize_int8, one batch at a time
+            scales = np.where(scales == 0, 1.0, scales).astype(np.float32)
+            codes = np.lib.format.open_memmap(os.path.join(self.output_dir, INT8_EMBEDDINGS_FILE), mode="w+", dtype=np.int8, shape=(node_count, dim))
+            for start in range(0, node_count, _FINALIZE_BATCH_ROWS):
+                batch = np.asarray(matrix[start:start + _FINALIZE_BATCH_ROWS])
+                codes[start:start + batch.shape[0]] = np.clip(np.rint(batch / scales * 127.0), -127, 127).astype(np.int8)
+            codes.flush()
+            del matrix, codes
+            np.save(os.path.join(self.output_dir, INT8_SCALES_FILE), scales)
+        else:
+            np.save(os.path.join(self.output_dir, EMBEDDINGS_FILE), np.zeros((0, 0), dtype=np.float32))
+        os.remove(self._spill_path)
+
+        np.save(os.path.join(self.output_dir, NODE_IDS_FILE), np.asarray(self.node_ids, dtype=str))
+        np.save(os.path.join(self.output_dir, NODES_OFFSETS_FILE), np.asarray(self.offsets, dtype=np.int64))
+        with open(os.path.join(self.output_dir, STORE_META_FILE), "w", encoding="utf-8") as f:
+            json.dump({
+                "format_version": STORE_FORMAT_VERSION,
+                "node_count": node_count,
+                "dim": dim,
+                "embed_model_name": self.embed_model_name,
+            }, f, indent=4)
+
+        print(f"Wrote memory-mapped store with {node_count} nodes to {self.output_dir}")
+        return node_count
+
+
+def write_mmap_store(records: Iterable[Dict[str, Any]], output_dir: str, embed_model_name: Optional[str] = None) -> int:
+    """
+    Writes records ({id, text, metadata, embedding}) to the memory-mappable binary layout.
+    Returns the number of nodes written.
+    """
+    writer = MmapStoreWriter(output_dir, embed_model_name=embed_model_name)
+    writer.append(records)
+    return writer.close()
+
+
+def iter_store_records(store_dir: str, rows: Optional[Iterable[int]] = None) -> Iterator[Dict[str, Any]]:
+    """Yields {id, text, metadata, embedding} records back from a written store, one row at a time."""
+    store = MmapVectorStore(store_dir)
+    try:
+        for row in (range(len(store)) if rows is None else rows):
+            record = store.get_record(row)
+            yield {
+                "id": str(store.node_ids[row]),
+                "text": record["text"],
+                "metadata": record.get("metadata", {}),
+                "embedding": np.asarray(store.embeddings[row]),
+            }
+    finally:
+        store.close()
+
+
+# --- Reading ---
+class Int8Embeddings:
+    """Memory-mapped int8 codes; scores every row on the codes, then rescores the best at full precision."""
+
+    def __init__(self, store_dir: str, rescore_factor: int = RESCORE_FACTOR):
+        self.codes = np.load(os.path.join(store_dir, INT8_EMBEDDINGS_FILE), mmap_mode="r")
+        self.scales = np.load(os.path.join(store_dir, INT8_SCALES_FILE))
+        self.rescore_factor = max(1, rescore_factor)
+
+    @classmethod
+    def exists(cls, store_dir: str) -> bool:
+        """Checks whether quantized embeddings are present in store_dir."""
+        return all(os.path.exists(os.path.join(store_dir, name)) for name in [INT8_EMBEDDINGS_FILE, INT8_SCALES_FILE])
+
+    def approximate_scores(self, query: np.ndarray) -> np.ndarray:
+        """Dot products of the query with the dequantized rows, computed in small batches through one float32 buffer."""
+        # (code * scale / 127) . query == code . (query * scale / 127)
+        scaled_query = (query * self.scales / 127.0).astype(np.float32)
+        scores = np.empty(self.codes.shape[0], dtype=np.float32)
+        # numpy has no BLAS kernel for integer matrices, so an int8 x int8 -> int32 product is slower than this
+        buffer = np.empty((_INT8_SCORE_BATCH_ROWS, self.codes.shape[1]), dtype=np.float32)
+        for start in range(0, self.codes.shape[0], _INT8_SCORE_BATCH_ROWS):
+            codes = self.codes[start:start + _INT8_SCORE_BATCH_ROWS]
+            batch = buffer[:codes.shape[0]]
+            np.copyto(batch, codes, casting="unsafe")
+            np.matmul(batch, scaled_query, out=scores[start:start + codes.shape[0]])
+        return scores
+
+    def search(self, embeddings: np.ndarray, query: np.ndarray, top_k: int) -> List[Tuple[int, float]]:
+        """Top-k (row, exact cosine) pairs: shortlist on the codes, rescore the shortlist from float32 rows."""
+        candidates = np.sort(top_k_rows(self.approximate_scores(query), top_k * self.rescore_factor))
+        exact_scores = embeddings[candidates] @ query
+        best = top_k_rows(exact_scores, top_k)
+        return [(int(candidates[i]), float(exact_scores[i])) for i in best]
+
+
+class MmapVectorStore:
+    """Read-only vector store over the binary layout, opened with mmap and searched with one matrix product."""
+
+    def __init__(self, store_dir: str, ann_index=None, quantized: bool = False, rescore_factor: int = RESCORE_FACTOR):
+        self.store_dir = store_dir
+        # Optional approximate index (e.g. rag_ann.IVFIndex); None means a full scan
+        self.ann_index = ann_index
+        # Full scans use the int8 codes plus full-precision rescoring when requested and available
+        self.int8 = Int8Embeddings(store_dir, rescore_factor) if quantized and Int8Embeddings.exists(store_dir) else None
+        with open(os.path.join(store_dir, STORE_META_FILE), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("format_version") != STORE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported memory-mapped store format: {self.meta.get('format_version')}")
+
+        self.embeddings = np.load(os.path.join(store_dir, EMBEDDINGS_FILE), mmap_mode="r")
+        self.node_ids = np.load(os.path.join(store_dir, NODE_IDS_FILE), mmap_mode="r")
+        self.offsets = np.load(os.path.join(store_dir, NODES_OFFSETS_FILE), mmap_mode="r")
+
+        blob_path = os.path.join(store_dir, NODES_BLOB_FILE)
+        self._blob = None
+        if os.path.getsize(blob_path) > 0:
+            with open(blob_path, "rb") as f:
+                self._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return int(self.node_ids.shape[0])
+
+    @classmethod
+    def exists(cls, store_dir: str) -> bool:
+        """Checks whether a complete binary store is present in store_dir."""
+        required = [STORE_META_FILE, EMBEDDINGS_FILE, NODE_IDS_FILE, NODES_BLOB_FILE, NODES_OFFSETS_FILE]
+        return all(os.path.exists(os.path.join(store_dir, name)) for name in required)
+
+    def query(
+        self,
+        query_embedding: List[float],
+        similarity_top_k: int = DEFAULT_SIMILARITY_TOP_K,
+        candidate_rows: Optional[np.ndarray] = None,
+    ) -> List[Tuple[int, float]]:
+        """
+        Returns (row, cosine similarity) pairs for the top-k rows, best first.
+        candidate_rows (sorted, e.g. from a metadata filter) restricts scoring to those rows.
+        """
+        if len(self) == 0:
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query_norm = np.linalg.norm(query)
+        if query_norm > 0:
+            query = query / query_norm
+        if candidate_rows is not None:
+            # Filtered queries score only their (usually small) subset, exactly
+            if candidate_rows.shape[0] == 0:
+                return []
+            scores = self.embeddings[candidate_rows] @ query
+            best = top_k_rows(scores, similarity_top_k)
+            return [(int(candidate_rows[i]), float(scores[i])) for i in best]
+        if self.ann_index is not None:
+            return self.ann_index.search(self.embeddings, query, similarity_top_k)
+        if self.int8 is not None:
+            return self.int8.search(self.embeddings, query, similarity_top_k)
+        scores = self.embeddings @ query
+        rows = top_k_rows(scores, similarity_top_k)
+        return [(int(row), float(scores[row])) for row in rows]
+
+    def get_record(self, row: int) -> Dict[str, Any]:
+        """Decodes the text and metadata stored for a row."""
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return json.loads(self._blob[start:end].decode("utf-8"))
+
+    def get_node(self, row: int) -> TextNode:
+        """Rebuilds a TextNode for a row."""
+        record = self.get_record(row)
+        return TextNode(id_=str(self.node_ids[row]), text=record["text"], metadata=record.get("metadata", {}))
+
+    def close(self):
+        if self._blob is not None:
+            self._blob.close()
+            self._blob = None
+
+
+class MmapRetriever(BaseRetriever):
+    """
+    LlamaIndex retriever over a MmapVectorStore, so it plugs into RetrieverQueryEngine.
+    If a lexical index (e.g. rag_bm25.BM25Index) is given, dense and lexical candidates
+    are fused with reciprocal rank fusion.
+    """
+
+    def __init__(
+        self,
+        store: MmapVectorStore,
+        embed_model: BaseEmbedding,
+        similarity_top_k: int = DEFAULT_SIMILARITY_TOP_K,
+        lexical_index=None,
+        candidate_pool: int = HYBRID_CANDIDATE_POOL,
+        candidate_rows: Optional[np.ndarray] = None,
+        **kwargs: Any,
+    ):
+        self._store = store
+        self._embed_model = embed_model
+        self._similarity_top_k = similarity_top_k
+        self._lexical_index = lexical_index
+        self._candidate_pool = max(candidate_pool, similarity_top_k)
+        self._candidate_rows = candidate_rows
+        super().__init__(**kwargs)
+
+    @property
+    def embed_model(self) -> BaseEmbedding:
+        return self._embed_model
+
+    def with_candidate_rows(self, candidate_rows: Optional[np.ndarray]) -> "MmapRetriever":
+        """Returns a retriever over the same store that only considers candidate_rows (None: all rows)."""
+        return MmapRetriever(
+            self._store,
+            self._embed_model,
+            similarity_top_k=self._similarity_top_k,
+            lexical_index=self._lexical_index,
+            candidate_pool=self._candidate_pool,
+            candidate_rows=candidate_rows,
+            callback_manager=self.callback_manager,
+        )
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        if query_bundle.embedding is None:
+            query_bundle.embedding = self._embed_model.get_agg_embedding_from_queries(query_bundle.embedding_strs)
+
+        if self._lexical_index is None:
+            results = self._store.query(query_bundle.embedding, self._similarity_top_k, self._candidate_rows)
+        else:
+            dense = self._store.query(query_bundle.embedding, self._candidate_pool, self._candidate_rows)
+            lexical = self._lexical_index.query(query_bundle.query_str, self._candidate_pool, self._candidate_rows)
+            results = reciprocal_rank_fusion([dense, lexical], self._similarity_top_k)
+        return [NodeWithScore(node=self._store.get_node(row), score=score) for row, score in results]
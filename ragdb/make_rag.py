@@ -1,18 +1,14 @@
 import os
+import sys
 import asyncio
 from urllib.parse import urlparse
 import re
-from llama_index.core import SimpleDirectoryReader, VectorStoreIndex, StorageContext
-from llama_index.core.node_parser import SentenceSplitter
-from llama_index.core.vector_stores import SimpleVectorStore
-from huggingface_hub import HfApi
-from llama_index.embeddings.google_genai import GoogleGenAIEmbedding
 from crawl4ai import AsyncWebCrawler, CrawlerRunConfig
-from crawl4ai.deep_crawling import BFSDeepCrawlStrategy
 from crawl4ai.content_scraping_strategy import LXMLWebScrapingStrategy
 from dotenv import load_dotenv
 import tempfile
 import shutil
+import time
 
 # Load environment variables from a .env file if it exists
 load_dotenv()
@@ -20,8 +16,35 @@ load_dotenv()
 # Determine project root based on the script's location
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 
+# Shared RAG storage modules (rag_store.py etc.) live in the project root
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+from rag_ann import ANN_MIN_NODES
+from embedding_backends import DEFAULT_EMBED_MODEL, canonical_embed_model_spec, create_embed_model
+from rag_index import CHUNK_SIZE, CHUNK_OVERLAP, build_query_indexes
+from rag_parse import DEFAULT_PARSE_WORKERS, relative_path_metadata
+from rag_dedupe import DEFAULT_MAX_DISTANCE, NearDuplicateFilter, simhash
+from rag_pipeline import DEFAULT_PIPELINE_BATCH_CHUNKS, chunk_key, iter_carried_over_records, stream_ingest
+from rag_store import MMAP_STORE_SUBDIR, MmapStoreWriter, MmapVectorStore
+from rag_manifest import IngestManifest, file_sha256
+from rag_snapshot import HubTransport
+from rag_shards import DEFAULT_SHARD_SIZE, ShardedSnapshotCache, publish_sharded_store
+from rag_profile import StageProfiler
+from rag_embed import DEFAULT_EMBED_BATCH_SIZE, DEFAULT_EMBED_CONCURRENCY, EmbeddingCheckpoint, EmbeddingStage
+from rag_crawl import (
+    DEFAULT_MAX_CONCURRENCY,
+    DEFAULT_PER_HOST_CONCURRENCY,
+    DEFAULT_PER_HOST_DELAY_SECONDS,
+    AsyncFileWriter,
+    ConditionalFetcher,
+    CrawlCache,
+    CrawledPage,
+    CrawlScheduler,
+    normalize_url,
+)
+
 # --- Configuration ---
-# Hugging Face dataset configuration for SimpleVectorStore persistence
+# Hugging Face dataset configuration for RAG index persistence
 HF_DATASET_ID = "gm42/esi_simplevector"
 # Subdirectory within the HF dataset where the vector store files will be saved
 HF_VECTOR_STORE_SUBDIR = "vector_store_data" 
@@ -32,8 +55,32 @@ if not os.getenv("HF_TOKEN"):
 
 print(f"Target Hugging Face Dataset for RAG persistence: {HF_DATASET_ID}/{HF_VECTOR_STORE_SUBDIR}")
 
-CHUNK_SIZE = 512
-CHUNK_OVERLAP = 20
+# Embedding model spec (see embedding_backends.py): a Google GenAI model name, or e.g.
+# "local:BAAI/bge-small-en-v1.5" to embed on the local CPU (EMBED_LOCAL_THREADS, EMBED_LOCAL_RUNTIME=onnx).
+# The spec is recorded in the index so queries are embedded with the same model.
+EMBED_MODEL = canonical_embed_model_spec(os.getenv("EMBED_MODEL", DEFAULT_EMBED_MODEL))
+
+# Build an IVF approximate nearest-neighbour index once the corpus reaches this many nodes
+ANN_MIN_NODES = int(os.getenv("ANN_MIN_NODES", ANN_MIN_NODES))
+ANN_NLIST = int(os.getenv("ANN_NLIST", "0")) or None # Default: about 4 * sqrt(node count)
+
+# Incremental ingestion: the previous index is taken from the dataset (via the local snapshot cache)
+# and only new or changed files are parsed and embedded. Set RAG_FULL_REBUILD=1 to re-embed everything.
+RAG_FULL_REBUILD = os.getenv("RAG_FULL_REBUILD", "").lower() in ("1", "true", "yes")
+RAG_CACHE_DIR = os.getenv("RAG_CACHE_DIR", os.path.join(PROJECT_ROOT, ".rag_cache"))
+# The index is published as content-addressed shards of this size; only shards that changed are uploaded
+STORE_SHARD_SIZE = int(os.getenv("STORE_SHARD_SIZE_MB", "0")) * 1024 * 1024 or DEFAULT_SHARD_SIZE
+# Chunks are embedded in batches of EMBED_BATCH_SIZE, at most EMBED_MAX_CONCURRENCY requests at once;
+# finished batches are checkpointed so a rerun after a quota error or crash resumes where it stopped
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", DEFAULT_EMBED_BATCH_SIZE))
+EMBED_MAX_CONCURRENCY = int(os.getenv("EMBED_MAX_CONCURRENCY", DEFAULT_EMBED_CONCURRENCY))
+EMBED_CHECKPOINT_PATH = os.getenv("EMBED_CHECKPOINT_PATH", os.path.join(RAG_CACHE_DIR, "embedding_checkpoint.sqlite3"))
+# Files are loaded and chunked in this many worker processes
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", DEFAULT_PARSE_WORKERS))
+# Chunks are streamed through parse -> embed -> store in batches of about this size, so memory use
+# does not grow with the corpus
+PIPELINE_BATCH_CHUNKS = int(os.getenv("PIPELINE_BATCH_CHUNKS", DEFAULT_PIPELINE_BATCH_CHUNKS))
+
 # Define the directory containing source documents for the RAG database relative to PROJECT_ROOT
 SOURCE_DATA_DIR_RELATIVE = os.path.join("ragdb", "source_data")
 SOURCE_DATA_DIR = os.path.join(PROJECT_ROOT, SOURCE_DATA_DIR_RELATIVE)
@@ -41,6 +88,36 @@ SOURCE_DATA_DIR = os.path.join(PROJECT_ROOT, SOURCE_DATA_DIR_RELATIVE)
 WEB_MARKDOWN_PATH_RELATIVE = os.path.join("ragdb", "web_markdown")
 WEB_MARKDOWN_PATH = os.path.join(PROJECT_ROOT, WEB_MARKDOWN_PATH_RELATIVE)
 
+# Near-duplicate scraped pages and chunks (shared navigation, footers, boilerplate) are dropped before
+# embedding; texts whose 64-bit SimHash fingerprints differ in at most RAG_DEDUPE_MAX_DISTANCE bits count
+# as duplicates. Set RAG_DEDUPE=0 to keep everything.
+# Of near-duplicate pages the one with the first URL is kept; the others are saved with this suffix, so
+# they are not ingested but are promoted back once the kept page changes or disappears. Dropped chunks
+# are recorded in the ingest manifest with the file they duplicated, see IngestManifest.plan().
+RAG_DEDUPE = os.getenv("RAG_DEDUPE", "1").lower() not in ("0", "false", "no")
+RAG_DEDUPE_MAX_DISTANCE = int(os.getenv("RAG_DEDUPE_MAX_DISTANCE", DEFAULT_MAX_DISTANCE))
+DUPLICATE_PAGE_SUFFIX = ".duplicate"
+
+# --- Crawl settings ---
+CRAWL_MAX_DEPTH = int(os.getenv("CRAWL_MAX_DEPTH", 1))
+CRAWL_MAX_PAGES_PER_SEED = int(os.getenv("CRAWL_MAX_PAGES_PER_SEED", 10))
+CRAWL_INCLUDE_EXTERNAL = False
+# Seeds are crawled in parallel; each host gets at most CRAWL_PER_HOST_CONCURRENCY requests
+# at a time, started at least CRAWL_PER_HOST_DELAY_SECONDS apart
+CRAWL_MAX_CONCURRENCY = int(os.getenv("CRAWL_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY))
+CRAWL_PER_HOST_CONCURRENCY = int(os.getenv("CRAWL_PER_HOST_CONCURRENCY", DEFAULT_PER_HOST_CONCURRENCY))
+CRAWL_PER_HOST_DELAY_SECONDS = float(os.getenv("CRAWL_PER_HOST_DELAY_SECONDS", DEFAULT_PER_HOST_DELAY_SECONDS))
+# Pages crawled before are revalidated with conditional requests (ETag / Last-Modified / body hash);
+# unchanged pages are neither rendered nor rewritten, so their files and embeddings stay as they are.
+# Set CRAWL_REVALIDATE=0 to render every page again.
+CRAWL_REVALIDATE = os.getenv("CRAWL_REVALIDATE", "1").lower() not in ("0", "false", "no")
+CRAWL_CACHE_PATH = os.getenv("CRAWL_CACHE_PATH", os.path.join(RAG_CACHE_DIR, "crawl_cache.sqlite3"))
+
+# --- Profiling ---
+# Every run ends with a table of wall time, CPU time, items, bytes and peak memory per stage
+# (crawl, scan, parse, chunk, embed, store, upload, ...); the same figures are written here as JSON
+RAG_PROFILE_PATH = os.getenv("RAG_PROFILE_PATH", os.path.join(RAG_CACHE_DIR, "ingest_profile.json"))
+
 # --- Add URLs to scrape ---
 WEBPAGES_FILE_RELATIVE = os.path.join('ragdb', 'webpages.txt')
 WEBPAGES_FILE = os.path.join(PROJECT_ROOT, WEBPAGES_FILE_RELATIVE)
@@ -77,8 +154,48 @@ def url_to_filename(url: str, max_length: int = 200) -> str:
     return f"{filename_base}.md"
 
 
-async def scrape_websites(urls, output_dir):
-    """Scrapes a list of URLs and saves the content as markdown files."""
+def settle_scraped_pages(output_dir: str, page_urls, keep_filenames, page_filter: NearDuplicateFilter = None):
+    """
+    Runs after the crawl, over every page it saved or found unchanged. Pages are compared in URL order,
+    so the same page survives whatever order the fetches finished in: a near-duplicate of an earlier
+    page is renamed to <file>.duplicate (not ingested), any other page is (re)stored as <file>.
+    Page files not in keep_filenames, left by pages this crawl no longer reached, are removed.
+    """
+    kept_files, duplicate_files = set(), set()
+    for url in sorted(set(page_urls), key=normalize_url):
+        path = os.path.join(output_dir, url_to_filename(url))
+        duplicate_path = path + DUPLICATE_PAGE_SUFFIX
+        # A page written by this crawl is the newest copy; otherwise it is still stored under its old name
+        current = path if os.path.exists(path) else duplicate_path if os.path.exists(duplicate_path) else None
+        if current is None:
+            continue
+        is_duplicate = False
+        if page_filter is not None:
+            with open(current, "r", encoding="utf-8") as f:
+                is_duplicate = page_filter.check(url, f.read()) is not None
+        target, other = (duplicate_path, path) if is_duplicate else (path, duplicate_path)
+        if current != target:
+            os.replace(current, target)
+        if os.path.exists(other):
+            os.remove(other)
+        (duplicate_files if is_duplicate else kept_files).add(os.path.basename(target))
+
+    removed = 0
+    for name in os.listdir(output_dir):
+        filename = name[:-len(DUPLICATE_PAGE_SUFFIX)] if name.endswith(DUPLICATE_PAGE_SUFFIX) else name
+        if filename.endswith(".md") and filename not in keep_filenames and os.path.isfile(os.path.join(output_dir, name)):
+            os.remove(os.path.join(output_dir, name))
+            removed += 1
+    print(f"Scraped pages: {len(kept_files)} kept, {len(duplicate_files)} set aside as near-duplicates, "
+          f"{removed} stale page files from earlier crawls removed.")
+
+
+async def scrape_websites(urls, output_dir, profiler: StageProfiler = None):
+    """
+    Deep-crawls all seed URLs concurrently and saves each page as markdown. With profiler, the crawl
+    is recorded as the "crawl" stage and page rendering as "crawl/render" (summed over concurrent fetches).
+    """
+    profiler = profiler or StageProfiler()
     print("Running web scraping...")
     os.makedirs(output_dir, exist_ok=True)
     print(f"Output directory for scraped markdown: {output_dir}")
@@ -88,67 +205,105 @@ async def scrape_websites(urls, output_dir):
         return
 
     print(f"Initializing crawler for deep scraping of {len(urls)} seed URLs...")
-    # Initialize the crawler once outside the loop
+    # One crawler (browser) is shared by all concurrent page fetches
     crawler = AsyncWebCrawler(should_markdown=True)
+    # Single-page fetches: the scheduler does the breadth-first expansion itself, across all seeds
+    page_config = CrawlerRunConfig(scraping_strategy=LXMLWebScrapingStrategy(), verbose=True)
+
+    async def fetch(url: str) -> CrawledPage:
+        render_start = time.perf_counter()
+        result = await crawler.arun(url=url, config=page_config)
+        links = [link.get("href") for link in (result.links or {}).get("internal", []) + (result.links or {}).get("external", []) if link.get("href")]
+        headers = {name.lower(): value for name, value in (getattr(result, "response_headers", None) or {}).items()}
+        page = CrawledPage(
+            url=result.url,
+            success=result.success,
+            markdown=str(result.markdown) if result.markdown else None,
+            links=links,
+            error=getattr(result, "error_message", None),
+            etag=headers.get("etag"),
+            last_modified=headers.get("last-modified"),
+        )
+        profiler.record("crawl/render", time.perf_counter() - render_start, items=1,
+                        bytes=len(page.markdown.encode("utf-8")) if page.markdown else 0)
+        return page
 
-    print("Starting deep web scraping...")
-    saved_count = 0
+    print(f"Starting deep web scraping (max_depth={CRAWL_MAX_DEPTH}, max_pages_per_seed={CRAWL_MAX_PAGES_PER_SEED}, "
+          f"concurrency={CRAWL_MAX_CONCURRENCY}, per_host={CRAWL_PER_HOST_CONCURRENCY}, delay={CRAWL_PER_HOST_DELAY_SECONDS}s)...")
+    start_time = time.perf_counter()
     failed_urls_details = []
-    MAX_DEPTH = 1
-    MAX_PAGES_PER_SEED = 10
-    INCLUDE_EXTERNAL = False
-
-    try:
-        for start_url in urls:
-            print(f"  Initiating deep crawl from: {start_url} (max_depth={MAX_DEPTH}, max_pages_per_seed={MAX_PAGES_PER_SEED})")
-            
-            config = CrawlerRunConfig(
-                deep_crawl_strategy=BFSDeepCrawlStrategy(
-                    max_depth=MAX_DEPTH,
-                    include_external=INCLUDE_EXTERNAL,
-                    max_pages=MAX_PAGES_PER_SEED
-                ),
-                scraping_strategy=LXMLWebScrapingStrategy(),
-                stream=True,
-                verbose=True
-            )
-
-            try:
-                async for result in await crawler.arun(url=start_url, config=config):
-                    current_page_url = result.url
-                    print(f"    Processing page from deep crawl: {current_page_url} (Origin: {start_url}, Depth: {result.metadata.get('depth', 'N/A')})")
-
-                    try:
-                        if result.success and result.markdown:
-                            filename = url_to_filename(current_page_url)
-                            filepath = os.path.join(output_dir, filename)
-                            try:
-                                with open(filepath, "w", encoding="utf-8") as f:
-                                    f.write(result.markdown)
-                                print(f"      Successfully scraped and saved: {current_page_url} to {filepath}")
-                                saved_count += 1
-                            except IOError as e:
-                                print(f"      Error writing file {filepath} for URL {current_page_url}: {e}")
-                                failed_urls_details.append({"url": current_page_url, "error": f"File write error: {e}"})
-                        elif result.success and not result.markdown:
-                            print(f"      Successfully processed URL: {current_page_url}, but no markdown content was returned.")
-                        else:
-                            error_message = result.error or "Unknown error during deep crawl of page"
-                            print(f"      Failed to scrape page {current_page_url} during deep crawl: {error_message}")
-                            failed_urls_details.append({"url": current_page_url, "error": error_message})
-                    except Exception as page_processing_e:
-                        print(f"      Error processing result for {current_page_url}: {page_processing_e}")
-                        failed_urls_details.append({"url": current_page_url, "error": f"Result processing error: {page_processing_e}"})
-            
-            except Exception as e:
-                print(f"    An error occurred while initiating or performing deep crawl for start URL {start_url}: {e}")
-                failed_urls_details.append({"url": start_url, "error": f"Deep crawl initiation/execution error: {str(e)}"})
-    finally:
-        if 'crawler' in locals() and hasattr(crawler, 'close'):
-            print("Closing crawler session...")
-            await crawler.close()
+    writer = AsyncFileWriter(output_dir)
+    page_filter = NearDuplicateFilter("page", max_distance=RAG_DEDUPE_MAX_DISTANCE) if RAG_DEDUPE else None
+    fetcher = None
+    if CRAWL_REVALIDATE:
+        fetcher = ConditionalFetcher(
+            fetch,
+            CrawlCache(CRAWL_CACHE_PATH),
+            is_saved=lambda final_url: any(
+                os.path.exists(os.path.join(output_dir, url_to_filename(final_url) + suffix)) for suffix in ("", DUPLICATE_PAGE_SUFFIX)
+            ),
+        )
+    unchanged_pages = 0
+    page_urls = [] # Pages saved or found unchanged by this crawl
+    keep_filenames = set() # Page files this crawl accounts for; failed pages keep what they had
+    scheduler = CrawlScheduler(
+        fetcher or fetch,
+        max_depth=CRAWL_MAX_DEPTH,
+        max_pages_per_seed=CRAWL_MAX_PAGES_PER_SEED,
+        include_external=CRAWL_INCLUDE_EXTERNAL,
+        max_concurrency=CRAWL_MAX_CONCURRENCY,
+        per_host_concurrency=CRAWL_PER_HOST_CONCURRENCY,
+        per_host_delay=CRAWL_PER_HOST_DELAY_SECONDS,
+    )
 
-    print(f"Deep scraping finished. Successfully saved {saved_count} pages from {len(urls)} seed URLs.")
+    def on_page(page: CrawledPage, seed: str, depth: int):
+        nonlocal unchanged_pages
+        keep_filenames.add(url_to_filename(page.url))
+        if page.unchanged:
+            # The saved file is still current; near-duplicates are settled after the crawl
+            unchanged_pages += 1
+            page_urls.append(page.url)
+            return
+        if page.success and page.markdown:
+            writer.submit(url_to_filename(page.url), page.markdown, page.url)
+            page_urls.append(page.url)
+        elif page.success:
+            print(f"      Successfully processed URL: {page.url}, but no markdown content was returned.")
+        else:
+            error_message = page.error or "Unknown error during deep crawl of page"
+            print(f"      Failed to scrape page {page.url}: {error_message}")
+            failed_urls_details.append({"url": page.url, "error": error_message})
+            if fetcher is not None:
+                # The page may have been saved under the URL it redirected to
+                entry = fetcher.cache.get(page.url)
+                if entry is not None:
+                    keep_filenames.add(url_to_filename(entry.final_url))
+
+    with profiler.stage("crawl") as crawl_stats:
+        try:
+            if hasattr(crawler, "start"):
+                await crawler.start()
+            await scheduler.run(urls, on_page)
+        finally:
+            await writer.close()
+            if fetcher is not None:
+                await fetcher.close()
+            if hasattr(crawler, 'close'):
+                print("Closing crawler session...")
+                await crawler.close()
+        crawl_stats.count(writer.written + unchanged_pages, writer.bytes_written)
+    with profiler.stage("crawl/dedupe") as stats:
+        settle_scraped_pages(output_dir, page_urls, keep_filenames, page_filter)
+        stats.count(len(page_urls))
+
+    failed_urls_details.extend(writer.failed)
+    print(f"Deep scraping finished in {time.perf_counter() - start_time:.1f}s. Successfully saved {writer.written} pages "
+          f"and kept {unchanged_pages} unchanged pages from {len(urls)} seed URLs across {len(scheduler.pages_by_host)} hosts "
+          f"({scheduler.duplicates_skipped} duplicate links skipped).")
+    if fetcher is not None:
+        print(fetcher.summary())
+    if page_filter is not None:
+        print(page_filter.summary())
     if failed_urls_details:
         print("Details for failed URLs:")
         for detail in failed_urls_details:
@@ -156,93 +311,183 @@ async def scrape_websites(urls, output_dir):
 
     print("Finished web scraping.")
 
+
+def get_relative_path_metadata(filename: str) -> dict:
+    """Generates metadata including the file path relative to PROJECT_ROOT."""
+    return relative_path_metadata(filename, PROJECT_ROOT)
+
+
+def list_source_files(input_dirs, required_exts) -> dict:
+    """Maps the file_path metadata of every source file (as SimpleDirectoryReader would load them) to its absolute path."""
+    source_files = {}
+    for input_dir in input_dirs:
+        if not os.path.exists(input_dir) or not os.listdir(input_dir):
+            print(f"Directory is empty or does not exist, skipping: {input_dir}")
+            continue
+        for root, dirs, files in os.walk(input_dir):
+            dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+            for name in sorted(files):
+                if name.startswith(".") or os.path.splitext(name)[1].lower() not in required_exts:
+                    continue
+                path = os.path.join(root, name)
+                source_files[get_relative_path_metadata(path)["file_path"]] = path
+    return source_files
+
+
+def find_previous_build(settings: dict):
+    """
+    Locates the currently published memory-mapped store and its ingest manifest in the snapshot cache.
+    Returns (mmap store dir, manifest), or (None, None) when there is no compatible previous build.
+    The snapshot is only read (rows are copied into the new store), never modified.
+    """
+    try:
+        cache = ShardedSnapshotCache(
+            cache_dir=RAG_CACHE_DIR,
+            transport=HubTransport(HF_DATASET_ID, repo_type="dataset", token=os.getenv("HF_TOKEN")),
+            path_prefix=HF_VECTOR_STORE_SUBDIR,
+        )
+        snapshot_dir = cache.sync()
+    except Exception as e:
+        print(f"Could not fetch the published index ({e}). Building from scratch.")
+        return None, None
+
+    manifest = IngestManifest.load(snapshot_dir)
+    if manifest is None:
+        print("Published index has no ingest manifest. Building from scratch.")
+        return None, None
+    if not manifest.matches(settings):
+        print(f"Published index was built with {manifest.settings}, now {settings}. Building from scratch.")
+        return None, None
+    mmap_store_dir = os.path.join(snapshot_dir, MMAP_STORE_SUBDIR)
+    if not MmapVectorStore.exists(mmap_store_dir):
+        print("Published index has no memory-mapped store. Building from scratch.")
+        return None, None
+    print(f"Found published index at revision {cache.revision} with {len(manifest.documents)} source files.")
+    return mmap_store_dir, manifest
+
+
+def seed_chunk_filter(chunk_filter: NearDuplicateFilter, records):
+    """Passes store records through unchanged, remembering each one's text as already kept."""
+    for record in records:
+        chunk_filter.add(simhash(record["text"]), chunk_key(record["metadata"].get("file_path", ""), record["id"]))
+        yield record
+
+
 # --- Main Script ---
-async def main():
+async def build_rag_database(profiler: StageProfiler):
     # --- Initialize Embedding Model ---
-    embedding_model = GoogleGenAIEmbedding(model_name="models/text-embedding-004")
+    with profiler.stage("embed_model_load"):
+        embedding_model = create_embed_model(EMBED_MODEL, local_batch_size=EMBED_BATCH_SIZE)
 
     print(f"Configuring RAG to persist to Hugging Face Dataset: {HF_DATASET_ID}, path in repo: {HF_VECTOR_STORE_SUBDIR}")
 
     # 1. Scrape websites
-    await scrape_websites(URLS_TO_SCRAPE, WEB_MARKDOWN_PATH)
+    await scrape_websites(URLS_TO_SCRAPE, WEB_MARKDOWN_PATH, profiler)
 
-    # 2. Load documents using SimpleDirectoryReader
-    print(f"Loading documents from {SOURCE_DATA_DIR_RELATIVE} and {WEB_MARKDOWN_PATH_RELATIVE}...")
+    # 2. Find source files and compare their content hashes with the previous build
+    print(f"Scanning {SOURCE_DATA_DIR_RELATIVE} and {WEB_MARKDOWN_PATH_RELATIVE} for source files...")
     os.makedirs(SOURCE_DATA_DIR, exist_ok=True)
     os.makedirs(WEB_MARKDOWN_PATH, exist_ok=True)
 
     input_dirs = [SOURCE_DATA_DIR, WEB_MARKDOWN_PATH]
     required_exts = [".pdf", ".txt", ".md", ".csv"]
+    with profiler.stage("scan_and_hash") as stats:
+        source_files = list_source_files(input_dirs, required_exts)
+        source_hashes = {file_path: file_sha256(path) for file_path, path in source_files.items()}
+        stats.count(len(source_files), sum(os.path.getsize(path) for path in source_files.values()))
+    print(f"Found {len(source_files)} source files.")
 
-    all_documents = []
-
-    def get_relative_path_metadata(filename: str) -> dict:
-        """Generates metadata including the file path relative to PROJECT_ROOT."""
-        try:
-            relative_path = os.path.relpath(filename, start=PROJECT_ROOT)
-            return {"file_path": relative_path}
-        except ValueError:
-            print(f"Warning: File {filename} is outside project root. Storing absolute path.")
-            return {"file_path": filename}
-        except Exception as e:
-            print(f"Error generating relative path for {filename}: {e}. Storing absolute path.")
-            return {"file_path": filename}
-
-
-    for input_dir in input_dirs:
-        if not os.path.exists(input_dir) or not os.listdir(input_dir):
-            print(f"Directory is empty or does not exist, skipping: {input_dir}")
-            continue
-        try:
-            reader = SimpleDirectoryReader(
-                input_dir=input_dir,
-                required_exts=required_exts,
-                recursive=True,
-                file_metadata=get_relative_path_metadata
-            )
-            docs = reader.load_data(show_progress=True)
-            if docs:
-                print(f"Loaded {len(docs)} documents from {input_dir}")
-                all_documents.extend(docs)
-            else:
-                 print(f"No documents with extensions {required_exts} found in {input_dir}")
-        except ValueError as e:
-            print(f"Warning: Error reading from directory {input_dir}: {e}")
-        except Exception as e:
-            print(f"Error loading documents from {input_dir}: {e}")
-
-
-    print(f"Total documents loaded: {len(all_documents)}")
-
-    if not all_documents:
+    if not source_files:
         print("No documents loaded. Exiting.")
         return
 
-    # 3. Initialize Text Splitter (Node Parser)
-    print(f"Initializing node parser (chunk_size={CHUNK_SIZE}, chunk_overlap={CHUNK_OVERLAP})...")
-    node_parser = SentenceSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    # Everything that decides what a stored embedding looks like; a change forces a full rebuild
+    # (which chunks were dropped as near-duplicates included)
+    settings = {"embed_model": EMBED_MODEL, "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP,
+                "dedupe_max_distance": RAG_DEDUPE_MAX_DISTANCE if RAG_DEDUPE else None}
+    with profiler.stage("previous_build_sync"):
+        previous_store_dir, manifest = (None, None) if RAG_FULL_REBUILD else find_previous_build(settings)
+    is_incremental = previous_store_dir is not None
+    if not is_incremental:
+        # 3. No usable previous build; every file counts as added
+        manifest = IngestManifest(settings)
+
+    plan = manifest.plan(source_hashes)
+    print(f"Ingest plan: {len(plan['added'])} added, {len(plan['changed'])} changed, "
+          f"{len(plan['removed'])} removed, {len(plan['unchanged'])} unchanged files "
+          f"({len(plan['dependent'])} more re-ingested because they dropped near-duplicates of changed or removed files).")
+    if is_incremental and not (plan["added"] or plan["changed"] or plan["removed"]):
+        print("Index is already up to date. Nothing to upload.")
+        return
 
-    # 4. Initialize SimpleVectorStore and Storage Context for local persistence
-    print("Initializing SimpleVectorStore for local persistence...")
-    vector_store = SimpleVectorStore()
-    
-    storage_context = StorageContext.from_defaults(vector_store=vector_store)
-
-    # 5. Create VectorStoreIndex (This performs parsing, embedding, and indexing)
-    print(f"Creating index for {len(all_documents)} documents... (This may take a while)")
-    index = VectorStoreIndex.from_documents(
-        all_documents,
-        storage_context=storage_context,
-        embed_model=embedding_model,
-        node_parser=node_parser,
-        show_progress=True,
-    )
+    # 4. Forget changed, removed and dependent files; their rows are simply not carried over
+    stale_files = plan["changed"] + plan["removed"] + plan["dependent"]
+    for file_path in stale_files:
+        manifest.forget(file_path)
 
-    # 6. Persist the index locally to a temporary directory
     local_persist_dir = tempfile.mkdtemp()
-    print(f"Persisting index locally to temporary directory: {local_persist_dir}...")
+    mmap_store_dir = os.path.join(local_persist_dir, MMAP_STORE_SUBDIR)
+    print(f"Writing index locally to temporary directory: {local_persist_dir}...")
     try:
-        index.storage_context.persist(persist_dir=local_persist_dir)
+        writer = MmapStoreWriter(mmap_store_dir, embed_model_name=EMBED_MODEL)
+        to_ingest = plan["added"] + plan["changed"] + plan["dependent"]
+        chunk_filter = NearDuplicateFilter("chunk", max_distance=RAG_DEDUPE_MAX_DISTANCE) if RAG_DEDUPE else None
+        checkpoint = EmbeddingCheckpoint(EMBED_CHECKPOINT_PATH)
+        if is_incremental:
+            carried_records = iter_carried_over_records(previous_store_dir, plan["unchanged"])
+            if chunk_filter is not None and to_ingest:
+                # New chunks that repeat a chunk already in the store are dropped as well
+                carried_records = seed_chunk_filter(chunk_filter, carried_records)
+            with profiler.stage("carry_over") as stats:
+                carried = writer.append(carried_records)
+                stats.count(carried)
+            print(f"Carried over {carried} nodes from {len(plan['unchanged'])} unchanged files; "
+                  f"dropped the nodes of {len(stale_files)} changed, removed or dependent files.")
+
+        # 5. Stream only the new and changed files through load -> split -> (dedupe) -> embed -> append
+        if to_ingest:
+            print(f"Streaming {len(to_ingest)} new or changed files through parsing ({PARSE_WORKERS} worker processes, "
+                  f"chunk_size={CHUNK_SIZE}, chunk_overlap={CHUNK_OVERLAP}) and embedding in batches of "
+                  f"{PIPELINE_BATCH_CHUNKS} chunks... (This may take a while)")
+            embedding_stage = EmbeddingStage(
+                embedding_model,
+                checkpoint=checkpoint,
+                batch_size=EMBED_BATCH_SIZE,
+                max_concurrency=EMBED_MAX_CONCURRENCY,
+            )
+            file_paths_by_path = {source_files[file_path]: file_path for file_path in to_ingest}
+
+            def on_file_done(path, node_ids, duplicates_of):
+                file_path = file_paths_by_path[path]
+                manifest.record(file_path, source_hashes[file_path], node_ids, duplicates_of)
+
+            with profiler.stage("ingest") as stats:
+                failed_paths = await stream_ingest(
+                    list(file_paths_by_path),
+                    PROJECT_ROOT,
+                    embedding_stage,
+                    writer,
+                    on_file_done=on_file_done,
+                    workers=PARSE_WORKERS,
+                    chunk_size=CHUNK_SIZE,
+                    chunk_overlap=CHUNK_OVERLAP,
+                    batch_chunks=PIPELINE_BATCH_CHUNKS,
+                    chunk_filter=chunk_filter,
+                    profiler=profiler,
+                )
+                stats.count(len(file_paths_by_path) - len(failed_paths))
+            # Files that failed to load stay out of the manifest, so the next run retries them
+            for path in failed_paths:
+                print(f"Warning: {file_paths_by_path[path]} could not be loaded; it will be retried on the next run.")
+
+        # 6. Finish the memory-mapped store used by tools.py at query time, plus a BM25 inverted
+        # index over the same rows for hybrid retrieval and the metadata bitsets that let filtered
+        # queries skip non-matching rows, and save the ingest manifest next to it
+        with profiler.stage("store_finalize") as stats:
+            stats.count(writer.close())
+        with profiler.stage("query_indexes"):
+            build_query_indexes(mmap_store_dir, ann_nlist=ANN_NLIST, ann_min_nodes=ANN_MIN_NODES)
+        manifest.save(local_persist_dir)
         print("Local persistence successful.")
 
         # 7. Upload the persisted data to Hugging Face Dataset
@@ -251,17 +496,24 @@ async def main():
         if not hf_token:
             print("Warning: HF_TOKEN not set. Upload to Hugging Face Hub will likely fail or use cached credentials.")
 
-        api = HfApi(token=hf_token)
-        api.upload_folder(
-            folder_path=local_persist_dir,
-            repo_id=HF_DATASET_ID,
-            path_in_repo=HF_VECTOR_STORE_SUBDIR,
-            repo_type="dataset",
-        )
+        with profiler.stage("upload") as stats:
+            publish_stats = publish_sharded_store(
+                local_persist_dir,
+                HubTransport(HF_DATASET_ID, repo_type="dataset", token=hf_token),
+                HF_VECTOR_STORE_SUBDIR,
+                shard_size=STORE_SHARD_SIZE,
+                message=f"Update RAG index ({len(manifest.documents)} source files)",
+            )
+            stats.count(publish_stats["uploaded_shards"], publish_stats["uploaded_bytes"])
         print(f"Successfully uploaded index to Hugging Face Dataset: {HF_DATASET_ID}/{HF_VECTOR_STORE_SUBDIR}")
+        # The published store now holds every vector (the next run carries them over from it), so the
+        # checkpoint would only grow with vectors of chunks that no longer exist
+        cleared = checkpoint.clear()
+        if cleared:
+            print(f"Cleared {cleared} vectors from the embedding checkpoint.")
 
     except Exception as e:
-        print(f"An error occurred during local persistence or upload: {e}")
+        print(f"An error occurred during ingestion, local persistence or upload: {e}")
     finally:
         if os.path.exists(local_persist_dir):
             print(f"Cleaning up temporary local persistence directory: {local_persist_dir}")
@@ -270,5 +522,18 @@ async def main():
     print("RAG database creation script finished.")
 
 
+async def main():
+    profiler = StageProfiler()
+    try:
+        await build_rag_database(profiler)
+    finally:
+        print("Ingestion profile:")
+        print(profiler.summary_table())
+        try:
+            profiler.write_json(RAG_PROFILE_PATH)
+        except OSError as e:
+            print(f"Could not write the profiling report to {RAG_PROFILE_PATH}: {e}")
+
+
 if __name__ == "__main__":
    asyncio.run(main())
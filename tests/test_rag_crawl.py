@@ -0,0 +1,218 @@
+"""
+Conditional revalidation of crawled pages (rag_crawl.ConditionalFetcher, CrawlCache) against the
+local fixture site of benchmarks/bench_crawl_cache.py.
+
+    python -m unittest discover tests
+"""
+import os
+import re
+import sys
+import time
+import sqlite3
+import asyncio
+import tempfile
+import unittest
+
+import httpx
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+for path in (PROJECT_ROOT, os.path.join(PROJECT_ROOT, "benchmarks")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from rag_crawl import ConditionalFetcher, CrawlCache, CrawlCacheEntry, CrawledPage
+from bench_crawl_cache import FixtureSite, crawl_once, url_filename
+
+# FixtureSite: page % 4 == 0 sends an ETag, 1 Last-Modified, 2 no validators, 3 a nonce in every body
+ETAG_PAGE, LAST_MODIFIED_PAGE, NO_VALIDATOR_PAGE, NONCE_PAGE = 4, 5, 6, 7
+
+
+class ConditionalFetcherTest(unittest.IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.site = FixtureSite(8)
+        cls.base_url = cls.site.serve()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.site.shutdown()
+
+    async def asyncSetUp(self):
+        self.site.versions = [0] * self.site.pages
+        self.site.responses = []
+        self.work_dir = tempfile.TemporaryDirectory()
+        self.cache = CrawlCache(os.path.join(self.work_dir.name, "crawl_cache.sqlite3"))
+        self.client = httpx.AsyncClient()
+        self.rendered = []
+        self.fetcher = ConditionalFetcher(self.render, self.cache)
+
+    async def asyncTearDown(self):
+        await self.fetcher.close()
+        await self.client.aclose()
+        self.work_dir.cleanup()
+
+    async def render(self, url):
+        """Stand-in for the headless browser: markdown is the text of the page without tags."""
+        self.rendered.append(url)
+        response = await self.client.get(url)
+        return CrawledPage(url=str(response.url), success=response.status_code == 200,
+                           markdown=re.sub(r"<[^>]+>", " ", response.text), links=re.findall(r'href="([^"]+)"', response.text),
+                           etag=response.headers.get("etag"), last_modified=response.headers.get("last-modified"))
+
+    def url(self, page):
+        return f"{self.base_url}/page/{page}"
+
+    async def fetch_twice(self, page):
+        """Crawls a page cold, then again; returns the second result and the statuses the server sent for it."""
+        first = await self.fetcher(self.url(page))
+        self.assertTrue(first.success)
+        self.assertFalse(first.unchanged)
+        responses_before = len(self.site.responses)
+        second = await self.fetcher(self.url(page))
+        return second, [status for _, status in self.site.responses[responses_before:]]
+
+    async def test_new_page_is_rendered_without_probe(self):
+        page = await self.fetcher(self.url(ETAG_PAGE))
+        self.assertIn("revision 0", page.markdown)
+        self.assertEqual(self.rendered, [self.url(ETAG_PAGE)])
+        self.assertEqual(len(self.site.responses), 1) # the render's own request only
+        self.assertEqual(self.fetcher.stats["probe_skipped"], 1)
+        self.assertIsNotNone(self.cache.get(self.url(ETAG_PAGE)).etag)
+
+    async def test_etag_page_answers_304(self):
+        page, statuses = await self.fetch_twice(ETAG_PAGE)
+        self.assertTrue(page.unchanged)
+        self.assertIsNone(page.markdown)
+        self.assertEqual(page.links, ['/page/0'])
+        self.assertEqual(statuses, [304])
+        self.assertEqual(len(self.rendered), 1)
+        self.assertEqual(self.fetcher.stats["not_modified"], 1)
+
+    async def test_last_modified_page_answers_304(self):
+        page, statuses = await self.fetch_twice(LAST_MODIFIED_PAGE)
+        self.assertTrue(page.unchanged)
+        self.assertEqual(statuses, [304])
+        self.assertEqual(len(self.rendered), 1)
+        self.assertIsNotNone(self.cache.get(self.url(LAST_MODIFIED_PAGE)).last_modified)
+
+    async def test_page_without_validators_is_unchanged_by_body_hash(self):
+        # The first crawl has no body hash (it comes from a probe), so the second renders and records it
+        await self.fetch_twice(NO_VALIDATOR_PAGE)
+        responses_before = len(self.site.responses)
+        page = await self.fetcher(self.url(NO_VALIDATOR_PAGE))
+        self.assertTrue(page.unchanged)
+        self.assertEqual([status for _, status in self.site.responses[responses_before:]], [200])
+        self.assertEqual(len(self.rendered), 2)
+        self.assertEqual(self.fetcher.stats["same_content"], 1)
+
+    async def test_changed_pages_are_rendered_again(self):
+        for page in (ETAG_PAGE, LAST_MODIFIED_PAGE):
+            await self.fetcher(self.url(page))
+        self.site.change(ETAG_PAGE)
+        self.site.change(LAST_MODIFIED_PAGE)
+        for page in (ETAG_PAGE, LAST_MODIFIED_PAGE):
+            result = await self.fetcher(self.url(page))
+            self.assertFalse(result.unchanged)
+            self.assertIn("revision 1", result.markdown)
+        self.assertEqual(len(self.rendered), 4)
+        # The probe's validators are cached, so the new version revalidates next time
+        page = await self.fetcher(self.url(ETAG_PAGE))
+        self.assertTrue(page.unchanged)
+
+    async def test_probe_is_dropped_for_pages_that_never_revalidate(self):
+        # As for NO_VALIDATOR_PAGE, the first probe records the body hash; the second finds it changed
+        await self.fetch_twice(NONCE_PAGE)
+        self.assertTrue(self.cache.get(self.url(NONCE_PAGE)).revalidate)
+        responses_before = len(self.site.responses)
+        page = await self.fetcher(self.url(NONCE_PAGE))
+        self.assertFalse(page.unchanged)
+        self.assertEqual(len(self.site.responses) - responses_before, 2) # probe, then render
+        self.assertFalse(self.cache.get(self.url(NONCE_PAGE)).revalidate)
+        responses_before = len(self.site.responses)
+        await self.fetcher(self.url(NONCE_PAGE))
+        self.assertEqual(len(self.site.responses) - responses_before, 1) # render only
+        self.assertEqual(len(self.rendered), 4)
+
+    async def test_missing_saved_page_is_rendered_without_probe(self):
+        await self.fetcher(self.url(ETAG_PAGE))
+        fetcher = ConditionalFetcher(self.render, self.cache, is_saved=lambda final_url: False)
+        try:
+            page = await fetcher(self.url(ETAG_PAGE))
+        finally:
+            await fetcher.close()
+        self.assertFalse(page.unchanged)
+        self.assertIsNotNone(page.markdown)
+        self.assertEqual(fetcher.stats["probe_skipped"], 1)
+
+
+class CrawlCacheMigrationTest(unittest.TestCase):
+
+    def test_old_schema_is_migrated(self):
+        with tempfile.TemporaryDirectory() as work_dir:
+            path = os.path.join(work_dir, "crawl_cache.sqlite3")
+            # Schema before markdown_sha256 and revalidate were added
+            conn = sqlite3.connect(path)
+            conn.execute(
+                "CREATE TABLE crawl_pages (url TEXT PRIMARY KEY, final_url TEXT NOT NULL, etag TEXT, last_modified TEXT, "
+                "content_sha256 TEXT, links TEXT NOT NULL, fetched_at REAL NOT NULL)"
+            )
+            conn.execute("INSERT INTO crawl_pages VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         ("https://example.org/a", "https://example.org/a", '"v1"', None, None, '["/b"]', 1.0))
+            conn.commit()
+            conn.close()
+
+            cache = CrawlCache(path)
+            entry = cache.get("https://example.org/a")
+            self.assertEqual(entry.etag, '"v1"')
+            self.assertEqual(entry.links, ["/b"])
+            self.assertIsNone(entry.markdown_sha256)
+            self.assertTrue(entry.revalidate)
+
+            cache.put(CrawlCacheEntry(url="https://example.org/a", final_url="https://example.org/a", etag='"v2"',
+                                      last_modified=None, content_sha256=None, links=[], fetched_at=2.0,
+                                      markdown_sha256="abc", revalidate=False))
+            entry = CrawlCache(path).get("https://example.org/a")
+            self.assertEqual((entry.etag, entry.markdown_sha256, entry.revalidate), ('"v2"', "abc", False))
+
+
+class RecrawlTest(unittest.TestCase):
+
+    def test_unchanged_site_is_not_rewritten(self):
+        site = FixtureSite(8)
+        base_url = site.serve()
+        try:
+            with tempfile.TemporaryDirectory() as work_dir:
+                output_dir = os.path.join(work_dir, "pages")
+                os.makedirs(output_dir)
+                cache_path = os.path.join(work_dir, "crawl_cache.sqlite3")
+                cold = asyncio.run(crawl_once(site, base_url, output_dir, cache_path, 0.0, use_cache=True))
+                self.assertEqual(cold["files_written"], 8)
+                self.assertEqual(cold["plain_gets"], 0)
+
+                old = time.time() - 3600
+                for name in os.listdir(output_dir):
+                    os.utime(os.path.join(output_dir, name), (old, old))
+                # The second crawl records body hashes, the third finds the nonce pages changed and renders them
+                asyncio.run(crawl_once(site, base_url, output_dir, cache_path, 0.0, use_cache=True))
+                for name in os.listdir(output_dir):
+                    os.utime(os.path.join(output_dir, name), (old, old))
+                again = asyncio.run(crawl_once(site, base_url, output_dir, cache_path, 0.0, use_cache=True))
+
+                nonce_pages = [page for page in range(8) if page % 4 == 3]
+                self.assertEqual(again["rendered"], len(nonce_pages))
+                self.assertEqual(again["files_written"], len(nonce_pages))
+                self.assertEqual(again["cache"]["not_modified"], 4)
+                self.assertEqual(again["cache"]["same_content"], 2)
+                for page in range(8):
+                    mtime = os.path.getmtime(os.path.join(output_dir, url_filename(f"{base_url}/page/{page}")))
+                    if page in nonce_pages:
+                        self.assertGreater(mtime, old)
+                    else:
+                        self.assertEqual(mtime, old)
+        finally:
+            site.shutdown()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+"""
+Resume from the checkpoint and adaptive concurrency of the batched embedding stage
+(rag_embed.EmbeddingStage) against the simulated provider of benchmarks/fake_embedding.py.
+
+    python -m unittest discover tests
+"""
+import os
+import sys
+import asyncio
+import tempfile
+import unittest
+
+import numpy as np
+from llama_index.core.schema import TextNode
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+for path in (PROJECT_ROOT, os.path.join(PROJECT_ROOT, "benchmarks")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from rag_embed import SUCCESSES_PER_CONCURRENCY_STEP, EmbeddingCheckpoint, EmbeddingStage
+from fake_embedding import RateLimitedEmbedding, hashing_embedding
+
+
+def make_nodes(count):
+    return [TextNode(text=f"Chunk {i} of the dissertation handbook, section {i % 7}.") for i in range(count)]
+
+
+class EmbeddingStageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory()
+        self.checkpoint = EmbeddingCheckpoint(os.path.join(self.work_dir.name, "embedding_checkpoint.sqlite3"))
+
+    def tearDown(self):
+        self.work_dir.cleanup()
+
+    def test_resume_embeds_only_unfinished_chunks(self):
+        # 40 chunks in batches of 4; the provider goes down after 3 requests
+        crashing = RateLimitedEmbedding(requests_per_second=1000, burst=1000, latency_s=0.01, fail_after_requests=3)
+        stage = EmbeddingStage(crashing, checkpoint=self.checkpoint, batch_size=4, max_concurrency=2)
+        with self.assertRaises(RuntimeError):
+            asyncio.run(stage.aembed_nodes(make_nodes(40)))
+        finished = stage.stats["embedded"]
+        self.assertEqual(finished, 12)
+
+        # Fresh nodes and a healthy provider, as after a restart
+        healthy = RateLimitedEmbedding(requests_per_second=1000, burst=1000, latency_s=0.01)
+        nodes = make_nodes(40)
+        resumed = EmbeddingStage(healthy, checkpoint=self.checkpoint, batch_size=4, max_concurrency=2)
+        asyncio.run(resumed.aembed_nodes(nodes))
+        self.assertEqual(resumed.stats["from_checkpoint"], finished)
+        self.assertEqual(resumed.stats["embedded"], 40 - finished)
+        self.assertEqual(healthy.requests, (40 - finished) // 4)
+        for node in nodes:
+            np.testing.assert_allclose(node.embedding, hashing_embedding(node.get_content()), rtol=1e-6)
+
+    def test_identical_chunks_are_embedded_once(self):
+        provider = RateLimitedEmbedding(requests_per_second=1000, burst=1000, latency_s=0.0)
+        nodes = make_nodes(5) + make_nodes(5)
+        stage = EmbeddingStage(provider, checkpoint=self.checkpoint, batch_size=8)
+        asyncio.run(stage.aembed_nodes(nodes))
+        self.assertEqual(stage.stats["embedded"], 5)
+        self.assertTrue(all(node.embedding is not None for node in nodes))
+
+    def test_rate_limit_halves_concurrency_and_retries(self):
+        # Four concurrent requests against a bucket of three: the fourth gets a 429
+        provider = RateLimitedEmbedding(requests_per_second=1000, burst=3, latency_s=0.02, retry_after_s=0.02)
+        nodes = make_nodes(80)
+        stage = EmbeddingStage(provider, batch_size=2, max_concurrency=4)
+        asyncio.run(stage.aembed_nodes(nodes))
+
+        self.assertTrue(all(node.embedding is not None for node in nodes))
+        self.assertEqual(stage.stats["embedded"], 80)
+        self.assertGreater(stage.stats["rate_limited"], 0)
+        log = provider.request_log
+        self.assertEqual(sum(1 for _, outcome in log if outcome == "ok"), 40) # every batch succeeded once
+        first_limited = next(i for i, (_, outcome) in enumerate(log) if outcome == "rate_limited")
+        self.assertEqual(log[first_limited][0], 4)
+
+        # Requests already started when the 429 arrived finish; new ones start only below the halved limit
+        after = log[first_limited + 1:]
+        started_after = next(i for i, (_, outcome) in enumerate(after) if outcome == "ok")
+        self.assertLessEqual(after[started_after][0], 2)
+        # ... and the limit grows back one request at a time, after a run of successes
+        regrown = next(i for i, (in_flight, outcome) in enumerate(after) if in_flight > 2 and outcome == "ok")
+        self.assertGreaterEqual(sum(1 for _, outcome in after[:regrown] if outcome == "ok"), SUCCESSES_PER_CONCURRENCY_STEP)
+
+
+class EmbeddingCheckpointTest(unittest.TestCase):
+
+    def test_clear_drops_every_vector(self):
+        with tempfile.TemporaryDirectory() as work_dir:
+            checkpoint = EmbeddingCheckpoint(os.path.join(work_dir, "embedding_checkpoint.sqlite3"))
+            checkpoint.put_many("hashing-256", {"a": [1.0, 0.0], "b": [0.0, 1.0]})
+            self.assertEqual(checkpoint.get_many(["a", "b", "c"]), {"a": [1.0, 0.0], "b": [0.0, 1.0]})
+            self.assertEqual(checkpoint.clear(), 2)
+            self.assertEqual(checkpoint.get_many(["a", "b"]), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
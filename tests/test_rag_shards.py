@@ -0,0 +1,188 @@
+"""
+Publishing the index as content-addressed shards and reassembling snapshots from them
+(rag_shards.publish_sharded_store, ShardedSnapshotCache), with LocalDirTransport as the Hub.
+
+    python -m unittest discover tests
+"""
+import os
+import sys
+import json
+import hashlib
+import tempfile
+import unittest
+
+import numpy as np
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from rag_snapshot import SNAPSHOTS_SUBDIR, LocalDirTransport
+from rag_shards import SHARDS_SUBDIR, STORE_MANIFEST_FILE, ShardedSnapshotCache, file_shard_sizes, publish_sharded_store
+
+PREFIX = "vector_store_data"
+SHARD_SIZE = 1024
+
+
+class RecordingTransport(LocalDirTransport):
+    """LocalDirTransport that records which files were downloaded and committed."""
+
+    def __init__(self, root_dir):
+        super().__init__(root_dir)
+        self.downloads = []
+        self.committed = []
+
+    def download(self, revision, path_in_repo, dest_path):
+        self.downloads.append(path_in_repo)
+        super().download(revision, path_in_repo, dest_path)
+
+    def commit(self, additions, deletions, message, parent_revision=None):
+        self.committed.append((sorted(additions), sorted(deletions)))
+        super().commit(additions, deletions, message, parent_revision)
+
+
+class ShardedStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory()
+        self.remote_dir = os.path.join(self.work_dir.name, "remote")
+        self.build_dir = os.path.join(self.work_dir.name, "build")
+        self.cache_dir = os.path.join(self.work_dir.name, "cache")
+        os.makedirs(os.path.join(self.build_dir, "mmap_store"))
+        os.makedirs(self.remote_dir)
+        self.rows = np.random.RandomState(0).bytes(40 * 1024)
+        self.write_build("mmap_store/nodes.bin", self.rows)
+        self.write_build("ingest_manifest.json", b"{}")
+        self.transport = RecordingTransport(self.remote_dir)
+        self.cache = ShardedSnapshotCache(self.cache_dir, self.transport, PREFIX)
+
+    def tearDown(self):
+        self.work_dir.cleanup()
+
+    def write_build(self, relative_path, data):
+        with open(os.path.join(self.build_dir, relative_path), "wb") as f:
+            f.write(data)
+
+    def read(self, directory, relative_path):
+        with open(os.path.join(directory, relative_path), "rb") as f:
+            return f.read()
+
+    def publish(self):
+        return publish_sharded_store(self.build_dir, self.transport, PREFIX, shard_size=SHARD_SIZE)
+
+    def downloaded_shards(self):
+        return [path for path in self.transport.downloads if f"/{SHARDS_SUBDIR}/" in path]
+
+    def assert_snapshot_matches_build(self, path):
+        for relative_path in ("mmap_store/nodes.bin", "ingest_manifest.json"):
+            self.assertEqual(self.read(path, relative_path), self.read(self.build_dir, relative_path))
+
+    def test_shard_sizes_cover_the_file(self):
+        path = os.path.join(self.build_dir, "mmap_store/nodes.bin")
+        sizes = file_shard_sizes(path, SHARD_SIZE)
+        self.assertEqual(sum(sizes), len(self.rows))
+        self.assertTrue(all(SHARD_SIZE // 4 <= size <= 4 * SHARD_SIZE for size in sizes[:-1]))
+        self.assertEqual(file_shard_sizes(os.path.join(self.build_dir, "ingest_manifest.json"), SHARD_SIZE), [2])
+
+    def test_publish_and_sync_round_trip(self):
+        # A leftover of the unsharded layout, which publishing deletes
+        os.makedirs(os.path.join(self.remote_dir, PREFIX))
+        with open(os.path.join(self.remote_dir, PREFIX, "docstore.json"), "w", encoding="utf-8") as f:
+            f.write("{}")
+        stats = self.publish()
+        self.assertGreater(stats["shards"], 20)
+        self.assertEqual(stats["uploaded_shards"], stats["shards"])
+        self.assertEqual(stats["deleted_files"], 1)
+        self.assert_snapshot_matches_build(self.cache.sync())
+        self.assertEqual(len(self.downloaded_shards()), stats["shards"])
+
+    def test_republishing_unchanged_store_uploads_nothing(self):
+        self.publish()
+        stats = self.publish()
+        self.assertEqual(stats["uploaded_shards"], 0)
+        self.assertEqual(stats["deleted_files"], 0)
+
+    def test_single_byte_edit_downloads_only_changed_shards(self):
+        first = self.publish()
+        self.cache.sync()
+        self.transport.downloads.clear()
+
+        edited = bytearray(self.rows)
+        edited[20 * 1024] ^= 0xFF
+        self.write_build("mmap_store/nodes.bin", bytes(edited))
+        second = self.publish()
+        self.assertGreaterEqual(second["uploaded_shards"], 1)
+        self.assertLessEqual(second["uploaded_shards"], 2)
+        self.assertEqual(second["shards"], first["shards"])
+
+        path = self.cache.sync()
+        self.assert_snapshot_matches_build(path)
+        uploaded = {path for path in self.transport.committed[-1][0] if f"/{SHARDS_SUBDIR}/" in path}
+        self.assertEqual(set(self.downloaded_shards()), uploaded)
+        self.assertIn(f"{PREFIX}/{STORE_MANIFEST_FILE}", self.transport.downloads)
+
+    def test_insertion_only_changes_nearby_shards(self):
+        self.publish()
+        self.cache.sync()
+        self.transport.downloads.clear()
+        self.write_build("mmap_store/nodes.bin", self.rows[:20 * 1024] + np.random.RandomState(1).bytes(300) + self.rows[20 * 1024:])
+        stats = self.publish()
+        self.assertLessEqual(stats["uploaded_shards"], 3)
+        self.assert_snapshot_matches_build(self.cache.sync())
+        self.assertLessEqual(len(self.downloaded_shards()), 3)
+
+    def test_corrupt_remote_shard_keeps_last_good_snapshot(self):
+        self.publish()
+        first_path = self.cache.sync()
+        first_revision = self.cache.revision
+        self.write_build("mmap_store/nodes.bin", self.rows[:-1] + b"\0")
+        self.publish()
+        # Damage the shard the edit produced
+        new_shard = next(path for path in self.transport.committed[-1][0] if f"/{SHARDS_SUBDIR}/" in path)
+        with open(os.path.join(self.remote_dir, new_shard), "r+b") as f:
+            f.write(b"corrupt")
+        new_revision = self.transport.get_revision()
+
+        self.assertEqual(self.cache.sync(), first_path)
+        self.assertEqual(self.cache.current_revision(), first_revision)
+        self.assertNotIn(new_revision, os.listdir(os.path.join(self.cache_dir, SNAPSHOTS_SUBDIR)))
+        self.assertEqual(self.read(first_path, "mmap_store/nodes.bin"), self.rows)
+
+    def test_corrupt_previous_snapshot_is_not_reused(self):
+        self.publish()
+        first_path = self.cache.sync()
+        # The local copy was truncated after it was synced
+        with open(os.path.join(first_path, "mmap_store/nodes.bin"), "r+b") as f:
+            f.truncate(10 * 1024)
+        self.write_build("ingest_manifest.json", b'{"changed": true}')
+        self.publish()
+        self.transport.downloads.clear()
+
+        path = self.cache.sync()
+        self.assert_snapshot_matches_build(path)
+        self.assertGreater(len(self.downloaded_shards()), 10)
+
+    def test_version_1_manifest_is_still_readable(self):
+        # Publish by hand as version 1 did: fixed-size shards and no shard_sizes in the manifest
+        files = {}
+        os.makedirs(os.path.join(self.remote_dir, PREFIX, SHARDS_SUBDIR))
+        for relative_path in ("ingest_manifest.json", "mmap_store/nodes.bin"):
+            data = self.read(self.build_dir, relative_path)
+            shards = []
+            for start in range(0, len(data), SHARD_SIZE):
+                piece = data[start:start + SHARD_SIZE]
+                shards.append(hashlib.sha256(piece).hexdigest())
+                with open(os.path.join(self.remote_dir, PREFIX, SHARDS_SUBDIR, shards[-1]), "wb") as f:
+                    f.write(piece)
+            files[relative_path] = {"size": len(data), "shards": shards}
+        with open(os.path.join(self.remote_dir, PREFIX, STORE_MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "shard_size": SHARD_SIZE, "files": files}, f)
+        self.assert_snapshot_matches_build(self.cache.sync())
+
+        # The version 1 snapshot is a valid base for the next, version 2 one
+        self.write_build("ingest_manifest.json", b'{"changed": true}')
+        self.publish()
+        self.assert_snapshot_matches_build(self.cache.sync())
+
+if __name__ == "__main__":
+    unittest.main()
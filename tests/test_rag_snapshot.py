@@ -0,0 +1,168 @@
+"""
+Revision-pinned local snapshots of the RAG index (rag_snapshot.SnapshotCache), with a local
+directory standing in for the Hub (LocalDirTransport).
+
+    python -m unittest discover tests
+"""
+import os
+import sys
+import json
+import tempfile
+import unittest
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from rag_snapshot import CURRENT_POINTER_FILE, SNAPSHOT_MANIFEST_FILE, SNAPSHOTS_SUBDIR, LocalDirTransport, SnapshotCache
+
+PREFIX = "vector_store_data"
+
+
+class RecordingTransport(LocalDirTransport):
+    """LocalDirTransport that records downloads and can fail them or the revision check."""
+
+    def __init__(self, root_dir):
+        super().__init__(root_dir)
+        self.downloads = []
+        self.fail_download_of = None
+        self.unreachable = False
+
+    def get_revision(self):
+        if self.unreachable:
+            raise ConnectionError("remote unreachable")
+        return super().get_revision()
+
+    def download(self, revision, path_in_repo, dest_path):
+        if path_in_repo == self.fail_download_of:
+            # Leave a partial file behind, like an interrupted transfer
+            with open(dest_path, "wb") as f:
+                f.write(b"{")
+            raise ConnectionError(f"download of {path_in_repo} interrupted")
+        self.downloads.append(path_in_repo)
+        super().download(revision, path_in_repo, dest_path)
+
+
+class SnapshotCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.remote_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.transport = RecordingTransport(self.remote_dir.name)
+        self.cache = SnapshotCache(self.cache_dir.name, self.transport, PREFIX)
+        self.write_remote("docstore.json", "{}")
+        self.write_remote("index_store.json", "{}")
+
+    def tearDown(self):
+        self.remote_dir.cleanup()
+        self.cache_dir.cleanup()
+
+    def write_remote(self, name, content):
+        path = os.path.join(self.remote_dir.name, PREFIX, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+
+    def read_local(self, local_path, name):
+        with open(os.path.join(local_path, name), "r", encoding="utf-8") as f:
+            return f.read()
+
+    def snapshots(self):
+        return set(os.listdir(os.path.join(self.cache_dir.name, SNAPSHOTS_SUBDIR)))
+
+    def test_first_sync_downloads_everything(self):
+        path = self.cache.sync()
+        self.assertEqual(self.read_local(path, "docstore.json"), "{}")
+        self.assertEqual(sorted(self.transport.downloads), [f"{PREFIX}/docstore.json", f"{PREFIX}/index_store.json"])
+        self.assertEqual(self.cache.current_revision(), self.transport.get_revision())
+
+    def test_unchanged_remote_downloads_nothing(self):
+        path = self.cache.sync()
+        self.transport.downloads.clear()
+        self.assertEqual(self.cache.sync(), path)
+        self.assertEqual(self.transport.downloads, [])
+
+    def test_only_changed_files_are_downloaded(self):
+        first_path = self.cache.sync()
+        first_revision = self.cache.revision
+        self.transport.downloads.clear()
+        self.write_remote("docstore.json", '{"changed": true}')
+        second_path = self.cache.sync()
+        self.assertNotEqual(self.cache.revision, first_revision)
+        self.assertEqual(self.transport.downloads, [f"{PREFIX}/docstore.json"])
+        self.assertEqual(json.loads(self.read_local(second_path, "docstore.json")), {"changed": True})
+        # The previous snapshot is untouched
+        self.assertEqual(self.read_local(first_path, "docstore.json"), "{}")
+
+    def test_offline_serves_last_good_snapshot(self):
+        path = self.cache.sync()
+        offline = SnapshotCache(self.cache_dir.name, LocalDirTransport("/nonexistent"), PREFIX, offline=True)
+        self.assertEqual(offline.sync(), path)
+
+    def test_offline_without_snapshot_fails(self):
+        offline = SnapshotCache(self.cache_dir.name, self.transport, PREFIX, offline=True)
+        with self.assertRaises(RuntimeError):
+            offline.sync()
+
+    def test_unreachable_remote_serves_last_good_snapshot(self):
+        path = self.cache.sync()
+        self.write_remote("docstore.json", '{"changed": true}')
+        self.transport.unreachable = True
+        self.assertEqual(self.cache.sync(), path)
+
+    def test_interrupted_download_keeps_last_good_snapshot(self):
+        first_path = self.cache.sync()
+        first_revision = self.cache.revision
+        self.write_remote("docstore.json", '{"changed": true}')
+        new_revision = self.transport.get_revision()
+        self.transport.fail_download_of = f"{PREFIX}/docstore.json"
+        self.assertEqual(self.cache.sync(), first_path)
+        self.assertEqual(self.cache.current_revision(), first_revision)
+        # The partial snapshot is removed rather than left looking complete
+        self.assertNotIn(new_revision, self.snapshots())
+
+        self.transport.fail_download_of = None
+        path = self.cache.sync()
+        self.assertEqual(self.cache.revision, new_revision)
+        self.assertEqual(json.loads(self.read_local(path, "docstore.json")), {"changed": True})
+
+    def test_snapshot_without_manifest_is_rebuilt(self):
+        path = self.cache.sync()
+        revision = self.cache.revision
+        # A crash after the files were written but before the manifest: the snapshot is incomplete
+        os.remove(os.path.join(self.cache_dir.name, SNAPSHOTS_SUBDIR, revision, SNAPSHOT_MANIFEST_FILE))
+        with open(os.path.join(path, "docstore.json"), "w", encoding="utf-8") as f:
+            f.write("{")
+        self.assertIsNone(self.cache.current_revision())
+        self.transport.downloads.clear()
+        self.assertEqual(self.cache.sync(), path)
+        self.assertEqual(len(self.transport.downloads), 2)
+        self.assertEqual(self.read_local(path, "docstore.json"), "{}")
+
+    def test_corrupt_pointer_is_treated_as_no_snapshot(self):
+        self.cache.sync()
+        with open(os.path.join(self.cache_dir.name, CURRENT_POINTER_FILE), "w", encoding="utf-8") as f:
+            f.write('{"revision": ')
+        self.assertIsNone(self.cache.current_revision())
+        offline = SnapshotCache(self.cache_dir.name, self.transport, PREFIX, offline=True)
+        with self.assertRaises(RuntimeError):
+            offline.sync()
+        self.assertEqual(self.cache.sync(), self.cache.local_path(self.transport.get_revision()))
+
+    def test_prune_keeps_current_and_previous_revision(self):
+        revisions = []
+        for version in range(3):
+            self.write_remote("docstore.json", json.dumps({"version": version}))
+            self.cache.sync()
+            revisions.append(self.cache.revision)
+        self.assertEqual(self.snapshots(), {revisions[2], revisions[1]})
+
+        # Syncing again without a new revision keeps the previous snapshot, which workers may still map
+        self.cache.sync()
+        SnapshotCache(self.cache_dir.name, self.transport, PREFIX).sync()
+        self.assertEqual(self.snapshots(), {revisions[2], revisions[1]})
+        self.assertEqual(json.loads(self.read_local(self.cache.local_path(revisions[2]), "docstore.json")), {"version": 2})
+
+
+if __name__ == "__main__":
+    unittest.main()
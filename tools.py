@@ -1,5 +1,6 @@
 import os
 import json # Added for RAG source formatting
+from typing import Optional
 
 from llama_index.core.tools import FunctionTool
 from llama_index.readers.web import SimpleWebPageReader
@@ -9,8 +10,19 @@ from llama_index.tools.tavily_research import TavilyToolSpec
 from llama_index.tools.duckduckgo import DuckDuckGoSearchToolSpec
 from llama_index.core import VectorStoreIndex, StorageContext, load_index_from_storage
 from llama_index.core import Settings
+from llama_index.core.query_engine import RetrieverQueryEngine
+from llama_index.core.constants import DEFAULT_SIMILARITY_TOP_K
+from llama_index.core.schema import QueryBundle
 from llama_index.tools.code_interpreter import CodeInterpreterToolSpec
-from huggingface_hub import HfFileSystem
+from rag_store import MMAP_STORE_SUBDIR, RESCORE_FACTOR, MmapVectorStore, MmapRetriever
+from rag_bm25 import BM25Index
+from rag_ann import IVFIndex, DEFAULT_NPROBE
+from rag_filters import FACET_SOURCE_TYPE, FACET_DIRECTORY, FACET_DOMAIN, FACET_FILE, FACETS, MetadataIndex
+from rag_snapshot import HubTransport
+from rag_shards import ShardedSnapshotCache
+from embedding_backends import create_embed_model, embed_model_matches_spec
+from embedding_cache import CachedEmbedding, DEFAULT_MEMORY_CACHE_SIZE, DEFAULT_DISK_MAX_ENTRIES, DEFAULT_DISK_TTL_SECONDS
+from answer_cache import SemanticAnswerCache, DEFAULT_SIMILARITY_THRESHOLD, DEFAULT_TTL_SECONDS, DEFAULT_MAX_ENTRIES
 
 # --- Hugging Face RAG Configuration ---
 HF_DATASET_ID = "gm42/esi_simplevector"  # As used in make_rag.py
@@ -20,6 +32,43 @@ HF_VECTOR_STORE_SUBDIR = "vector_store_data" # As used in make_rag.py
 # For tools.py directly in the 'esi' project root, PROJECT_ROOT is the directory of tools.py
 PROJECT_ROOT = os.path.abspath(os.path.dirname(__file__))
 
+# Local, revision-pinned copy of the Hugging Face RAG index (see rag_snapshot.py and rag_shards.py)
+RAG_CACHE_DIR = os.getenv("RAG_CACHE_DIR", os.path.join(PROJECT_ROOT, ".rag_cache"))
+# Query embeddings of a model other than Settings.embed_model (see load_query_embed_model) use the same cache as agent.py
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(RAG_CACHE_DIR, "query_embeddings.sqlite3"))
+EMBEDDING_CACHE_MEMORY_SIZE = int(os.getenv("EMBEDDING_CACHE_MEMORY_SIZE", DEFAULT_MEMORY_CACHE_SIZE))
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", DEFAULT_DISK_MAX_ENTRIES))
+EMBEDDING_CACHE_TTL_SECONDS = float(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", DEFAULT_DISK_TTL_SECONDS))
+# Set RAG_OFFLINE=1 to skip the Hub entirely and serve the last good local snapshot
+RAG_OFFLINE = os.getenv("RAG_OFFLINE", "").lower() in ("1", "true", "yes")
+# Fuse BM25 and dense candidates (reciprocal rank fusion); set RAG_HYBRID_SEARCH=0 for dense only
+RAG_HYBRID_SEARCH = os.getenv("RAG_HYBRID_SEARCH", "1").lower() in ("1", "true", "yes")
+# Use the IVF approximate index when make_rag.py built one (large corpora only); RAG_ANN_NPROBE
+# clusters are scanned per query, higher is slower but closer to exact search
+RAG_ANN_SEARCH = os.getenv("RAG_ANN_SEARCH", "1").lower() in ("1", "true", "yes")
+RAG_ANN_NPROBE = int(os.getenv("RAG_ANN_NPROBE", DEFAULT_NPROBE))
+# Scan int8-quantized embeddings and rescore the best RAG_RESCORE_FACTOR * top_k at full precision, so each
+# worker keeps the int8 codes resident instead of all of embeddings.npy (see benchmarks/bench_quantization_recall.py);
+# set RAG_QUANTIZED_SEARCH=0 to scan the float32 rows exactly
+RAG_QUANTIZED_SEARCH = os.getenv("RAG_QUANTIZED_SEARCH", "1").lower() in ("1", "true", "yes")
+RAG_RESCORE_FACTOR = int(os.getenv("RAG_RESCORE_FACTOR", RESCORE_FACTOR))
+# Number of chunks returned by the RAG retriever
+RAG_SIMILARITY_TOP_K = int(os.getenv("RAG_SIMILARITY_TOP_K", DEFAULT_SIMILARITY_TOP_K))
+# "retrieve": return ranked chunks and let the agent synthesize (one LLM round trip per lookup)
+# "answer": synthesize an answer with Settings.llm inside the tool, as before
+RAG_RESPONSE_MODE_RETRIEVE = "retrieve"
+RAG_RESPONSE_MODE_ANSWER = "answer"
+RAG_RESPONSE_MODE = os.getenv("RAG_RESPONSE_MODE", RAG_RESPONSE_MODE_RETRIEVE).lower()
+RAG_SOURCE_MARKER_PREFIX = "---RAG_SOURCE---" # Parsed by stui.py
+# Cross-session semantic cache of RAG tool outputs; set RAG_ANSWER_CACHE=0 to disable
+RAG_ANSWER_CACHE = os.getenv("RAG_ANSWER_CACHE", "1").lower() in ("1", "true", "yes")
+RAG_ANSWER_CACHE_PATH = os.getenv("RAG_ANSWER_CACHE_PATH", os.path.join(RAG_CACHE_DIR, "answer_cache.sqlite3"))
+RAG_ANSWER_CACHE_THRESHOLD = float(os.getenv("RAG_ANSWER_CACHE_THRESHOLD", DEFAULT_SIMILARITY_THRESHOLD))
+RAG_ANSWER_CACHE_TTL_SECONDS = float(os.getenv("RAG_ANSWER_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS))
+RAG_ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("RAG_ANSWER_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+# How many known values per metadata filter are listed in the RAG tool description
+RAG_FILTER_VALUES_IN_DESCRIPTION = int(os.getenv("RAG_FILTER_VALUES_IN_DESCRIPTION", 15))
+
 # Ensure API keys are set as environment variables
 # os.environ["TAVILY_API_KEY"] = "YOUR_TAVILY_API_KEY"
 # os.environ["GOOGLE_API_KEY"] = "YOUR_GOOGLE_API_KEY"
@@ -104,6 +153,243 @@ def get_web_scraper_tool_for_agent():
         print(f"Error initializing Web Scraper Tool: {e}")
         return []
 
+def _sync_rag_snapshot(hf_token):
+    """
+    Brings the local snapshot of the RAG index up to date with the dataset's current revision.
+    Returns (local_persist_dir, revision).
+    """
+    cache = ShardedSnapshotCache(
+        cache_dir=RAG_CACHE_DIR,
+        transport=HubTransport(HF_DATASET_ID, repo_type="dataset", token=hf_token),
+        path_prefix=HF_VECTOR_STORE_SUBDIR,
+        offline=RAG_OFFLINE,
+    )
+    local_persist_dir = cache.sync()
+    return local_persist_dir, cache.revision
+
+def load_query_embed_model(index_embed_model: Optional[str]):
+    """
+    Embedding model for queries against an index built with index_embed_model (the spec the index
+    records): Settings.embed_model if it is that model, otherwise the recorded model itself.
+    """
+    if not index_embed_model or embed_model_matches_spec(Settings.embed_model, index_embed_model):
+        return Settings.embed_model
+    print(f"Index was built with embedding model {index_embed_model}, configured is {Settings.embed_model.model_name}. "
+          f"Embedding RAG queries with {index_embed_model}.")
+    return CachedEmbedding(
+        create_embed_model(index_embed_model, api_key=os.getenv("GOOGLE_API_KEY")),
+        cache_path=EMBEDDING_CACHE_PATH,
+        memory_size=EMBEDDING_CACHE_MEMORY_SIZE,
+        disk_max_entries=EMBEDDING_CACHE_MAX_ENTRIES,
+        disk_ttl_seconds=EMBEDDING_CACHE_TTL_SECONDS,
+    )
+
+def load_rag_retriever(local_persist_dir: str):
+    """
+    Builds a retriever over a local copy of the RAG index.
+    Prefers the memory-mapped binary store and falls back to the JSON SimpleVectorStore.
+    """
+    # Prefer the memory-mapped binary store: pages are shared between worker processes
+    # and opening it does not parse every embedding into Python floats.
+    mmap_store_dir = os.path.join(local_persist_dir, MMAP_STORE_SUBDIR)
+    if MmapVectorStore.exists(mmap_store_dir):
+        ann_index = None
+        if RAG_ANN_SEARCH and IVFIndex.exists(mmap_store_dir):
+            ann_index = IVFIndex(mmap_store_dir, nprobe=RAG_ANN_NPROBE)
+            print(f"ANN search enabled: IVF index with {ann_index.meta['nlist']} lists, nprobe={ann_index.nprobe}.")
+        mmap_store = MmapVectorStore(
+            mmap_store_dir,
+            ann_index=ann_index,
+            quantized=RAG_QUANTIZED_SEARCH,
+            rescore_factor=RAG_RESCORE_FACTOR,
+        )
+        print(f"Opened memory-mapped store with {len(mmap_store)} nodes from {mmap_store_dir} (int8 scan: {mmap_store.int8 is not None})")
+        bm25_index = None
+        if RAG_HYBRID_SEARCH and BM25Index.exists(mmap_store_dir):
+            bm25_index = BM25Index(mmap_store_dir)
+            print(f"Hybrid search enabled with BM25 index over {bm25_index.meta['term_count']} terms.")
+        return MmapRetriever(
+            mmap_store,
+            embed_model=load_query_embed_model(mmap_store.meta.get("embed_model_name")),
+            similarity_top_k=RAG_SIMILARITY_TOP_K,
+            lexical_index=bm25_index,
+        )
+
+    print("No memory-mapped store in snapshot, loading JSON SimpleVectorStore...")
+    storage_context = StorageContext.from_defaults(persist_dir=local_persist_dir)
+
+    # SimpleVectorStore is loaded automatically within the storage context
+    # We need the embed_model to potentially reconstruct parts of the index if needed by LlamaIndex
+    index = load_index_from_storage(storage_context, embed_model=Settings.embed_model)
+    print(f"Successfully loaded index from local snapshot: {local_persist_dir}")
+    return index.as_retriever(similarity_top_k=RAG_SIMILARITY_TOP_K)
+
+def load_rag_metadata_index(local_persist_dir: str) -> Optional[MetadataIndex]:
+    """Opens the precomputed metadata filter index of the memory-mapped store, if the snapshot has one."""
+    mmap_store_dir = os.path.join(local_persist_dir, MMAP_STORE_SUBDIR)
+    if not MetadataIndex.exists(mmap_store_dir):
+        print("No metadata index in snapshot, RAG filters are disabled.")
+        return None
+    metadata_index = MetadataIndex(mmap_store_dir)
+    print(f"Metadata filters enabled over {metadata_index.node_count} nodes.")
+    return metadata_index
+
+def _describe_rag_filters(metadata_index: MetadataIndex) -> str:
+    """Lists the filter arguments and (some of) their known values for the tool description."""
+    parts = []
+    for facet in FACETS:
+        values = metadata_index.facet_values(facet)
+        shown = ", ".join(values[:RAG_FILTER_VALUES_IN_DESCRIPTION])
+        if len(values) > RAG_FILTER_VALUES_IN_DESCRIPTION:
+            shown += f", ... ({len(values)} in total)"
+        parts.append(f"'{facet}' (known values: {shown})")
+    return (
+        "Optionally narrow the search with the filter arguments " + "; ".join(parts) + ". "
+        "A filter matches every value containing it (case-insensitive) and filters are combined with AND; "
+        "leave them empty to search the whole knowledge base. "
+    )
+
+def _collect_rag_sources(source_nodes):
+    """
+    Builds the structured source payload for each retrieved node (None if the node has no usable source).
+    PDF sources get a citation_number that is unique per file within one call.
+    """
+    sources = []
+    citation_counter = 1
+    assigned_pdf_citations = {} # Maps file_path to citation_number for uniqueness within this call
+
+    for source_node in source_nodes or []:
+        metadata = source_node.node.metadata
+        node_text_snippet = source_node.node.get_text()[:100] # For context
+
+        if 'file_path' in metadata:
+            file_path = metadata['file_path']
+            file_name = os.path.basename(file_path)
+
+            if file_path not in assigned_pdf_citations:
+                assigned_pdf_citations[file_path] = citation_counter
+                citation_counter += 1
+            current_citation_number = assigned_pdf_citations[file_path]
+
+            sources.append({
+                "type": "pdf",
+                "name": file_name,
+                "path": file_path,
+                "snippet": node_text_snippet + "...",
+                "citation_number": current_citation_number # Add citation number
+            })
+        elif 'url' in metadata: # Check for 'url' for web sources
+            url = metadata['url']
+            title = metadata.get('title', url) # Use title if available, else URL
+            sources.append({"type": "web", "url": url, "title": title, "snippet": node_text_snippet + "..."})
+        else:
+            sources.append(None)
+    return sources
+
+def _format_retrieved_passages(source_nodes, sources) -> str:
+    """Formats ranked chunks (best first) with their source and citation number for the agent to synthesize."""
+    if not source_nodes:
+        return "No relevant passages were found in the knowledge base."
+
+    passages = [f"Retrieved {len(source_nodes)} passages from the knowledge base, most relevant first:"]
+    for rank, (source_node, source_data) in enumerate(zip(source_nodes, sources), start=1):
+        if source_data is None:
+            header = f"[Passage {rank}]"
+        elif source_data["type"] == "pdf":
+            header = f"[Passage {rank}] Source: {source_data['name']} (citation [{source_data['citation_number']}])"
+        else:
+            header = f"[Passage {rank}] Source: {source_data['title']} ({source_data['url']})"
+        passages.append(f"{header}\n{source_node.node.get_content().strip()}")
+    return "\n\n".join(passages)
+
+def create_rag_query_function(retriever, response_mode: str = RAG_RESPONSE_MODE, answer_cache=None, metadata_index=None):
+    """
+    Wraps a retriever in the function exposed to the agent as rag_dissertation_retriever.
+    In "answer" mode a query engine synthesizes an answer with Settings.llm inside the tool;
+    in "retrieve" mode the ranked chunks are returned directly and the agent does the only synthesis.
+    If a SemanticAnswerCache is given, near-identical unfiltered queries are answered from it.
+    With a MetadataIndex (and an MmapRetriever), the filter arguments restrict the rows that are scored.
+    """
+    if response_mode not in (RAG_RESPONSE_MODE_RETRIEVE, RAG_RESPONSE_MODE_ANSWER):
+        raise ValueError(f"Unknown RAG response mode: {response_mode}")
+
+    # The model the index was built with (see load_query_embed_model)
+    query_embed_model = retriever.embed_model if isinstance(retriever, MmapRetriever) else Settings.embed_model
+    query_engine = None
+    if response_mode == RAG_RESPONSE_MODE_ANSWER:
+        # Ensure Settings.llm is set globally
+        query_engine = RetrieverQueryEngine.from_args(retriever, llm=Settings.llm)
+
+    def execute_rag_query(
+        input: str,
+        source_type: Optional[str] = None,
+        directory: Optional[str] = None,
+        domain: Optional[str] = None,
+        file: Optional[str] = None,
+    ):
+        """Executes a query against the RAG index and returns the text response with source markers."""
+        try:
+            filters = {FACET_SOURCE_TYPE: source_type, FACET_DIRECTORY: directory, FACET_DOMAIN: domain, FACET_FILE: file}
+            filtered = any(filters.values())
+            active_retriever, active_query_engine = retriever, query_engine
+            if filtered:
+                if metadata_index is None or not isinstance(retriever, MmapRetriever):
+                    print(f"RAG filters {filters} ignored: no metadata index for this snapshot.")
+                    filtered = False
+                else:
+                    candidate_rows = metadata_index.candidate_rows(filters)
+                    print(f"RAG filters {filters} matched {len(candidate_rows)} of {metadata_index.node_count} nodes.")
+                    if len(candidate_rows) == 0:
+                        return "No passages in the knowledge base match the given filters."
+                    # A per-call retriever: the shared one may be used concurrently by other sessions
+                    active_retriever = retriever.with_candidate_rows(candidate_rows)
+                    if query_engine is not None:
+                        active_query_engine = RetrieverQueryEngine.from_args(active_retriever, llm=Settings.llm)
+
+            # Embed once: the same vector drives the answer cache lookup and retrieval
+            query_bundle = QueryBundle(query_str=input, embedding=query_embed_model.get_query_embedding(input))
+
+            if hasattr(query_embed_model, "stats"): # CachedEmbedding hit-rate counters
+                print(f"Query embedding cache: {query_embed_model.stats()}")
+
+            # Cache entries are keyed by the query alone, so filtered calls bypass the cache
+            use_answer_cache = answer_cache is not None and not filtered
+            if use_answer_cache:
+                cached_output = answer_cache.lookup(query_bundle.embedding)
+                if cached_output is not None:
+                    return cached_output
+
+            if active_query_engine is not None:
+                response_obj = active_query_engine.query(query_bundle)
+                source_nodes = response_obj.source_nodes
+                sources = _collect_rag_sources(source_nodes)
+                text_response = str(response_obj.response) # The LLM-generated text summary
+            else:
+                source_nodes = active_retriever.retrieve(query_bundle)
+                sources = _collect_rag_sources(source_nodes)
+                text_response = _format_retrieved_passages(source_nodes, sources)
+
+            sources_info_parts = [
+                f"{RAG_SOURCE_MARKER_PREFIX}{json.dumps(source_data)}"
+                for source_data in sources if source_data is not None
+            ]
+
+            # Append source markers to the text response
+            if sources_info_parts:
+                output = text_response + "\n" + "\n".join(sources_info_parts)
+            else:
+                output = text_response
+
+            if use_answer_cache and source_nodes:
+                answer_cache.store(input, query_bundle.embedding, output)
+            return output
+
+        except Exception as e:
+            print(f"Error during RAG query execution: {e}")
+            return f"Error querying the knowledge base: {e}"
+
+    return execute_rag_query
+
 def get_rag_tool_for_agent():
     """Initializes the RAG query tool by loading the SimpleVectorStore from Hugging Face Hub."""
     
@@ -111,12 +397,9 @@ def get_rag_tool_for_agent():
     print(f"Attempting to load RAG index from Hugging Face Hub: {hf_persist_path}")
 
     try:
-        # Initialize HfFileSystem
         hf_token = os.getenv("HF_TOKEN")
         if not hf_token:
             print("Warning: HF_TOKEN environment variable not set. Make sure you are logged in via `huggingface-cli login` or have set HF_TOKEN for read access to the Hugging Face Dataset.")
-        
-        hf_fs = HfFileSystem(token=hf_token)
 
         # Ensure Settings.embed_model and Settings.llm are set globally before this
         if not Settings.embed_model:
@@ -126,71 +409,39 @@ def get_rag_tool_for_agent():
             print("Error: Settings.llm not configured. Cannot create RAG query engine.")
             raise ValueError("Settings.llm is not set.")
 
-        print("Loading index from Hugging Face storage...")
-        # StorageContext will use HfFileSystem to access the specified path
-        storage_context = StorageContext.from_defaults(persist_dir=hf_persist_path, fs=hf_fs)
-        
-        # SimpleVectorStore is loaded automatically within the storage context
-        # We need the embed_model to potentially reconstruct parts of the index if needed by LlamaIndex
-        index = load_index_from_storage(storage_context, embed_model=Settings.embed_model)
-        print(f"Successfully loaded index from Hugging Face Hub: {hf_persist_path}")
+        # Reuse the local snapshot when the dataset revision has not changed
+        local_persist_dir, rag_revision = _sync_rag_snapshot(hf_token)
+        print(f"Using local RAG snapshot at revision {rag_revision}: {local_persist_dir}")
+
+        retriever = load_rag_retriever(local_persist_dir)
+        metadata_index = load_rag_metadata_index(local_persist_dir) if isinstance(retriever, MmapRetriever) else None
+
+        answer_cache = None
+        if RAG_ANSWER_CACHE:
+            try:
+                # Namespaced by index revision, so a rebuilt index invalidates every cached answer
+                answer_cache = SemanticAnswerCache(
+                    RAG_ANSWER_CACHE_PATH,
+                    namespace=f"{rag_revision}:{RAG_RESPONSE_MODE}",
+                    similarity_threshold=RAG_ANSWER_CACHE_THRESHOLD,
+                    ttl_seconds=RAG_ANSWER_CACHE_TTL_SECONDS,
+                    max_entries=RAG_ANSWER_CACHE_MAX_ENTRIES,
+                )
+            except Exception as e:
+                print(f"Warning: Could not open semantic answer cache at {RAG_ANSWER_CACHE_PATH}: {e}")
+
+        execute_rag_query = create_rag_query_function(
+            retriever, RAG_RESPONSE_MODE, answer_cache=answer_cache, metadata_index=metadata_index
+        )
+        print(f"RAG query function created (response mode: {RAG_RESPONSE_MODE}).")
 
-        # Create a query engine from the loaded index
-        # Ensure Settings.llm is set globally
-        query_engine = index.as_query_engine(llm=Settings.llm)
-        print("RAG query engine created.")
-
-        # Define a simple function to wrap the query engine call
-        def execute_rag_query(input: str):
-                 """Executes a query against the RAG engine and returns the text response."""
-                 try:
-                     response_obj = query_engine.query(input)
-                     text_response = str(response_obj.response) # The LLM-generated text summary
-
-                     sources_info_parts = []
-                     citation_counter = 1
-                     assigned_pdf_citations = {} # Maps file_path to citation_number for uniqueness within this call
-
-                     if response_obj.source_nodes:
-                         for source_node in response_obj.source_nodes:
-                             metadata = source_node.node.metadata
-                             node_text_snippet = source_node.node.get_text()[:100] # For context
-
-                             if 'file_path' in metadata:
-                                 file_path = metadata['file_path']
-                                 file_name = os.path.basename(file_path)
-                                 
-                                 current_citation_number = None
-                                 if file_path not in assigned_pdf_citations:
-                                     assigned_pdf_citations[file_path] = citation_counter
-                                     current_citation_number = citation_counter
-                                     citation_counter += 1
-                                 else:
-                                     current_citation_number = assigned_pdf_citations[file_path]
-                                 
-                                 source_data = {
-                                     "type": "pdf", 
-                                     "name": file_name, 
-                                     "path": file_path, 
-                                     "snippet": node_text_snippet + "...",
-                                     "citation_number": current_citation_number # Add citation number
-                                 }
-                                 sources_info_parts.append(f"---RAG_SOURCE---{json.dumps(source_data)}")
-                             elif 'url' in metadata: # Check for 'url' for web sources
-                                 url = metadata['url']
-                                 title = metadata.get('title', url) # Use title if available, else URL
-                                 source_data = {"type": "web", "url": url, "title": title, "snippet": node_text_snippet + "..."}
-                                 sources_info_parts.append(f"---RAG_SOURCE---{json.dumps(source_data)}")
-
-                     # Append source markers to the text response
-                     if sources_info_parts:
-                         return text_response + "\n" + "\n".join(sources_info_parts)
-                     else:
-                         return text_response
-
-                 except Exception as e:
-                     print(f"Error during RAG query execution: {e}")
-                     return f"Error querying the knowledge base: {e}"
+        if RAG_RESPONSE_MODE == RAG_RESPONSE_MODE_ANSWER:
+            output_description = "The tool's output will include the textual answer and may be followed by structured references "
+        else:
+            output_description = (
+                "The tool's output is a ranked list of raw passages (most relevant first) that you must read and synthesize yourself, "
+                "followed by structured references "
+            )
 
         # Wrap the simple function with FunctionTool
         return FunctionTool.from_defaults(
@@ -199,13 +450,14 @@ def get_rag_tool_for_agent():
                  description=(
                     f"Retrieves relevant information from the dissertation knowledge base (persisted on Hugging Face at '{HF_DATASET_ID}/{HF_VECTOR_STORE_SUBDIR}'). "
                     "Use this for specific institutional knowledge or previously saved research. "
-                    "The tool's output will include the textual answer and may be followed by structured references "
+                    + output_description +
                     "(e.g., to PDF files or web URLs) using '---RAG_SOURCE---' markers. "
                     "For PDF sources, the structured reference will include a 'citation_number'. "
                     "When you use information from a PDF source in your response, you MUST append its citation number "
                     "in brackets (e.g., '[1]', '[2]') to the relevant sentence or claim. "
-                    "The query to the knowledge base should be provided as the 'input' string argument."
-                 ),
+                    "The query to the knowledge base should be provided as the 'input' string argument. "
+                    + (_describe_rag_filters(metadata_index) if metadata_index is not None else "")
+                 ).strip(),
              )
 
     except Exception as e: